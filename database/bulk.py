@@ -0,0 +1,365 @@
+import datetime
+
+from bson import ObjectId
+from mongoengine.errors import ValidationError
+from pymongo.errors import BulkWriteError
+
+from util.cache import responseCache, boardScope, BOARDS_SCOPE
+from util.helpers import validateURL
+from util.sharedCache import sharedCache
+from util.slugGenerator import generateSlug
+from util.trigramIndex import trigramIndex, itemText
+from . import reads
+from .model import Item, BoardSummary, Tombstone, User
+
+DEFAULT_CHUNK_SIZE = 500
+DUPLICATE_KEY = 11000
+# Fields a client may set on a new item, everything else is derived
+ITEM_INPUT_FIELDS = ('source', 'source_url', 'board', 'tags', 'bookmark_created')
+
+
+def row_error(row, board=None):
+    """[Why an input row cannot become an item, None when it can]
+
+    Arguments:
+        row {[dict]} -- [Item fields as a client sends them to POST /api/items]
+        board {[dict]} -- [Raw board the item goes to, when row['board'] is not used]
+
+    Returns:
+        [string]
+    """
+    if not isinstance(row, dict):
+        return "Not an object"
+    unknown = set(row) - set(ITEM_INPUT_FIELDS)
+    if unknown:
+        return "Unknown fields: %s" % ', '.join(sorted(unknown))
+    if not row.get('source') or not row.get('source_url') or not (board or row.get('board')):
+        return "source, source_url and board are required"
+    if board is None and not isinstance(row['board'], str):
+        return "board has to be a slug"
+    if not isinstance(row['source'], str) or not isinstance(row['source_url'], str):
+        return "source and source_url have to be strings"
+    tags = row.get('tags')
+    if tags is not None and not isinstance(tags, str) and \
+            not (isinstance(tags, list) and all(isinstance(tag, str) for tag in tags)):
+        return "tags have to be a list of strings or a comma separated string"
+    if row.get('bookmark_created') is not None and not isinstance(row['bookmark_created'], str):
+        return "bookmark_created has to be a string"
+    if validateURL(row['source_url']) is False:
+        return "Invalid source_url"
+    return None
+
+
+def item_document(row, board, user_id):
+    """[Raw document of a new item with every derived field filled in]
+
+    Building it is most of the cost of a bulk insert, so imports build
+    documents in the processes that parse the file, for UNBOUND_BOARD, and
+    bind_document puts them on their board afterwards.
+
+    Arguments:
+        row {[dict]} -- [Input row row_error accepted]
+        board {[dict]} -- [Raw board with its summary fields]
+        user_id {[ObjectId]} -- [Owner]
+
+    Raises:
+        ValidationError: [If a field is invalid]
+
+    Returns:
+        [SON]
+    """
+    item = Item(**{field: row[field] for field in ITEM_INPUT_FIELDS if field in row and field != 'board'})
+    item.board = board['_id']
+    item.board_summary = BoardSummary(**{field: board.get(field) for field in BoardSummary.FIELDS})
+    item.added_by = user_id
+    item.slug = generateSlug()
+    item.prepare()
+    item.validate()
+    return item.to_mongo()
+
+
+# Stand-in board of documents built before their board is known
+UNBOUND_BOARD = {'_id': ObjectId(b'\0' * 12)}
+
+
+def bind_document(document, board):
+    document['board'] = board['_id']
+    document['board_summary'] = BoardSummary(**{field: board.get(field) for field in BoardSummary.FIELDS}).to_mongo()
+    return document
+
+
+class ItemWriter:
+    """[Inserts a user's new items in chunks with unordered insert_many]
+
+    Boards are resolved once per distinct slug, duplicates of URLs the user
+    already saved are answered with the existing item, and the change
+    version, response caches and search index are brought up to date once per
+    chunk instead of once per item.
+
+        writer = ItemWriter(user_id)
+        for row in rows:
+            writer.add(row)
+        statuses = writer.close()
+    """
+
+    def __init__(self, user_id, chunk_size=DEFAULT_CHUNK_SIZE, keep_statuses=True):
+        """[Creates a writer]
+
+        Arguments:
+            user_id {[string]} -- [JWT identity]
+            chunk_size {[int]} -- [Items per insert_many]
+            keep_statuses {[bool]} -- [Whether to keep one status per row, imports only need the counts]
+        """
+        self.user_id = ObjectId(user_id)
+        self.chunk_size = chunk_size
+        self.keep_statuses = keep_statuses
+        self.boards = {}
+        self.statuses = []
+        self.rows = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.errors = 0
+        self.batch = None
+        self._batch_hashes = set()
+        self._pending = []
+
+    def add(self, row, board=None):
+        """[Queues one item, writing a chunk when enough are queued]
+
+        Arguments:
+            row {[dict]} -- [Item fields as a client sends them to POST /api/items]
+            board {[dict]} -- [Raw board to put the item on, instead of resolving row['board'] as a slug]
+        """
+        index = self._next()
+        error = row_error(row, board)
+        if error is not None:
+            return self._fail(index, error)
+        self._queue(index, row, board, None)
+
+    def add_document(self, document, board):
+        """[Queues an item document item_document built for UNBOUND_BOARD, to go on board]"""
+        self._queue(self._next(), None, board, document)
+
+    def add_error(self, message):
+        """[Counts a row that was rejected before it reached the writer]"""
+        self._fail(self._next(), message)
+
+    def mark(self, batch):
+        """[Stores batch as import_batch on the items inserted from now on]
+
+        A row hitting the unique index on an item of the same batch that this
+        writer did not insert is one an interrupted import already wrote, it
+        counts as inserted rather than as a duplicate.
+
+        Arguments:
+            batch {[ObjectId]} -- [Marker of the rows between two checkpoints of an import]
+        """
+        self.batch = batch
+        self._batch_hashes = set()
+
+    def close(self):
+        """[Writes what is still queued]
+
+        Returns:
+            [list] -- [One status per added row, in order]
+        """
+        self.flush()
+        return self.statuses
+
+    def flush(self):
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        self._resolve_boards({row['board'] for _, row, board, _ in pending if board is None})
+        documents = []
+        for index, row, board, document in pending:
+            board = board or self.boards.get(row['board'])
+            if board is None:
+                self._fail(index, "Board does not exist")
+                continue
+            if document is not None:
+                documents.append((index, bind_document(document, board), board))
+                continue
+            try:
+                documents.append((index, item_document(row, board, self.user_id), board))
+            except (ValidationError, TypeError, ValueError) as e:
+                self._fail(index, str(e))
+        if documents:
+            self._insert(documents)
+
+    def _next(self):
+        index = self.rows
+        self.rows += 1
+        if self.keep_statuses:
+            self.statuses.append(None)
+        return index
+
+    def _queue(self, index, row, board, document):
+        self._pending.append((index, row, board, document))
+        if len(self._pending) >= self.chunk_size:
+            self.flush()
+
+    def _resolve_boards(self, slugs):
+        slugs = [slug for slug in slugs if slug not in self.boards]
+        if slugs:
+            found = reads.boards().find({'added_by': self.user_id, 'slug': {'$in': slugs}},
+                                        reads.projection(('slug',) + BoardSummary.FIELDS))
+            self.boards.update((board['slug'], board) for board in found)
+
+    def _insert(self, documents):
+        failed = {}
+        if self.batch is not None:
+            for _, document, _ in documents:
+                document['import_batch'] = self.batch
+        try:
+            # insert_many sets the _id of every document before sending it
+            reads.items().insert_many([document for _, document, _ in documents], ordered=False)
+        except BulkWriteError as e:
+            failed = {error['index']: error for error in e.details['writeErrors']}
+        duplicates = [documents[position][1]['url_hash'] for position, error in failed.items()
+                      if error['code'] == DUPLICATE_KEY]
+        existing = {}
+        if duplicates:
+            existing = {item['url_hash']: item for item in reads.items().find(
+                {'added_by': self.user_id, 'url_hash': {'$in': duplicates}}, {'url_hash': 1, 'import_batch': 1})}
+        if self.batch is not None:
+            self._batch_hashes.update(document['url_hash'] for position, (_, document, _) in enumerate(documents)
+                                      if position not in failed)
+        created = []
+        for position, (index, document, board) in enumerate(documents):
+            error = failed.get(position)
+            if error is None:
+                created.append((document, board))
+                self._status(index, {'index': index, 'status': 'created', 'id': str(document['_id'])})
+            elif error['code'] == DUPLICATE_KEY and self._rewritten(existing.get(document['url_hash'])):
+                document['_id'] = existing[document['url_hash']]['_id']
+                # A second row of the batch with the same URL is a duplicate again
+                self._batch_hashes.add(document['url_hash'])
+                created.append((document, board))
+                self._status(index, {'index': index, 'status': 'created', 'id': str(document['_id'])})
+            elif error['code'] == DUPLICATE_KEY and document['url_hash'] in existing:
+                self.duplicates += 1
+                self._status(index, {'index': index, 'status': 'duplicate',
+                                     'id': str(existing[document['url_hash']]['_id'])})
+            else:
+                self._fail(index, error.get('errmsg', "Write failed"))
+        if created:
+            self.inserted += len(created)
+            User.bump_version(self.user_id)
+            responseCache.invalidate(self.user_id, BOARDS_SCOPE,
+                                     *{boardScope(board['slug']) for _, board in created})
+            trigramIndex.recordMany(self.user_id, [
+                (b'A', document['_id'], itemText(document.get('source'), document.get('source_url'),
+                                                 document.get('tags')))
+                for document, _ in created])
+
+    def _rewritten(self, item):
+        return item is not None and self.batch is not None and item.get('import_batch') == self.batch and \
+            item['url_hash'] not in self._batch_hashes
+
+    def _fail(self, index, message):
+        self.errors += 1
+        self._status(index, {'index': index, 'status': 'error', 'error': message})
+
+    def _status(self, index, status):
+        if self.keep_statuses:
+            self.statuses[index] = status
+
+
+def _changed(user_id):
+    User.bump_version(user_id)
+    # Bulk changes touch boards the caller does not know in advance, drop every cached response of the user
+    responseCache.invalidate(user_id)
+
+
+def move_items(user_id, query, board):
+    """[Moves the user's items matching query to board with one update_many]
+
+    Arguments:
+        user_id {[string]} -- [JWT identity]
+        query {[dict]} -- [Item filter, always scoped by added_by]
+        board {[dict]} -- [Raw target board with its summary fields]
+
+    Returns:
+        [UpdateResult]
+    """
+    summary = BoardSummary(**{field: board.get(field) for field in BoardSummary.FIELDS}).to_mongo()
+    result = reads.items().update_many(dict(query, added_by=ObjectId(user_id)), {'$set': {
+        'board': board['_id'], 'board_summary': summary, 'modified_at': datetime.datetime.now()}})
+    if result.modified_count:
+        _changed(user_id)
+    return result
+
+
+def retag_items(user_id, query, add=(), remove=()):
+    """[Adds and removes tags on the user's items matching query with one pipeline update_many]
+
+    Tags the item already has keep their order, new ones go after them.
+    Retagged items may no longer match query, they are found again for the
+    search index by the modified_at the update gave them all.
+
+    Returns:
+        [UpdateResult]
+    """
+    # $literal, a tag like $foo would otherwise be read as a field path
+    kept = {'$filter': {'input': reads.tags_expression(),
+                        'cond': {'$not': [{'$in': ['$$this', {'$literal': list(remove)}]}]}}}
+    added = {'$filter': {'input': {'$literal': list(dict.fromkeys(add))},
+                         'cond': {'$not': [{'$in': ['$$this', '$$kept']}]}}}
+    modified_at = datetime.datetime.now()
+    result = reads.items().update_many(dict(query, added_by=ObjectId(user_id)), [{'$set': {
+        'tags': {'$let': {'vars': {'kept': kept}, 'in': {'$concatArrays': ['$$kept', added]}}},
+        'modified_at': modified_at}}])
+    if result.modified_count:
+        _changed(user_id)
+        # Tags are part of the searchable text, read the rewritten items back for the trigram index
+        changed = reads.items().find({'added_by': ObjectId(user_id), 'modified_at': modified_at},
+                                     {'source': 1, 'source_url': 1, 'tags': 1})
+        trigramIndex.recordMany(user_id, [
+            (b'A', item['_id'], itemText(item.get('source'), item.get('source_url'), item.get('tags')))
+            for item in changed.batch_size(DEFAULT_CHUNK_SIZE)])
+    return result
+
+
+def delete_items(user_id, query):
+    """[Deletes the user's items matching query DEFAULT_CHUNK_SIZE at a time, leaving a tombstone for each]
+
+    The ids of a chunk are read first so the tombstones and search index name
+    exactly the deleted items; deleted items no longer match, so the next
+    find gives the next chunk.
+
+    Returns:
+        [tuple] -- [(matched, deleted)]
+    """
+    query = dict(query, added_by=ObjectId(user_id))
+    matched = deleted = 0
+    while True:
+        object_ids = [item['_id'] for item in reads.items().find(query, {'_id': 1}).limit(DEFAULT_CHUNK_SIZE)]
+        if not object_ids:
+            break
+        matched += len(object_ids)
+        deleted += reads.items().delete_many(dict(query, _id={'$in': object_ids})).deleted_count
+        Tombstone.record(user_id, 'item', object_ids)
+        trigramIndex.recordMany(user_id, [(b'D', object_id, '') for object_id in object_ids])
+    if matched:
+        _changed(user_id)
+    return matched, deleted
+
+
+def merge_boards(user_id, source, target):
+    """[Moves every item of board source onto board target and deletes source]
+
+    Arguments:
+        user_id {[string]} -- [JWT identity]
+        source {[dict]} -- [Raw board merged away]
+        target {[dict]} -- [Raw board kept, with its summary fields]
+
+    Returns:
+        [UpdateResult] -- [Of moving the items]
+    """
+    result = move_items(user_id, {'board': source['_id']}, target)
+    reads.boards().delete_one({'_id': source['_id'], 'added_by': ObjectId(user_id)})
+    Tombstone.record(user_id, 'board', [source['_id']])
+    sharedCache.delete(reads.board_key(user_id, source['slug']))
+    _changed(user_id)
+    return result
@@ -0,0 +1,50 @@
+import click
+
+from .migrations import migrate_tags_command, backfill_url_hashes_command, backfill_board_summaries_command
+from .model import User, Board, Item, RevokedTokenModel, Tombstone, ImportJob, UploadSession
+
+# Models whose meta declares the indexes the request paths rely on, auto_create_index is off for all of them
+INDEXED_MODELS = (User, Board, Item, RevokedTokenModel, Tombstone, ImportJob, UploadSession)
+
+
+@click.command('ensure-indexes')
+@click.option('--check', is_flag=True, help="Only report indexes missing from the database, build nothing.")
+def ensure_indexes_command(check):
+    """[Builds the declared indexes in the background and reports any still missing]
+
+    Run at deploy time so no request ever pays for an index build.
+    Exits with status 1 when an index is missing afterwards.
+    """
+    missing = 0
+    for model in INDEXED_MODELS:
+        collection = model._get_collection_name()
+        if not check:
+            click.echo("Ensuring indexes on %s" % collection)
+            model.ensure_indexes()
+        for index in _missing_indexes(model):
+            missing += 1
+            click.echo("Missing index on %s: %s" % (collection, index), err=True)
+    if missing:
+        raise SystemExit(1)
+    click.echo("All indexes present")
+
+
+def _shape(keys, weights=None):
+    # Text indexes are stored as _fts/_ftsx keys plus weights, compare them by prefix and text fields instead
+    prefix = tuple((key, direction) for key, direction in keys
+                   if direction != 'text' and key not in ('_fts', '_ftsx'))
+    text = sorted(weights or [key for key, direction in keys if direction == 'text'])
+    return prefix, tuple(text)
+
+
+def _missing_indexes(model):
+    indexes = model._get_collection().index_information().values()
+    existing = [_shape(info['key'], info.get('weights')) for info in indexes]
+    return [spec['fields'] for spec in model._meta['index_specs'] if _shape(spec['fields']) not in existing]
+
+
+def initialize_commands(app):
+    app.cli.add_command(ensure_indexes_command)
+    app.cli.add_command(migrate_tags_command)
+    app.cli.add_command(backfill_url_hashes_command)
+    app.cli.add_command(backfill_board_summaries_command)
@@ -0,0 +1,144 @@
+import datetime
+import time
+
+import click
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from util.helpers import splitTags, canonicalURL, urlHash
+from util.trigramIndex import trigramIndex
+from .model import Item, Board, BoardSummary, User, Tombstone
+from .reads import board_summary
+
+DEFAULT_BATCH_SIZE = 1000
+DUPLICATE_KEY = 11000
+
+
+@click.command('migrate-tags')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True, help="Items rewritten per bulk write.")
+@click.option('--pause', default=0.0, show_default=True, help="Seconds to sleep between batches to spare the primary.")
+def migrate_tags_command(batch_size, pause):
+    """[Rewrites item tags stored as one comma separated string into lists, while the app keeps serving]
+
+    Every update is conditional on the value that was read, so an item edited
+    while the migration runs keeps the edit. Only items whose tags are not a
+    list yet are visited, so an interrupted run simply resumes when rerun.
+    """
+    collection = Item._get_collection()
+    pending = {'tags': {'$not': {'$type': 'array'}}}
+    last_id = None
+    migrated = 0
+    while True:
+        query = pending if last_id is None else dict(pending, _id={'$gt': last_id})
+        batch = list(collection.find(query, {'tags': 1, 'added_by': 1}).sort('_id', 1).limit(batch_size))
+        if not batch:
+            break
+        now = datetime.datetime.now()
+        result = collection.bulk_write([
+            UpdateOne({'_id': item['_id'], 'tags': item.get('tags')},
+                      {'$set': {'tags': splitTags(item.get('tags')), 'modified_at': now}})
+            for item in batch
+        ], ordered=False)
+        # The stored shape changed, so cached representations and sync clients have to see it
+        for user_id in {item.get('added_by') for item in batch} - {None}:
+            User.bump_version(user_id)
+        migrated += result.modified_count
+        last_id = batch[-1]['_id']
+        click.echo("Migrated %d items" % migrated)
+        if pause:
+            time.sleep(pause)
+    click.echo("Tags migrated, %d items rewritten" % migrated)
+
+
+@click.command('backfill-url-hashes')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True, help="Items rewritten per bulk write.")
+@click.option('--delete-duplicates', is_flag=True, help="Delete the later copies of a URL a user saved twice.")
+def backfill_url_hashes_command(batch_size, delete_duplicates):
+    """[Sets the canonical URL and its hash on items saved before they existed]
+
+    The unique item_url index decides which copy of a URL keeps the hash, so
+    `flask ensure-indexes` has to run first. Later copies keep their canonical
+    URL but no hash and are reported, or deleted with --delete-duplicates.
+    """
+    collection = Item._get_collection()
+    if 'item_url' not in collection.index_information():
+        raise click.ClickException("The item_url index is missing, run `flask ensure-indexes` first")
+    pending = {'url_hash': {'$exists': False}, 'source_url': {'$type': 'string'}}
+    last_id = None
+    hashed = 0
+    duplicates = []
+    while True:
+        query = pending if last_id is None else dict(pending, _id={'$gt': last_id})
+        batch = list(collection.find(query, {'source_url': 1, 'added_by': 1}).sort('_id', 1).limit(batch_size))
+        if not batch:
+            break
+        requests = []
+        for item in batch:
+            url = canonicalURL(item['source_url'])
+            requests.append(UpdateOne({'_id': item['_id'], 'url_hash': {'$exists': False}},
+                                      {'$set': {'url': url, 'url_hash': urlHash(url)}}))
+        try:
+            # Unordered so one duplicate does not stop the batch, a replica set still applies it in _id order
+            hashed += collection.bulk_write(requests, ordered=False).modified_count
+        except BulkWriteError as e:
+            hashed += e.details['nModified']
+            for error in e.details['writeErrors']:
+                if error['code'] != DUPLICATE_KEY:
+                    raise
+                item = batch[error['index']]
+                collection.update_one({'_id': item['_id']}, {'$set': {'url': canonicalURL(item['source_url'])}})
+                duplicates.append(item)
+        last_id = batch[-1]['_id']
+        click.echo("Hashed %d items, %d duplicates" % (hashed, len(duplicates)))
+    if delete_duplicates and duplicates:
+        for user_id in {item['added_by'] for item in duplicates}:
+            object_ids = [item['_id'] for item in duplicates if item['added_by'] == user_id]
+            collection.delete_many({'_id': {'$in': object_ids}, 'added_by': user_id})
+            Tombstone.record(user_id, 'item', object_ids)
+            for object_id in object_ids:
+                trigramIndex.forget(user_id, object_id)
+            User.bump_version(user_id)
+        click.echo("Deleted %d duplicates" % len(duplicates))
+    elif duplicates:
+        click.echo("Left %d duplicates without a hash, rerun with --delete-duplicates to remove them" % len(duplicates))
+
+
+@click.command('backfill-board-summaries')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True, help="Items rewritten per bulk write.")
+@click.option('--pause', default=0.0, show_default=True, help="Seconds to sleep between batches to spare the primary.")
+def backfill_board_summaries_command(batch_size, pause):
+    """[Embeds the board summary in items saved before it existed, while the app keeps serving]
+
+    The boards of a batch are read with one find. Updates only apply to items
+    still without a summary, so one set by a concurrent move or board edit
+    wins, and an interrupted run simply resumes when rerun.
+    """
+    collection = Item._get_collection()
+    pending = {'board_summary': {'$exists': False}}
+    fields = dict.fromkeys(BoardSummary.FIELDS, 1)
+    last_id = None
+    filled = 0
+    while True:
+        query = pending if last_id is None else dict(pending, _id={'$gt': last_id})
+        batch = list(collection.find(query, {'board': 1, 'added_by': 1}).sort('_id', 1).limit(batch_size))
+        if not batch:
+            break
+        found = {board['_id']: board for board in Board._get_collection().find(
+            {'_id': {'$in': list({item.get('board') for item in batch} - {None})}}, fields)}
+        now = datetime.datetime.now()
+        requests = [
+            UpdateOne(dict(pending, _id=item['_id']),
+                      {'$set': {'board_summary': board_summary(found[item['board']]), 'modified_at': now}})
+            for item in batch if item.get('board') in found
+        ]
+        if requests:
+            result = collection.bulk_write(requests, ordered=False)
+            filled += result.modified_count
+            # modified_at moved, sync clients pick the items up again
+            for user_id in {item.get('added_by') for item in batch if item.get('board') in found} - {None}:
+                User.bump_version(user_id)
+        last_id = batch[-1]['_id']
+        click.echo("Filled in %d board summaries" % filled)
+        if pause:
+            time.sleep(pause)
+    click.echo("Board summaries backfilled, %d items rewritten" % filled)
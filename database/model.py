@@ -1,9 +1,12 @@
 from .db import db
 import datetime
+from bson import ObjectId
 from flask_bcrypt import generate_password_hash, check_password_hash
 from mongoengine.errors import FieldDoesNotExist, DoesNotExist
 from util.errors import TokenNotFound, InternalServerError
+from util.helpers import splitTags, canonicalURL, urlHash
 from util.slugGenerator import generateSlug
+from util.trigramIndex import trigramIndex, itemText
 
 
 class Board(db.Document):
@@ -17,32 +20,133 @@ class Board(db.Document):
     created_at = db.DateTimeField()
     modified_at = db.DateTimeField(default=datetime.datetime.now)
 
-    def save(self, *args, **kwargs):
+    meta = {
+        'indexes': [
+            {'fields': ('added_by', 'slug'), 'unique': True},
+            ('added_by', '-created_at', '-id'),
+            ('added_by', 'modified_at'),
+        ],
+        'auto_create_index': False,
+        'index_background': True,
+    }
+
+    def prepare(self):
+        """[Fills the derived fields, shared by save and the bookmark import in importers/pipeline.py]"""
         if not self.created_at:
             self.created_at = datetime.datetime.now()
         self.modified_at = datetime.datetime.now()
         self.slug = generateSlug()
+
+    def save(self, *args, **kwargs):
+        self.prepare()
         return super(Board, self).save(*args, **kwargs)
 
+    def sync_item_summaries(self):
+        """[Fans the current summary fields out to every item on the board in one update_many]
+
+        Returns:
+            [int] -- [Number of items rewritten]
+        """
+        summary = BoardSummary.of(self).to_mongo()
+        update = {'$set': {'board_summary': summary, 'modified_at': datetime.datetime.now()}}
+        return Item._get_collection().update_many({'board': self.id}, update).modified_count
+
+
+class BoardSummary(db.EmbeddedDocument):
+    """[Copy of the board fields shown next to an item, kept in sync by BoardApi.put]"""
+    title = db.StringField()
+    slug = db.StringField()
+    color = db.StringField()
+    symbol = db.StringField()
+
+    FIELDS = ('title', 'slug', 'color', 'symbol')
+
+    @classmethod
+    def of(cls, board):
+        return cls(**{field: getattr(board, field) for field in cls.FIELDS})
+
 
 class Item(db.Document):
     source = db.StringField(required=True)
     source_url = db.StringField(required=True)
-    tags = db.StringField()
+    # Canonical form of source_url and its hash, one item per user and URL
+    url = db.StringField()
+    url_hash = db.LongField()
+    tags = db.ListField(db.StringField())
     slug = db.StringField()
     bookmark_created = db.StringField()
     board = db.ReferenceField('Board', required=True)
+    board_summary = db.EmbeddedDocumentField(BoardSummary)
     added_by = db.ReferenceField('User')
     created_at = db.DateTimeField()
     modified_at = db.DateTimeField(default=datetime.datetime.now)
+    # checkpoint_id of the import job that inserted the item, how a resumed import tells its own rows from duplicates
+    import_batch = db.ObjectIdField()
 
-    def save(self, *args, **kwargs):
+    meta = {
+        'indexes': [
+            ('added_by', 'board', '-created_at', '-id'),
+            ('added_by', '-created_at', '-id'),
+            ('added_by', 'modified_at'),
+            # Multikey, one entry per tag, for ?tag= filters in created_at order
+            ('added_by', 'tags', '-created_at', '-id'),
+            # Partial, items saved before url_hash existed are left out until `flask backfill-url-hashes`
+            {'fields': ('added_by', 'url_hash'), 'unique': True, 'name': 'item_url',
+             'partialFilterExpression': {'url_hash': {'$exists': True}}},
+            ('board',),
+            # $text queries always carry the added_by equality, so the index only holds one user's terms per lookup
+            {'fields': ['added_by', '$source', '$source_url', '$tags'], 'name': 'item_search',
+             'weights': {'source': 10, 'tags': 5, 'source_url': 2}},
+        ],
+        'auto_create_index': False,
+        'index_background': True,
+    }
+
+    def prepare(self):
+        """[Fills the derived fields, shared by save and the bulk writer in database/bulk.py]"""
         if not self.created_at:
             self.created_at = datetime.datetime.now()
-        if not self.tags or self.tags is None:
-            self.tags = "Ba"
+        self.tags = splitTags(self.tags)
+        if self.source_url:
+            self.url = canonicalURL(self.source_url)
+            self.url_hash = urlHash(self.url)
+        if self.board_summary is None and isinstance(self.board, Board):
+            self.board_summary = BoardSummary.of(self.board)
         self.modified_at = datetime.datetime.now()
-        return super(Item, self).save(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        self.prepare()
+        saved = super(Item, self).save(*args, **kwargs)
+        self._index()
+        return saved
+
+    def update(self, **kwargs):
+        if 'tags' in kwargs:
+            kwargs['tags'] = splitTags(kwargs['tags'])
+        if kwargs.get('source_url'):
+            kwargs['url'] = canonicalURL(kwargs['source_url'])
+            kwargs['url_hash'] = urlHash(kwargs['url'])
+        updated = super(Item, self).update(**kwargs)
+        if {'source', 'source_url', 'tags'} & set(kwargs):
+            for field in ('source', 'source_url', 'tags'):
+                if field in kwargs:
+                    setattr(self, field, kwargs[field])
+            self._index()
+        return updated
+
+    def delete(self, *args, **kwargs):
+        deleted = super(Item, self).delete(*args, **kwargs)
+        trigramIndex.forget(self.owner_id, self.id)
+        return deleted
+
+    @property
+    def owner_id(self):
+        """[Id of added_by without dereferencing the user]"""
+        owner = self._data.get('added_by')
+        return getattr(owner, 'id', owner)
+
+    def _index(self):
+        trigramIndex.record(self.owner_id, self.id, itemText(self.source, self.source_url, self.tags))
 
 
 class User(db.Document):
@@ -54,15 +158,27 @@ class User(db.Document):
     is_active = db.BooleanField(default=True)
     items = db.ListField(db.ReferenceField('Item', reverse_delete_rule=db.PULL))
     board = db.ListField(db.ReferenceField('Board', reverse_delete_rule=db.PULL))
+    change_version = db.IntField(default=0)
     created_at = db.DateTimeField()
     modified_at = db.DateTimeField(default=datetime.datetime.now)
 
+    # username and email are indexed through unique=True
+    meta = {
+        'auto_create_index': False,
+        'index_background': True,
+    }
+
     def save(self, *args, **kwargs):
         if not self.created_at:
             self.created_at = datetime.datetime.now()
         self.modified_at = datetime.datetime.now()
         return super(User, self).save(*args, **kwargs)
 
+    @classmethod
+    def bump_version(cls, user_id):
+        """[Marks the user's boards and items as changed, invalidating every ETag handed out so far]"""
+        cls._get_collection().update_one({'_id': ObjectId(user_id)}, {'$inc': {'change_version': 1}})
+
     def hash_password(self):
         self.password = generate_password_hash(self.password).decode('utf8')
 
@@ -83,6 +199,14 @@ class RevokedTokenModel(db.Document):
     created_at = db.DateTimeField(default=datetime.datetime.now)
     modified_at = db.DateTimeField(default=datetime.datetime.now)
 
+    meta = {
+        'indexes': [
+            {'fields': ['jti'], 'unique': True},
+        ],
+        'auto_create_index': False,
+        'index_background': True,
+    }
+
     def save(self, *args, **kwargs):
         if not self.created_at:
             self.created_at = datetime.datetime.now()
@@ -100,6 +224,106 @@ class RevokedTokenModel(db.Document):
             raise InternalServerError
 
 
+# How long deletes are remembered, a sync token older than this has to start over with a full sync
+TOMBSTONE_TTL = datetime.timedelta(days=30)
+
+
+class Tombstone(db.Document):
+    """[Marker left behind by a deleted item or board so /api/sync can propagate the delete]"""
+    kind = db.StringField(required=True, choices=('item', 'board'))
+    object_id = db.ObjectIdField(required=True)
+    added_by = db.ReferenceField('User')
+    deleted_at = db.DateTimeField(default=datetime.datetime.now)
+
+    meta = {
+        'indexes': [
+            ('added_by', 'deleted_at'),
+            {'fields': ['deleted_at'], 'expireAfterSeconds': int(TOMBSTONE_TTL.total_seconds())},
+        ],
+        'auto_create_index': False,
+        'index_background': True,
+    }
+
+    @classmethod
+    def record(cls, user_id, kind, object_ids):
+        """[Records the deletion of `object_ids` in one insert]"""
+        now = datetime.datetime.now()
+        documents = [{'kind': kind, 'object_id': object_id, 'added_by': ObjectId(user_id), 'deleted_at': now}
+                     for object_id in object_ids]
+        if documents:
+            cls._get_collection().insert_many(documents, ordered=False)
+
+
+JOB_STATUSES = ('queued', 'running', 'done', 'failed')
+# Counters of an import job, filled in by the worker as it goes
+JOB_COUNTS = ('parsed', 'inserted', 'duplicates', 'errors', 'boards_created')
+
+
+class ImportJob(db.Document):
+    """[Bookmark import queued by UploadURLs and run by `flask import-worker`]"""
+    added_by = db.ReferenceField('User', required=True)
+    status = db.StringField(required=True, choices=JOB_STATUSES, default='queued')
+    filename = db.StringField()
+    # Name of the importer in importers/registry.py, known once a worker looked at the file
+    format = db.StringField()
+    # Upload kept in the import_files GridFS bucket until the job is over
+    file_id = db.ObjectIdField()
+    # Where the last batch written ends, NetscapeParser.state() for Netscape files, {'records': n} for the others
+    checkpoint = db.DictField()
+    # Stored as import_batch on the items written since the checkpoint
+    checkpoint_id = db.ObjectIdField()
+    parsed = db.IntField(default=0)
+    inserted = db.IntField(default=0)
+    duplicates = db.IntField(default=0)
+    errors = db.IntField(default=0)
+    boards_created = db.IntField(default=0)
+    error = db.StringField()
+    attempts = db.IntField(default=0)
+    worker = db.StringField()
+    heartbeat_at = db.DateTimeField()
+    created_at = db.DateTimeField(default=datetime.datetime.now)
+    started_at = db.DateTimeField()
+    finished_at = db.DateTimeField()
+
+    meta = {
+        'indexes': [
+            # Workers claim the oldest queued job, or a running one whose worker stopped beating
+            ('status', 'created_at'),
+            ('status', 'heartbeat_at'),
+            ('added_by', '-created_at'),
+        ],
+        'auto_create_index': False,
+        'index_background': True,
+    }
+
+
+UPLOAD_STATUSES = ('open', 'complete')
+
+
+class UploadSession(db.Document):
+    """[Bookmark file uploaded in byte ranges through /api/uploads, for clients whose connection may drop]"""
+    added_by = db.ReferenceField('User', required=True)
+    filename = db.StringField()
+    # Total bytes, unknown until a Content-Range names it
+    size = db.IntField()
+    received = db.IntField(default=0)
+    # GridFS files of the import_parts bucket, in byte order
+    parts = db.ListField(db.ObjectIdField())
+    status = db.StringField(required=True, choices=UPLOAD_STATUSES, default='open')
+    job = db.ObjectIdField()
+    created_at = db.DateTimeField(default=datetime.datetime.now)
+    modified_at = db.DateTimeField(default=datetime.datetime.now)
+
+    meta = {
+        'indexes': [
+            # Abandoned uploads are found by the import worker when it is idle
+            ('status', 'modified_at'),
+        ],
+        'auto_create_index': False,
+        'index_background': True,
+    }
+
+
 class Comment(db.Document):
     item_id = db.ReferenceField('Item')
     slug = db.StringField()
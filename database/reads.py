@@ -0,0 +1,282 @@
+import json
+import re
+
+from bson import ObjectId, SON
+from bson.errors import InvalidId
+
+from util.helpers import LEGACY_DEFAULT_TAG
+from util.sharedCache import sharedCache
+from .model import Item, Board, BoardSummary, User, ImportJob
+
+# Explicit projections for the hot read paths, documents come back as plain dicts and are never hydrated
+ITEM_FIELDS = ('source', 'source_url', 'tags', 'slug', 'bookmark_created', 'board', 'added_by', 'created_at',
+               'modified_at')
+BOARD_FIELDS = ('title', 'symbol', 'description', 'is_admin', 'slug', 'color', 'added_by', 'created_at',
+                'modified_at')
+# Per board aggregates computed by board_stats_stages
+BOARD_STATS_FIELDS = ('item_count', 'last_added', 'username')
+JOB_FIELDS = ('status', 'filename', 'format', 'error', 'attempts', 'created_at', 'started_at', 'finished_at',
+              'parsed', 'inserted', 'duplicates', 'errors', 'boards_created')
+USER_FIELDS = ('username', 'email', 'imageURL', 'verified', 'is_active', 'created_at', 'modified_at')
+
+
+def projection(fields):
+    return dict.fromkeys(fields, 1)
+
+
+def object_id(value):
+    """[Coerces a JWT identity or URL segment to an ObjectId, None when it is not one]"""
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return None
+
+
+def items():
+    return Item._get_collection()
+
+
+def boards():
+    return Board._get_collection()
+
+
+def users():
+    return User._get_collection()
+
+
+def item_query(user_id, board_id=None, tag=None):
+    query = {'added_by': ObjectId(user_id)}
+    if board_id is not None:
+        query['board'] = board_id
+    if tag is not None:
+        query['tags'] = tag
+    return query
+
+
+def domain_pattern(domain):
+    """[Anchored regex matching canonical URLs on domain or any of its subdomains]"""
+    host = re.escape(domain.lower().strip('.'))
+    return re.compile(r'^[a-z][a-z0-9+.-]*://([^/@]*@)?([^/]*\.)?%s(:\d+)?([/?#]|$)' % host)
+
+
+def board_query(user_id):
+    return {'added_by': ObjectId(user_id)}
+
+
+def board_stats_stages(user_id, fields=BOARD_STATS_FIELDS):
+    """[Aggregation stages adding item counts, last added time and owner to a page of boards]
+
+    The item $lookup matches on (added_by, board), the prefix of the Item
+    compound index, and the owner lookup is uncorrelated so the server runs
+    it once per aggregation.
+
+    Arguments:
+        user_id {[string]} -- [Owner of the boards]
+        fields {[tuple]} -- [Subset of BOARD_STATS_FIELDS to compute]
+
+    Returns:
+        [list]
+    """
+    owner = ObjectId(user_id)
+    stages = []
+    added = {}
+    if 'item_count' in fields or 'last_added' in fields:
+        stages.append({'$lookup': {
+            'from': Item._get_collection_name(),
+            'let': {'board': '$_id'},
+            'pipeline': [
+                {'$match': {'added_by': owner, '$expr': {'$eq': ['$board', '$$board']}}},
+                {'$group': {'_id': None, 'count': {'$sum': 1}, 'last_added': {'$max': '$created_at'}}},
+            ],
+            'as': '_items',
+        }})
+        if 'item_count' in fields:
+            added['item_count'] = {'$ifNull': [{'$arrayElemAt': ['$_items.count', 0]}, 0]}
+        if 'last_added' in fields:
+            added['last_added'] = {'$ifNull': [{'$arrayElemAt': ['$_items.last_added', 0]}, None]}
+    if 'username' in fields:
+        stages.append({'$lookup': {
+            'from': User._get_collection_name(),
+            'pipeline': [{'$match': {'_id': owner}}, {'$project': {'_id': 0, 'username': 1}}],
+            'as': '_owner',
+        }})
+        added['username'] = {'$arrayElemAt': ['$_owner.username', 0]}
+    if added:
+        stages.append({'$addFields': added})
+        stages.append({'$project': {'_items': 0, '_owner': 0}})
+    return stages
+
+
+def find_item(user_id, item_id, fields=ITEM_FIELDS):
+    """[Single item owned by the user]
+
+    Returns:
+        [dict] -- [Raw document or None]
+    """
+    item_id = object_id(item_id)
+    if item_id is None:
+        return None
+    return items().find_one({'_id': item_id, 'added_by': ObjectId(user_id)}, projection(fields))
+
+
+def find_item_by_url(user_id, url_hash, fields=ITEM_FIELDS):
+    """[The user's item saved under a canonical URL hash, an equality lookup on the unique item_url index]
+
+    Returns:
+        [dict] -- [Raw document or None]
+    """
+    return items().find_one({'added_by': ObjectId(user_id), 'url_hash': url_hash}, projection(fields))
+
+
+def board_summary(board):
+    """[Summary fields of a raw board, as embedded in its items]"""
+    return {field: board[field] for field in BoardSummary.FIELDS if board.get(field) is not None}
+
+
+def item_board_summary(item):
+    """[Embedded board summary of a raw item, read from the board for items saved before it existed]
+
+    Reads never write, `flask backfill-board-summaries` fills in the missing summaries.
+
+    Arguments:
+        item {[dict]} -- [Raw item with `board` and `board_summary` projected]
+
+    Returns:
+        [dict]
+    """
+    summary = item.get('board_summary')
+    if summary is None:
+        summary = board_summary(boards().find_one({'_id': item['board']}, projection(BoardSummary.FIELDS)) or {})
+    return summary
+
+
+def find_board(user_id, slug, fields=BOARD_FIELDS):
+    """[Board of the user by slug]
+
+    Returns:
+        [dict] -- [Raw document or None]
+    """
+    return boards().find_one({'slug': slug, 'added_by': ObjectId(user_id)}, projection(fields))
+
+
+def find_job(user_id, job_id, fields=JOB_FIELDS):
+    """[Import job of the user]
+
+    Returns:
+        [dict] -- [Raw document or None]
+    """
+    job_id = object_id(job_id)
+    if job_id is None:
+        return None
+    return ImportJob._get_collection().find_one({'_id': job_id, 'added_by': ObjectId(user_id)}, projection(fields))
+
+
+def change_version(user_id):
+    """[Current change version of the user, bumped by every write to their boards or items]
+
+    Returns:
+        [int]
+    """
+    user = users().find_one({'_id': ObjectId(user_id)}, {'change_version': 1}) or {}
+    return user.get('change_version', 0)
+
+
+def board_key(user_id, slug):
+    return 'slug:%s:%s' % (user_id, slug)
+
+
+def identity_key(user_id):
+    return 'user:%s' % user_id
+
+
+def find_board_id(user_id, slug):
+    """[Id of the user's board with the given slug, resolved through the shared cache]
+
+    Returns:
+        [ObjectId] -- [Or None when the user has no such board]
+    """
+    key = board_key(user_id, slug)
+    cached = sharedCache.get(key)
+    if cached is not None:
+        return ObjectId(cached.decode('ascii'))
+    board = find_board(user_id, slug, ('_id',))
+    if board is None:
+        return None
+    sharedCache.set(key, str(board['_id']).encode('ascii'))
+    return board['_id']
+
+
+def identity(user_id):
+    """[Username and email of the user, resolved through the shared cache]
+
+    Returns:
+        [dict] -- [Or None when the user does not exist]
+    """
+    key = identity_key(user_id)
+    cached = sharedCache.get(key)
+    if cached is not None:
+        return json.loads(cached)
+    user = find_user(user_id, ('username', 'email'))
+    if user is None:
+        return None
+    user = {'_id': str(user['_id']), 'username': user.get('username'), 'email': user.get('email')}
+    sharedCache.set(key, json.dumps(user).encode('utf-8'))
+    return user
+
+
+def find_user(user_id, fields=USER_FIELDS):
+    """[User by id, the password hash is never part of the projection]
+
+    Returns:
+        [dict] -- [Raw document or None]
+    """
+    user_id = object_id(user_id)
+    if user_id is None:
+        return None
+    return users().find_one({'_id': user_id}, projection(fields))
+
+
+def board_suggestions(user_id):
+    """[Autocomplete entries for the user's boards, weighted by how many items each holds]
+
+    Returns:
+        [list] -- [(title, item count, {slug, color, symbol}) triples]
+    """
+    user_id = ObjectId(user_id)
+    # Grouping on board after the added_by equality is answered from the (added_by, board, ...) index alone
+    counts = {row['_id']: row['count'] for row in items().aggregate([
+        {'$match': {'added_by': user_id}},
+        {'$group': {'_id': '$board', 'count': {'$sum': 1}}},
+    ])}
+    return [(board.get('title') or '', counts.get(board['_id'], 0),
+             {'slug': board.get('slug'), 'color': board.get('color'), 'symbol': board.get('symbol')})
+            for board in boards().find({'added_by': user_id}, projection(('title', 'slug', 'color', 'symbol')))]
+
+
+def tags_expression():
+    """[Aggregation expression of an item's tags as a list]
+
+    Items the `migrate-tags` command has not reached yet still hold one comma separated string, split here.
+    """
+    split = {'$map': {'input': {'$split': [{'$ifNull': ['$tags', '']}, ',']}, 'in': {'$trim': {'input': '$$this'}}}}
+    return {'$cond': [{'$isArray': '$tags'}, '$tags', {'$setDifference': [split, ['', LEGACY_DEFAULT_TAG]]}]}
+
+
+def tag_facet_pipeline(query):
+    """[Aggregation counting the items per tag among those matching query, most used first]"""
+    return [
+        {'$match': query},
+        {'$project': {'_id': 0, 'tags': tags_expression()}},
+        {'$unwind': '$tags'},
+        {'$group': {'_id': '$tags', 'count': {'$sum': 1}}},
+        {'$sort': SON([('count', -1), ('_id', 1)])},
+    ]
+
+
+def tag_suggestions(user_id):
+    """[Autocomplete entries for the tags on the user's items, weighted by how many items carry each]
+
+    Returns:
+        [list] -- [(tag, item count, {}) triples]
+    """
+    return [(row['_id'], row['count'], {}) for row in items().aggregate(tag_facet_pipeline(item_query(user_id)))]
@@ -4,3 +4,5 @@ load_dotenv()
 
 JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY')
 MONGODB_SETTINGS = os.getenv('MONGODB_SETTINGS')
+# Comma separated user ids allowed to read process internals such as /api/cache/stats
+OPERATOR_IDS = [user_id.strip() for user_id in os.getenv('OPERATOR_IDS', '').split(',') if user_id.strip()]
@@ -0,0 +1,200 @@
+import json
+import re
+
+from importers.netscape import Bookmark, CHUNK_SIZE, MAX_TEXT_BYTES
+from util.helpers import splitTags
+
+_WHITESPACE = re.compile(rb'[ \t\r\n]*')
+_STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+# Body of a string too long to keep, up to its closing quote or the last complete escape
+_STRING_BODY = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL)
+_NUMBER = re.compile(rb'-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?')
+# Every byte a number may be made of, a run of them reaching the end of a chunk may go on in the next one
+_NUMBER_RUN = re.compile(rb'[-+0-9.eE]*')
+_LITERALS = {ord('t'): (b'true', True), ord('f'): (b'false', False), ord('n'): (b'null', None)}
+_PUNCTUATION = frozenset(b'{}[]:,')
+_QUOTE = ord('"')
+
+# Object fields read from bookmark exports, every other field is dropped as soon as it is read
+FIELDS = frozenset(('name', 'title', 'url', 'uri', 'date_added', 'dateAdded', 'tags'))
+# Chrome counts microseconds from 1601-01-01
+CHROME_EPOCH_SECONDS = 11644473600
+
+
+class JSONTokenizer:
+    """[Incremental JSON tokenizer]
+
+    Bytes are fed in chunks of any size and tokens come out as
+    `(kind, value, offset)`, kind being one of `{}[]:,` or `value`. Strings
+    longer than MAX_TEXT_BYTES, favicons and sync blobs mostly, are skipped
+    and come out as None, so memory stays bounded whatever the file holds.
+    """
+
+    def __init__(self):
+        self.offset = 0
+        self._buffer = bytearray()
+        self._skipping = None
+
+    def feed(self, data, final=False):
+        """[Tokenizes another chunk, `final` once the input is over]
+
+        Raises:
+            ValueError: [If the input is not JSON]
+
+        Yields:
+            [tuple] -- [(kind, value, offset)]
+        """
+        buffer = self._buffer
+        buffer += data
+        position = 0
+        while True:
+            if self._skipping is not None:
+                end = _STRING_BODY.match(buffer, position).end()
+                if end < len(buffer) and buffer[end] == _QUOTE:
+                    yield 'value', None, self._skipping
+                    self._skipping = None
+                    position = end + 1
+                    continue
+                position = end
+                break
+            position = _WHITESPACE.match(buffer, position).end()
+            if position >= len(buffer):
+                break
+            char = buffer[position]
+            if char in _PUNCTUATION:
+                yield chr(char), None, self.offset + position
+                position += 1
+            elif char == _QUOTE:
+                found = _STRING.match(buffer, position)
+                if found is None:
+                    if len(buffer) - position > MAX_TEXT_BYTES:
+                        self._skipping = self.offset + position
+                        position += 1
+                        continue
+                    break
+                text = found.group(0)
+                if len(text) > MAX_TEXT_BYTES:
+                    # As long as the strings skipped above, whichever way the chunks fell
+                    value = None
+                else:
+                    # Only strings with escapes need the JSON decoder
+                    value = json.loads(text) if b'\\' in text else text[1:-1].decode('utf-8', 'replace')
+                yield 'value', value, self.offset + position
+                position = found.end()
+            elif char in _LITERALS:
+                word, value = _LITERALS[char]
+                if buffer.startswith(word, position):
+                    yield 'value', value, self.offset + position
+                    position += len(word)
+                elif not final and word.startswith(bytes(buffer[position:])):
+                    break
+                else:
+                    raise ValueError("Invalid JSON at byte %d" % (self.offset + position))
+            else:
+                if not final and _NUMBER_RUN.match(buffer, position).end() == len(buffer):
+                    break
+                found = _NUMBER.match(buffer, position)
+                if found is None:
+                    raise ValueError("Invalid JSON at byte %d" % (self.offset + position))
+                yield 'value', json.loads(found.group(0)), self.offset + position
+                position = found.end()
+        del buffer[:position]
+        self.offset += position
+        if final and (buffer or self._skipping is not None):
+            raise ValueError("JSON ends early")
+
+
+def tokens(stream, chunk_size=CHUNK_SIZE):
+    tokenizer = JSONTokenizer()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        yield from tokenizer.feed(chunk)
+    yield from tokenizer.feed(b'', final=True)
+
+
+def _objects(stream, chunk_size):
+    """[Every object of a JSON document as it closes, with the objects and arrays around it]
+
+    Objects are dicts of their FIELDS plus `offset` and `folder`, set once
+    the object turns out to have a `children` array.
+
+    Yields:
+        [tuple] -- [(object, enclosing frames, outermost first)]
+    """
+    stack = []
+    for kind, value, offset in tokens(stream, chunk_size):
+        top = stack[-1] if stack else None
+        if kind == 'value':
+            if top is not None and top['object']:
+                if top['key'] is None:
+                    top['key'] = value
+                elif top['key'] in FIELDS:
+                    top['fields'][top['key']] = value
+        elif kind == ',':
+            if top is not None and top['object']:
+                top['key'] = None
+        elif kind in '{[':
+            if kind == '[' and top is not None and top['object'] and top['key'] == 'children':
+                top['folder'] = True
+            stack.append({'object': kind == '{', 'offset': offset, 'key': None, 'fields': {}, 'folder': False})
+        elif kind in '}]':
+            if not stack:
+                raise ValueError("Invalid JSON at byte %d" % offset)
+            frame = stack.pop()
+            if frame['object']:
+                yield frame, stack
+    if stack:
+        raise ValueError("JSON ends early")
+
+
+def _name(frame, names):
+    name = frame['fields'].get('name') or frame['fields'].get('title')
+    if not isinstance(name, str):
+        name = names.get(frame['offset'])
+    return name.strip() if isinstance(name, str) else None
+
+
+def _added(fields):
+    if 'date_added' in fields:
+        try:
+            added = int(fields['date_added']) // 1000000 - CHROME_EPOCH_SECONDS
+        except (TypeError, ValueError):
+            return None
+        return added if added > 0 else None
+    added = fields.get('dateAdded')
+    return added // 1000000 if isinstance(added, int) else None
+
+
+def parse(stream, chunk_size=CHUNK_SIZE):
+    """[Bookmarks of a Chrome `Bookmarks` file or a Firefox JSON backup, read a chunk at a time]
+
+    Folders are objects with a `children` array and bookmarks objects with a
+    `url` (Chrome) or `uri` (Firefox). Chrome writes the name of a folder after
+    its children, so a first pass over the seekable stream keeps only the
+    folder names by offset and the second pass yields the bookmarks.
+
+    Arguments:
+        stream {[file]} -- [Seekable binary file object]
+        chunk_size {[int]} -- [Bytes read at a time]
+
+    Yields:
+        [Bookmark]
+    """
+    start = stream.tell()
+    names = {}
+    for frame, _ in _objects(stream, chunk_size):
+        if frame['folder']:
+            names[frame['offset']] = _name(frame, {})
+    stream.seek(start)
+    for frame, stack in _objects(stream, chunk_size):
+        fields = frame['fields']
+        href = fields.get('url') or fields.get('uri')
+        if frame['folder'] or not isinstance(href, str) or href.startswith('place:'):
+            continue
+        folder_path = tuple(name for name in (_name(outer, names) for outer in stack if outer['folder']) if name)
+        title = fields.get('name') or fields.get('title')
+        tags = fields.get('tags')
+        yield Bookmark(folder_path, title.strip() if isinstance(title, str) and title.strip() else href, href,
+                       _added(fields), splitTags(tags) if isinstance(tags, str) else [])
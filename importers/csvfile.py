@@ -0,0 +1,65 @@
+import csv
+import datetime
+
+from importers.netscape import Bookmark, CHUNK_SIZE
+from importers.urllist import lines
+from util.helpers import splitTags
+
+# Header names understood per field, Pocket, Raindrop, Pinboard and spreadsheet exports among others
+URL_COLUMNS = ('url', 'href', 'link', 'uri')
+TITLE_COLUMNS = ('title', 'name', 'description')
+TAG_COLUMNS = ('tags', 'labels')
+DATE_COLUMNS = ('time_added', 'add_date', 'date_added', 'created', 'created_at', 'time')
+FOLDER_COLUMNS = ('folder', 'collection', 'board')
+
+
+def columns(header):
+    """[Positions of the known fields in a CSV header, None for a header without a URL column]"""
+    header = [name.strip().lower() for name in header]
+
+    def find(names):
+        return next((header.index(name) for name in names if name in header), None)
+
+    found = {'url': find(URL_COLUMNS), 'title': find(TITLE_COLUMNS), 'tags': find(TAG_COLUMNS),
+             'date': find(DATE_COLUMNS), 'folder': find(FOLDER_COLUMNS)}
+    return found if found['url'] is not None else None
+
+
+def _added(value):
+    value = value.strip()
+    if value.isdigit():
+        # Seconds, or milliseconds from exports written by JavaScript
+        return int(value) // 1000 if len(value) > 11 else int(value)
+    try:
+        return int(datetime.datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp())
+    except ValueError:
+        return None
+
+
+def parse(stream, chunk_size=CHUNK_SIZE):
+    """[Bookmarks of a CSV export with a header row, read a line at a time]
+
+    Pocket separates tags with |, other tools with commas; folders may be
+    nested with /.
+
+    Yields:
+        [Bookmark]
+    """
+    # A piece of a cut row would be read as a row of its own, oversized rows are left out instead
+    rows = csv.reader(lines(stream, chunk_size, cut=False))
+    found = columns(next(rows, []))
+    if found is None:
+        return
+
+    def cell(row, field):
+        position = found[field]
+        return row[position].strip() if position is not None and position < len(row) else ''
+
+    for row in rows:
+        href = cell(row, 'url')
+        if not href:
+            continue
+        folder = cell(row, 'folder')
+        date = cell(row, 'date')
+        yield Bookmark(tuple(part.strip() for part in folder.split('/') if part.strip()), cell(row, 'title') or href,
+                       href, _added(date) if date else None, splitTags(cell(row, 'tags').replace('|', ',')))
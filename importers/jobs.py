@@ -0,0 +1,266 @@
+import csv
+import datetime
+import os
+import socket
+import time
+
+import click
+from bson import ObjectId
+from gridfs import GridFSBucket
+from gridfs.errors import NoFile
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+from database.model import ImportJob
+from importers.netscape import parse, NetscapeParser, CHUNK_SIZE
+from importers.pipeline import ImportPipeline
+from importers.registry import detect, SNIFF_BYTES
+from importers.shards import parseShards, SHARD_BYTES
+from importers.uploads import sessions, uploadReader, storeStream, discardParts, discardExpiredUploads
+from util.errors import UploadIncompleteError
+
+DEFAULT_POLL_INTERVAL = 1.0
+# A running job whose worker has not reported for this long is handed to another worker
+STALE_AFTER = datetime.timedelta(minutes=5)
+MAX_ATTEMPTS = 3
+FILES_BUCKET = 'import_files'
+# Failures of the file itself, a job failing with one of these fails the same way on every attempt
+FILE_ERRORS = (ValueError, csv.Error, NoFile)
+
+
+class JobLost(Exception):
+    """[The job was handed to another worker after this one went quiet for too long]"""
+
+
+def jobs():
+    return ImportJob._get_collection()
+
+
+def files():
+    return GridFSBucket(ImportJob._get_db(), bucket_name=FILES_BUCKET)
+
+
+def _counts(pipeline):
+    counts = pipeline.counts()
+    return {'parsed': counts['count'], 'inserted': counts['inserted'], 'duplicates': counts['duplicates'],
+            'errors': counts['errors'], 'boards_created': counts['boards_created']}
+
+
+def _resumed_counts(job):
+    return {'count': job.get('parsed', 0), 'inserted': job.get('inserted', 0), 'duplicates': job.get('duplicates', 0),
+            'errors': job.get('errors', 0), 'boards_created': job.get('boards_created', 0)}
+
+
+class ImportQueue:
+    """[Import jobs kept in the import_job collection, uploads in a GridFS bucket every worker can read]
+
+    After every batch the worker stores the parser state and the counts in
+    the job in one update, so a job taken over from a dead worker seeks to
+    the last checkpoint instead of starting over. Bookmarks written after that
+    checkpoint are written again, the unique url_hash index turns them into
+    duplicates rather than second copies; as those items carry the
+    checkpoint_id of the job as their import_batch, they are counted as
+    inserted, like the first time.
+
+    With more than one process, Netscape files larger than a shard are parsed
+    by parseShards and checkpointed after every shard instead. Files in the
+    other formats of importers/registry.py checkpoint the number of records
+    written.
+
+    A job that fails is queued again from its checkpoint, up to MAX_ATTEMPTS
+    attempts in all, unless the file itself is at fault (FILE_ERRORS). Only a
+    job failed for good loses its upload.
+    """
+
+    def __init__(self, processes=1):
+        self.processes = processes
+
+    def enqueue(self, user_id, stream, filename=None):
+        """[Stores an uploaded bookmark file and queues its import]
+
+        Arguments:
+            user_id {[string]} -- [JWT identity]
+            stream {[file]} -- [Binary stream of the upload]
+            filename {[string]} -- [Name of the file on the client, kept for display]
+
+        Returns:
+            [ImportJob]
+        """
+        job_id = ObjectId()
+        file_id = storeStream(files(), '%s.import' % job_id, stream)
+        job = ImportJob(id=job_id, added_by=ObjectId(user_id), filename=filename, file_id=file_id)
+        job.save()
+        return job
+
+    def enqueueUpload(self, user_id, session):
+        """[Queues the import of a chunked upload once all of its bytes are in]
+
+        The parts are put together and decompressed into one import file, then dropped.
+
+        Arguments:
+            user_id {[string]} -- [JWT identity]
+            session {[UploadSession]} -- [Upload of the user]
+
+        Raises:
+            UploadIncompleteError: [If bytes are missing or another request is completing the upload]
+
+        Returns:
+            [ImportJob]
+        """
+        if session.size is None or session.received != session.size:
+            raise UploadIncompleteError
+        if not sessions().update_one({'_id': session.id, 'status': 'open', 'received': session.size}, {'$set': {
+                'status': 'complete', 'modified_at': datetime.datetime.now()}}).modified_count:
+            raise UploadIncompleteError
+        try:
+            job = self.enqueue(user_id, uploadReader(session.parts), session.filename)
+        except Exception:
+            sessions().update_one({'_id': session.id}, {'$set': {'status': 'open'}})
+            raise
+        sessions().update_one({'_id': session.id}, {'$set': {'job': job.id, 'parts': []}})
+        discardParts(session.parts)
+        return job
+
+    def claim(self, worker):
+        """[Marks the oldest runnable job as running for worker]
+
+        Returns:
+            [dict] -- [Raw job document, None when there is nothing to run]
+        """
+        now = datetime.datetime.now()
+        stale = {'status': 'running', 'heartbeat_at': {'$lt': now - STALE_AFTER}}
+        for job in jobs().find(dict(stale, attempts={'$gte': MAX_ATTEMPTS}), {'file_id': 1}):
+            if jobs().update_one(dict(stale, _id=job['_id']), {'$set': {
+                    'status': 'failed', 'error': "Worker stopped responding", 'finished_at': now}}).modified_count:
+                self._discard(job)
+        return jobs().find_one_and_update(
+            {'$or': [{'status': 'queued'}, stale], 'attempts': {'$lt': MAX_ATTEMPTS}},
+            {'$set': {'status': 'running', 'worker': worker, 'heartbeat_at': now, 'started_at': now},
+             '$inc': {'attempts': 1}},
+            sort=[('created_at', 1)], return_document=ReturnDocument.AFTER)
+
+    def run(self, job, worker):
+        """[Runs a claimed job to completion from its last checkpoint, checkpointing after every batch]"""
+        checkpoint = job.get('checkpoint') or {}
+        pipeline = ImportPipeline(job['added_by'], counts=_resumed_counts(job) if checkpoint else None)
+        # Items written after the checkpoint, by this attempt or an interrupted one, carry the same batch
+        batch = job.get('checkpoint_id') or ObjectId()
+        pipeline.mark(batch)
+        try:
+            with files().open_download_stream(job['file_id']) as stream:
+                importer = detect(stream.read(SNIFF_BYTES))
+                if importer is None:
+                    raise ValueError("Not a bookmark file in a known format")
+                self._report(job, worker, {'format': importer.name, 'checkpoint_id': batch})
+                for state in self._write(importer, stream, job, pipeline, checkpoint):
+                    batch = ObjectId()
+                    self._report(job, worker, dict(_counts(pipeline), checkpoint=state, checkpoint_id=batch))
+                    pipeline.mark(batch)
+            pipeline.close()
+            self._report(job, worker, dict(_counts(pipeline), status='done', error=None,
+                                           finished_at=datetime.datetime.now()))
+        except JobLost:
+            print("Import %s was taken over by another worker" % job['_id'])
+            return
+        except Exception as e:
+            print(e)
+            try:
+                if isinstance(e, FILE_ERRORS) or job['attempts'] >= MAX_ATTEMPTS:
+                    if not self._fail(job, worker, pipeline, e):
+                        return
+                else:
+                    # The database going away or a crashed pool may not happen again, the next claim resumes
+                    self._release(job, worker, e)
+                    return
+            except PyMongoError as error:
+                # The job stays running, once it is stale claim() retries it or fails it for good
+                print(error)
+                return
+        self._discard(job)
+
+    def _write(self, importer, stream, job, pipeline, checkpoint):
+        """[Adds the records of the file to the pipeline from the checkpoint on]
+
+        Yields:
+            [dict] -- [Checkpoint, whenever everything added so far is written]
+        """
+        if importer.name != 'netscape':
+            # Formats other than Netscape are read again from the start, the records already written are skipped
+            stream.seek(0)
+            written = checkpoint.get('records', 0)
+            for position, bookmark in enumerate(importer.parse(stream), 1):
+                if position > written and pipeline.add(bookmark):
+                    yield {'records': position}
+            return
+        parser = NetscapeParser(**checkpoint)
+        stream.seek(parser.offset)
+        if self.processes > 1 and stream.length - parser.offset > SHARD_BYTES:
+            for records, state in parseShards(stream, job['added_by'], self.processes, state=parser.state()):
+                for record in records:
+                    pipeline.add(record)
+                pipeline.flush()
+                yield state
+            return
+        for bookmark in parse(stream, CHUNK_SIZE, parser):
+            if pipeline.add(bookmark):
+                # Every bookmark the parser has given out so far is written
+                yield parser.state()
+
+    def _discard(self, job):
+        try:
+            files().delete(job['file_id'])
+        except NoFile:
+            pass
+
+    def _fail(self, job, worker, pipeline, error):
+        return jobs().update_one({'_id': job['_id'], 'worker': worker}, {'$set': dict(
+            _counts(pipeline), status='failed', error=str(error),
+            finished_at=datetime.datetime.now())}).matched_count
+
+    def _release(self, job, worker, error):
+        # Counts stay those of the last checkpoint, where the next attempt starts
+        jobs().update_one({'_id': job['_id'], 'worker': worker}, {
+            '$set': {'status': 'queued', 'error': str(error)}, '$unset': {'worker': '', 'heartbeat_at': ''}})
+
+    def _report(self, job, worker, fields):
+        fields['heartbeat_at'] = datetime.datetime.now()
+        if not jobs().update_one({'_id': job['_id'], 'worker': worker}, {'$set': fields}).matched_count:
+            raise JobLost
+
+    def work(self, worker, once=False, poll=DEFAULT_POLL_INTERVAL):
+        while True:
+            try:
+                job = self.claim(worker)
+            except PyMongoError as e:
+                click.echo("Could not claim an import: %s" % e)
+                time.sleep(poll)
+                continue
+            if job is None:
+                if once:
+                    return
+                discardExpiredUploads()
+                time.sleep(poll)
+                continue
+            click.echo("Running import %s" % job['_id'])
+            self.run(job, worker)
+
+
+importQueue = ImportQueue()
+
+
+@click.command('import-worker')
+@click.option('--once', is_flag=True, help="Exit once the queue is empty instead of waiting for more jobs.")
+@click.option('--poll', default=DEFAULT_POLL_INTERVAL, show_default=True, help="Seconds between polls when idle.")
+@click.option('--processes', type=int, help="Processes parsing large files, IMPORT_PROCESSES by default.")
+def import_worker_command(once, poll, processes):
+    """[Runs queued bookmark imports, as many workers as the database can take may run side by side]"""
+    if processes:
+        importQueue.processes = processes
+    worker = '%s:%d' % (socket.gethostname(), os.getpid())
+    click.echo("Import worker %s started with %d processes" % (worker, importQueue.processes))
+    importQueue.work(worker, once, poll)
+
+
+def initialize_imports(app):
+    importQueue.processes = app.config.get('IMPORT_PROCESSES', os.cpu_count() or 1)
+    app.cli.add_command(import_worker_command)
@@ -0,0 +1,229 @@
+import html
+import re
+from collections import namedtuple
+
+from util.helpers import splitTags
+
+CHUNK_SIZE = 64 * 1024
+# Longest tag or title kept, anything longer (inline icons mostly) is skipped so memory stays bounded
+MAX_TAG_BYTES = 1024 * 1024
+MAX_TEXT_BYTES = 64 * 1024
+
+Bookmark = namedtuple('Bookmark', ('folder_path', 'title', 'href', 'add_date', 'tags'))
+
+_ATTRIBUTE = re.compile(rb'''([A-Za-z_:][-A-Za-z0-9_:.]*)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))''')
+_NAME = re.compile(rb'/?[A-Za-z0-9]+')
+# Elements that close a bookmark whose </A> is missing
+_ENDS_LINK = (b'A', b'DT', b'DL', b'/DL', b'H3')
+
+
+def _decode(raw):
+    return html.unescape(raw.decode('utf-8', 'replace')).strip()
+
+
+class NetscapeParser:
+    """[Incremental parser of Netscape bookmark files, the HTML every browser exports]
+
+    Bytes are fed in chunks of any size and Bookmark records come out as soon
+    as their </A> has been read. Nesting is tracked with an explicit folder
+    stack rather than a tree, so neither memory nor the Python stack grow with
+    the size or depth of the file; only one unfinished tag or title is ever
+    buffered.
+
+    `state()` taken between two records describes where parsing stands, and
+    a parser created from it continues from that byte offset.
+    """
+
+    def __init__(self, offset=0, folders=(), pending=None):
+        """[Creates a parser at the start of a file, or at a state() taken earlier]
+
+        Arguments:
+            offset {[int]} -- [Byte offset the first fed byte is at]
+            folders {[list]} -- [Open folders, outermost first, None for unnamed lists]
+            pending {[string]} -- [Folder heading read whose list has not opened yet]
+        """
+        self.offset = offset
+        self.folders = list(folders)
+        self.pending = pending
+        self._buffer = bytearray()
+        self._skipping = False
+        self._text = None
+        self._link = None
+        self.tag_offset = offset
+
+    def state(self):
+        return {'offset': self.offset, 'folders': list(self.folders), 'pending': self.pending}
+
+    def folder_path(self):
+        return tuple(folder for folder in self.folders if folder)
+
+    def feed(self, data):
+        """[Parses another chunk of the file]
+
+        Yields:
+            [Bookmark] -- [Every bookmark completed by this chunk]
+        """
+        buffer = self._buffer
+        buffer += data
+        position = 0
+        while position < len(buffer):
+            if self._skipping:
+                end = buffer.find(b'>', position)
+                if end < 0:
+                    position = len(buffer)
+                    break
+                self._skipping = False
+                position = end + 1
+                continue
+            start = buffer.find(b'<', position)
+            if start < 0:
+                self._collect(buffer, position, len(buffer))
+                position = len(buffer)
+                break
+            self._collect(buffer, position, start)
+            if buffer.startswith(b'<!--', start):
+                end = buffer.find(b'-->', start + 4)
+                if end < 0:
+                    position = start
+                    break
+                position = end + 3
+                continue
+            end = buffer.find(b'>', start + 1)
+            if end < 0:
+                if len(buffer) - start > MAX_TAG_BYTES:
+                    self._skipping = True
+                    position = len(buffer)
+                else:
+                    position = start
+                break
+            if end - start > MAX_TAG_BYTES:
+                # Skipped like the tags too long to wait for above, whichever way the chunks fell
+                position = end + 1
+                continue
+            raw = bytes(buffer[start + 1:end])
+            name = _NAME.match(raw)
+            if name is None:
+                position = end + 1
+                continue
+            name = name.group(0).upper()
+            if self._link is not None and name in _ENDS_LINK:
+                # A bookmark missing its </A> ends where the next element starts, that element is read afterwards
+                position = start
+                bookmark = self._finish_link()
+            else:
+                position = end + 1
+                self.tag_offset = self.offset + start
+                bookmark = self._tag(name, raw)
+            if bookmark is not None:
+                del buffer[:position]
+                self.offset += position
+                position = 0
+                yield bookmark
+        del buffer[:position]
+        self.offset += position
+
+    def close(self):
+        """[Flushes a bookmark left open by a file that ends without its </A>]
+
+        Yields:
+            [Bookmark]
+        """
+        bookmark = self._finish_link()
+        if bookmark is not None:
+            yield bookmark
+
+    def _collect(self, buffer, start, end):
+        if self._text is not None and end > start and len(self._text) < MAX_TEXT_BYTES:
+            self._text += buffer[start:min(end, start + MAX_TEXT_BYTES - len(self._text))]
+
+    def _tag(self, name, raw):
+        bookmark = None
+        if name == b'A':
+            self._link = {found.group(1).upper(): next(value for value in found.group(2, 3, 4) if value is not None)
+                          for found in _ATTRIBUTE.finditer(raw, 1)}
+            self._text = bytearray()
+        elif name == b'/A':
+            bookmark = self._finish_link()
+        elif name == b'H3':
+            self._link = None
+            self._text = bytearray()
+        elif name == b'/H3':
+            if self._text is not None:
+                self.pending = _decode(self._text)
+            self._text = None
+        elif name == b'DL':
+            self.folders.append(self.pending)
+            self.pending = None
+        elif name == b'/DL':
+            if self.folders:
+                self.folders.pop()
+            self.pending = None
+        return bookmark
+
+    def _finish_link(self):
+        link, text = self._link, self._text
+        if link is None:
+            return None
+        self._link = self._text = None
+        href = _decode(link.get(b'HREF', b''))
+        if not href:
+            return None
+        try:
+            # Pocket names it TIME_ADDED
+            add_date = int(link.get(b'ADD_DATE') or link.get(b'TIME_ADDED', b''))
+        except ValueError:
+            add_date = None
+        return Bookmark(self.folder_path(), _decode(text or b'') or href, href, add_date,
+                        splitTags(_decode(link.get(b'TAGS', b''))))
+
+
+class FolderScanner(NetscapeParser):
+    """[Parser that only follows folders, to find where a file can be split between parsers]
+
+    Links are skipped without reading their attributes or titles. Whenever a
+    folder heading starts at least `shard_bytes` after the previous split,
+    its offset and the state a NetscapeParser needs to continue from there
+    are added to `boundaries`.
+    """
+
+    def __init__(self, shard_bytes, offset=0, folders=(), pending=None):
+        super(FolderScanner, self).__init__(offset, folders, pending)
+        self.shard_bytes = shard_bytes
+        self.boundaries = []
+        self._last = offset
+
+    def _tag(self, name, raw):
+        if name == b'A':
+            self._link = True
+        elif name == b'/A':
+            self._link = None
+        else:
+            if name == b'H3' and self.tag_offset - self._last >= self.shard_bytes:
+                self._last = self.tag_offset
+                self.boundaries.append({'offset': self.tag_offset, 'folders': list(self.folders),
+                                        'pending': self.pending})
+            super(FolderScanner, self)._tag(name, raw)
+
+    def _finish_link(self):
+        self._link = None
+        return None
+
+
+def parse(stream, chunk_size=CHUNK_SIZE, parser=None):
+    """[Bookmarks of a Netscape bookmark file read from a binary stream a chunk at a time]
+
+    Arguments:
+        stream {[file]} -- [Binary file object, the request stream or an upload]
+        chunk_size {[int]} -- [Bytes read at a time]
+        parser {[NetscapeParser]} -- [Parser to continue, a fresh one by default]
+
+    Yields:
+        [Bookmark]
+    """
+    parser = parser or NetscapeParser()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        yield from parser.feed(chunk)
+    yield from parser.close()
@@ -0,0 +1,179 @@
+from collections import namedtuple
+
+from bson import ObjectId
+from mongoengine.errors import ValidationError
+from pymongo.errors import BulkWriteError
+
+from database import reads
+from database.bulk import ItemWriter, DEFAULT_CHUNK_SIZE, UNBOUND_BOARD, row_error, item_document
+from database.model import Board, BoardSummary, User
+from util.cache import responseCache, BOARDS_SCOPE
+from util.helpers import generateBoardColor
+
+# Board for the bookmarks that sit outside every folder
+ROOT_BOARD_TITLE = "Imported bookmarks"
+
+
+def boardTitle(bookmark):
+    """[Title of the board a bookmark goes to, its innermost folder]"""
+    return bookmark.folder_path[-1] if bookmark.folder_path else ROOT_BOARD_TITLE
+
+
+# Bookmark whose item document was built ahead of time, see prepareBookmarks
+Prepared = namedtuple('Prepared', ('board_title', 'document', 'error'))
+
+
+def bookmarkRow(bookmark):
+    """[Item fields of a Bookmark record, as a client would send them]"""
+    row = {'source': bookmark.title, 'source_url': bookmark.href, 'tags': bookmark.tags}
+    if bookmark.add_date is not None:
+        row['bookmark_created'] = str(bookmark.add_date)
+    return row
+
+
+def prepareBookmarks(bookmarks, user_id):
+    """[Prepared records of Bookmark records, built without the database so another process can do it]
+
+    Yields:
+        [Prepared]
+    """
+    user_id = ObjectId(user_id)
+    for bookmark in bookmarks:
+        row = bookmarkRow(bookmark)
+        document, error = None, row_error(row, UNBOUND_BOARD)
+        if error is None:
+            try:
+                document = item_document(row, UNBOUND_BOARD, user_id)
+            except (ValidationError, TypeError, ValueError) as e:
+                error = str(e)
+        yield Prepared(boardTitle(bookmark), document, error)
+
+
+class ImportPipeline:
+    """[Writes one user's parsed bookmarks in batches]
+
+    Each batch resolves the boards of its distinct folders with one find,
+    creates the missing ones with one insert_many and keeps folder -> board
+    in memory for the rest of the import. Items then go through an
+    ItemWriter, so they are inserted with unordered insert_many and URLs the
+    user already saved are counted as duplicates instead of stored twice.
+
+        pipeline = ImportPipeline(user_id)
+        for bookmark in parse(stream):
+            pipeline.add(bookmark)
+        counts = pipeline.close()
+    """
+
+    def __init__(self, user_id, batch_size=DEFAULT_CHUNK_SIZE, counts=None):
+        """[Creates a pipeline]
+
+        Arguments:
+            user_id {[string]} -- [JWT identity]
+            batch_size {[int]} -- [Bookmarks per batch]
+            counts {[dict]} -- [Counts of an interrupted import this one resumes, as counts() gives them]
+        """
+        self.user_id = ObjectId(user_id)
+        self.batch_size = batch_size
+        self.writer = ItemWriter(user_id, batch_size, keep_statuses=False)
+        self.boards = {}
+        self.boards_created = 0
+        self._batch = []
+        if counts:
+            self.writer.rows = counts['count']
+            self.writer.inserted = counts['inserted']
+            self.writer.duplicates = counts['duplicates']
+            self.writer.errors = counts['errors']
+            self.boards_created = counts['boards_created']
+
+    def add(self, bookmark):
+        """[Queues a Bookmark or Prepared record, writing a batch when enough are queued]
+
+        Returns:
+            [bool] -- [Whether a batch was written, a point where the import can be checkpointed]
+        """
+        self._batch.append(bookmark)
+        if len(self._batch) < self.batch_size:
+            return False
+        self.flush()
+        return True
+
+    def flush(self):
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+        titles = [record.board_title if isinstance(record, Prepared) else boardTitle(record) for record in batch]
+        self._resolve_boards(set(titles))
+        for title, record in zip(titles, batch):
+            if not isinstance(record, Prepared):
+                self.writer.add(bookmarkRow(record), self.boards[title])
+            elif record.error is not None:
+                self.writer.add_error(record.error)
+            else:
+                self.writer.add_document(record.document, self.boards[title])
+        self.writer.flush()
+
+    def mark(self, batch):
+        """[Marks the items written from now on as batch, see ItemWriter.mark]"""
+        self.writer.mark(batch)
+
+    def close(self):
+        """[Writes what is still queued]
+
+        Returns:
+            [dict] -- [Counts of the import]
+        """
+        self.flush()
+        return self.counts()
+
+    def counts(self):
+        return {'count': self.writer.rows, 'inserted': self.writer.inserted, 'duplicates': self.writer.duplicates,
+                'errors': self.writer.errors, 'boards_created': self.boards_created}
+
+    def _resolve_boards(self, titles):
+        titles = [title for title in titles if title not in self.boards]
+        if not titles:
+            return
+        found = reads.boards().find({'added_by': self.user_id, 'title': {'$in': titles}},
+                                    reads.projection(BoardSummary.FIELDS)).sort('created_at', 1)
+        for board in found:
+            # The oldest board wins when the user has several with the same title
+            self.boards.setdefault(board['title'], board)
+        missing = [title for title in titles if title not in self.boards]
+        if missing:
+            self._create_boards(missing)
+
+    def _create_boards(self, titles):
+        documents = []
+        for title in titles:
+            board = Board(title=title, color=generateBoardColor(), added_by=self.user_id)
+            board.prepare()
+            board.validate()
+            documents.append(board.to_mongo())
+        try:
+            reads.boards().insert_many(documents, ordered=False)
+            created = documents
+        except BulkWriteError as e:
+            # A generated slug the user already has, those boards are saved one by one with fresh slugs
+            failed = {error['index'] for error in e.details['writeErrors']}
+            created = [document for position, document in enumerate(documents) if position not in failed]
+            for position in failed:
+                board = Board(title=titles[position], color=generateBoardColor(), added_by=self.user_id)
+                board.save()
+                created.append(board.to_mongo())
+        for document in created:
+            self.boards[document['title']] = document
+        self.boards_created += len(created)
+        User.bump_version(self.user_id)
+        responseCache.invalidate(self.user_id, BOARDS_SCOPE)
+
+
+def importBookmarks(user_id, bookmarks, batch_size=DEFAULT_CHUNK_SIZE):
+    """[Writes every Bookmark record of an iterable for the user]
+
+    Returns:
+        [dict] -- [Counts of the import]
+    """
+    pipeline = ImportPipeline(user_id, batch_size)
+    for bookmark in bookmarks:
+        pipeline.add(bookmark)
+    return pipeline.close()
@@ -0,0 +1,79 @@
+import csv
+from collections import namedtuple
+
+from importers import browserjson, csvfile, netscape, urllist
+
+# Bytes read to tell the format of an upload
+SNIFF_BYTES = 8 * 1024
+
+Importer = namedtuple('Importer', ('name', 'sniff', 'parse'))
+
+IMPORTERS = []
+
+
+def register(name, sniff, parse):
+    """[Adds a format, formats are tried in the order they were registered]
+
+    Arguments:
+        name {[string]} -- [Name stored on the job]
+        sniff {[function]} -- [Takes the first SNIFF_BYTES of a file, without BOM or leading whitespace,
+                               and tells whether the file is in this format]
+        parse {[function]} -- [Takes a seekable binary stream and yields Bookmark records]
+    """
+    IMPORTERS.append(Importer(name, sniff, parse))
+
+
+def detect(head):
+    """[Importer of a file from its first bytes, None when no format matches]"""
+    if head.startswith(b'\xef\xbb\xbf'):
+        head = head[3:]
+    head = head.lstrip()
+    return next((importer for importer in IMPORTERS if importer.sniff(head)), None)
+
+
+def _firstLine(head):
+    return head.split(b'\n', 1)[0].decode('utf-8', 'replace')
+
+
+def sniffNetscape(head):
+    if not head.startswith(b'<'):
+        return False
+    head = head.lower()
+    if b'<!doctype netscape-bookmark-file' in head:
+        return True
+    # Files without the doctype still have their links in a <DL> of <DT>, and Pocket's HTML export is a
+    # list of links the Netscape parser reads as well; other HTML, XML, OPML or RSS is no bookmark file
+    return b'<a href' in head and (b'<dt' in head or b'<title>pocket export</title>' in head)
+
+
+def sniffChrome(head):
+    return head.startswith(b'{') and b'"roots"' in head
+
+
+def sniffFirefox(head):
+    return head.startswith((b'{', b'[')) and b'text/x-moz-place' in head
+
+
+def sniffJSON(head):
+    return head.startswith((b'{', b'['))
+
+
+def sniffCSV(head):
+    try:
+        return csvfile.columns(next(csv.reader([_firstLine(head)]), [])) is not None
+    except csv.Error:
+        return False
+
+
+def sniffURLs(head):
+    line = _firstLine(head).strip()
+    return '://' in line.split(' ', 1)[0]
+
+
+register('netscape', sniffNetscape, netscape.parse)
+register('chrome', sniffChrome, browserjson.parse)
+register('firefox', sniffFirefox, browserjson.parse)
+# Other JSON exports made of objects with a url, in folders with children or not
+register('json', sniffJSON, browserjson.parse)
+register('csv', sniffCSV, csvfile.parse)
+register('urls', sniffURLs, urllist.parse)
@@ -0,0 +1,87 @@
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from importers.netscape import NetscapeParser, FolderScanner, CHUNK_SIZE
+from importers.pipeline import prepareBookmarks
+
+# Bytes a shard reaches before the next folder heading starts a new one
+SHARD_BYTES = 4 * 1024 * 1024
+# Shards parsed ahead of the writer per process, what bounds the memory of an import
+SHARDS_AHEAD = 2
+
+
+def _parseShard(data, state, user_id):
+    parser = NetscapeParser(**state)
+    bookmarks = list(parser.feed(data))
+    bookmarks.extend(parser.close())
+    return list(prepareBookmarks(bookmarks, user_id))
+
+
+def split(stream, shard_bytes=SHARD_BYTES, state=None, chunk_size=CHUNK_SIZE):
+    """[Cuts a Netscape bookmark file into shards at folder headings]
+
+    A FolderScanner reads the file once; every shard starts at a heading with
+    the parser state there, so parsing the shards one after the other gives
+    exactly the records of parsing the whole file.
+
+    Arguments:
+        stream {[file]} -- [Binary stream, positioned at state['offset']]
+        shard_bytes {[int]} -- [Smallest shard, except for the last]
+        state {[dict]} -- [NetscapeParser.state() to start from, the start of the file by default]
+
+    Yields:
+        [tuple] -- [(bytes, state at the start of the shard, state at its end)]
+    """
+    scanner = FolderScanner(shard_bytes, **(state or {}))
+    start = scanner.state()
+    buffer = bytearray()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        buffer += chunk
+        for _ in scanner.feed(chunk):
+            pass
+        for boundary in scanner.boundaries:
+            cut = boundary['offset'] - start['offset']
+            yield bytes(buffer[:cut]), start, boundary
+            del buffer[:cut]
+            start = boundary
+        scanner.boundaries = []
+    yield bytes(buffer), start, dict(scanner.state(), offset=start['offset'] + len(buffer))
+
+
+def parseShards(stream, user_id, processes, shard_bytes=SHARD_BYTES, state=None):
+    """[Prepared records of a Netscape bookmark file, parsed shard by shard in a pool of processes]
+
+    The processes parse their shard and build the item documents, the
+    caller writes them; results come back in file order, so folders are
+    met, and boards created, in the same order as by a single parser. At
+    most SHARDS_AHEAD shards per process are waiting for the caller at any
+    time. Pool processes come from a forkserver, never forked from the
+    worker itself, which holds MongoClient threads and sockets.
+
+    Arguments:
+        stream {[file]} -- [Binary stream, positioned at state['offset']]
+        user_id {[string]} -- [Owner of the items]
+        processes {[int]} -- [Size of the pool]
+        shard_bytes {[int]} -- [Smallest shard]
+        state {[dict]} -- [NetscapeParser.state() to start from]
+
+    Yields:
+        [tuple] -- [(Prepared records of a shard, parser state once they are written)]
+    """
+    pool = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('forkserver'))
+    running = deque()
+    try:
+        for data, start, end in split(stream, shard_bytes, state):
+            running.append((pool.submit(_parseShard, data, start, user_id), end))
+            if len(running) >= processes * SHARDS_AHEAD:
+                future, end = running.popleft()
+                yield future.result(), end
+        while running:
+            future, end = running.popleft()
+            yield future.result(), end
+    finally:
+        pool.shutdown(cancel_futures=True)
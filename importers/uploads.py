@@ -0,0 +1,212 @@
+import datetime
+import itertools
+import zlib
+
+from bson import ObjectId
+from gridfs import GridFSBucket
+from gridfs.errors import NoFile
+
+from database.model import UploadSession
+from importers.netscape import CHUNK_SIZE
+from util.errors import SchemaValidationError, UploadOffsetError
+
+PARTS_BUCKET = 'import_parts'
+# Uploads left alone for this long are dropped with their parts by an idle import worker
+UPLOAD_TTL = datetime.timedelta(days=1)
+GZIP_MAGIC = b'\x1f\x8b'
+# 16 + MAX_WBITS reads a gzip header and trailer around the deflate stream
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def parts():
+    return GridFSBucket(UploadSession._get_db(), bucket_name=PARTS_BUCKET)
+
+
+def sessions():
+    return UploadSession._get_collection()
+
+
+def chunks(stream, chunk_size=CHUNK_SIZE):
+    """[Chunks read from a binary stream until it ends]"""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def decompressed(data):
+    """[Bytes of an iterable of chunks, gunzipped on the fly when they start with the gzip magic]
+
+    Output comes in pieces of at most CHUNK_SIZE, so a small compressed chunk
+    never inflates into one large buffer. Concatenated gzip members are read
+    one after the other like gzip does.
+
+    Raises:
+        zlib.error: [If the compressed data is corrupt or cut short]
+    """
+    data = iter(data)
+    head = b''
+    for chunk in data:
+        head += chunk
+        if len(head) >= len(GZIP_MAGIC):
+            break
+    if not head.startswith(GZIP_MAGIC):
+        if head:
+            yield head
+        yield from data
+        return
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    for chunk in itertools.chain([head], data):
+        while chunk:
+            output = decompressor.decompress(chunk, CHUNK_SIZE)
+            if output:
+                yield output
+            if decompressor.eof:
+                chunk = decompressor.unused_data
+                if chunk:
+                    decompressor = zlib.decompressobj(GZIP_WBITS)
+            else:
+                chunk = decompressor.unconsumed_tail
+    output = decompressor.flush()
+    if output:
+        yield output
+    if not decompressor.eof:
+        raise zlib.error("Compressed upload ends early")
+
+
+class ChunkReader:
+    """[Read-only binary file over an iterable of chunks, what GridFS uploads and the parser read from]"""
+
+    def __init__(self, data):
+        self._data = iter(data)
+        self._buffer = b''
+        self.consumed = 0
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._data, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        self.consumed += len(data)
+        return data
+
+
+def openUpload(stream):
+    """[Bookmark file of a request stream, decompressed when it was sent gzipped]"""
+    return ChunkReader(decompressed(chunks(stream)))
+
+
+def uploadReader(part_ids):
+    """[Bookmark file put together from the parts of a chunked upload, decompressed when it was sent gzipped]"""
+    def read():
+        for part_id in part_ids:
+            with parts().open_download_stream(part_id) as part:
+                yield from chunks(part)
+    return ChunkReader(decompressed(read()))
+
+
+def createUpload(user_id, filename=None, size=None):
+    """[Opens a chunked upload]
+
+    Arguments:
+        user_id {[string]} -- [JWT identity]
+        filename {[string]} -- [Name of the file on the client, kept for display]
+        size {[int]} -- [Total bytes if already known]
+
+    Returns:
+        [UploadSession]
+    """
+    session = UploadSession(added_by=ObjectId(user_id), filename=filename, size=size)
+    session.save()
+    return session
+
+
+def writeChunk(session, start, end, total, stream):
+    """[Stores the byte range start-end, both inclusive, of an upload as one GridFS part]
+
+    The body is streamed into GridFS, and the range only counts once the
+    upload's offset still equals start, so a retried or concurrent PUT of
+    the same range never stores its bytes twice.
+
+    Arguments:
+        session {[UploadSession]} -- [Open upload]
+        start {[int]} -- [First byte of the range]
+        end {[int]} -- [Last byte of the range]
+        total {[int]} -- [Total bytes, None when the client does not know yet]
+        stream {[file]} -- [Request body]
+
+    Raises:
+        UploadOffsetError: [If start is not where the upload stands]
+        SchemaValidationError: [If the range is invalid or the body is not as long as the range]
+
+    Returns:
+        [int] -- [Bytes received so far]
+    """
+    if session.status != 'open' or start != session.received:
+        raise UploadOffsetError
+    if total is not None and session.size is not None and total != session.size:
+        raise SchemaValidationError
+    size = session.size if total is None else total
+    if end < start or (size is not None and end >= size):
+        raise SchemaValidationError
+    body = ChunkReader(chunks(stream))
+    part_id = storeStream(parts(), '%s.%d' % (session.id, start), body)
+    if body.consumed != end - start + 1:
+        discardParts([part_id])
+        raise SchemaValidationError
+    updated = sessions().update_one(
+        {'_id': session.id, 'status': 'open', 'received': start},
+        {'$set': {'received': end + 1, 'size': size, 'modified_at': datetime.datetime.now()},
+         '$push': {'parts': part_id}})
+    if not updated.modified_count:
+        discardParts([part_id])
+        raise UploadOffsetError
+    return end + 1
+
+
+def storeStream(bucket, filename, stream):
+    """[Writes a binary stream to a GridFS bucket, dropping the chunks already written if the stream fails]
+
+    upload_from_stream leaves them behind without a file document when
+    reading raises, a client gone mid-PUT or a corrupt gzip.
+
+    Returns:
+        [ObjectId] -- [Id of the file]
+    """
+    grid_in = bucket.open_upload_stream(filename)
+    try:
+        grid_in.write(stream)
+        grid_in.close()
+    except Exception:
+        grid_in.abort()
+        raise
+    return grid_in._id
+
+
+def discardParts(part_ids):
+    bucket = parts()
+    for part_id in part_ids:
+        try:
+            bucket.delete(part_id)
+        except NoFile:
+            pass
+
+
+def discardExpiredUploads():
+    """[Drops open uploads nobody added to for UPLOAD_TTL, with their parts]
+
+    Returns:
+        [int] -- [Uploads dropped]
+    """
+    expired = {'status': 'open', 'modified_at': {'$lt': datetime.datetime.now() - UPLOAD_TTL}}
+    dropped = 0
+    for session in sessions().find(expired, {'parts': 1}):
+        if sessions().delete_one(dict(expired, _id=session['_id'])).deleted_count:
+            discardParts(session.get('parts', []))
+            dropped += 1
+    return dropped
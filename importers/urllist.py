@@ -0,0 +1,50 @@
+import codecs
+
+from importers.netscape import Bookmark, CHUNK_SIZE, MAX_TEXT_BYTES
+
+
+def lines(stream, chunk_size=CHUNK_SIZE, cut=True):
+    """[Lines of a UTF-8 text stream read a chunk at a time, with their line ends]
+
+    A line longer than MAX_TEXT_BYTES is cut into pieces of that size, or
+    left out when cut is false, so memory stays bounded.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8-sig')('replace')
+    pending = ''
+    skipping = False
+    while True:
+        chunk = stream.read(chunk_size)
+        pending += decoder.decode(chunk, final=not chunk)
+        # The last piece is the start of a line the next chunk finishes
+        *complete, pending = pending.split('\n')
+        for line in complete:
+            if skipping:
+                # The end of the line left out
+                skipping = False
+            elif cut or len(line) <= MAX_TEXT_BYTES:
+                yield line + '\n'
+        if not chunk:
+            if pending and not skipping and (cut or len(pending) <= MAX_TEXT_BYTES):
+                yield pending
+            return
+        if len(pending) > MAX_TEXT_BYTES and not cut:
+            pending, skipping = '', True
+        while len(pending) > MAX_TEXT_BYTES:
+            yield pending[:MAX_TEXT_BYTES]
+            pending = pending[MAX_TEXT_BYTES:]
+
+
+def parse(stream, chunk_size=CHUNK_SIZE):
+    """[Bookmarks of a plain list of URLs, one per line with an optional title after it]
+
+    Blank lines and lines starting with # are skipped.
+
+    Yields:
+        [Bookmark]
+    """
+    for line in lines(stream, chunk_size):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        href, _, title = line.partition(' ')
+        yield Bookmark((), title.strip() or href, href, None, [])
@@ -0,0 +1,62 @@
+import json
+
+from flask import Response, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_restful import Resource
+
+from database import reads
+from util.autocomplete import autocomplete, DEFAULT_SUGGESTIONS, MAX_SUGGESTIONS
+from util.conditional import versionTag, notModified, cacheHeaders
+from util.errors import InternalServerError, SchemaValidationError
+
+# Suggestion type -> builder of its (text, weight, payload) entries
+SUGGESTIONS = {
+    'board': reads.board_suggestions,
+    'tag': reads.tag_suggestions,
+}
+
+
+class AutocompleteApi(Resource):
+    """[Prefix suggestions for the board picker and tag inputs]
+    """
+
+    @jwt_required()
+    def get(self):
+        """[Retrieves the user's most used boards or tags with a word starting with the typed prefix]
+
+        Query:
+            type {[string]} -- [`board` or `tag`]
+            q {[string]} -- [Typed prefix, the most used ones overall when empty]
+            limit {[int]} -- [Number of suggestions]
+
+        Raises:
+            SchemaValidationError: [If the type or limit is invalid]
+            InternalServerError: [If Error in retrieval]
+
+        Returns:
+            [json] -- [Json object with message and status code, suggestions carry `value` and `count`]
+        """
+        kind = request.args.get('type')
+        if kind not in SUGGESTIONS:
+            raise SchemaValidationError
+        try:
+            limit = int(request.args.get('limit', DEFAULT_SUGGESTIONS))
+        except ValueError:
+            raise SchemaValidationError
+        if not 0 < limit <= MAX_SUGGESTIONS:
+            raise SchemaValidationError
+        try:
+            user_id = get_jwt_identity()
+            version = reads.change_version(user_id)
+            tag = versionTag(user_id, version)
+            unchanged = notModified(tag)
+            if unchanged is not None:
+                return unchanged
+            index = autocomplete.index(user_id, kind, version, lambda: SUGGESTIONS[kind](user_id))
+            suggestions = [dict(payload, value=text, count=weight)
+                           for text, weight, payload in index.top(request.args.get('q', ''), limit)]
+            data = json.dumps({'data': suggestions, 'message': "Successfully retrieved", 'count': len(suggestions)})
+            return Response(data, mimetype="application/json", status=200, headers=cacheHeaders(tag))
+        except Exception as e:
+            print(e)
+            raise InternalServerError
@@ -1,17 +1,27 @@
+import datetime
+import zlib
+
 from flask import Response, request
 from werkzeug.utils import secure_filename
 
-from database.model import Item, User, Board
+from database import reads
+from database.bulk import ItemWriter, move_items, retag_items, delete_items
+from database.model import Item, User, Board, BoardSummary, Tombstone
+from importers.jobs import importQueue
+from importers.uploads import openUpload
 from flask_restful import Resource
 from mongoengine.errors import FieldDoesNotExist, NotUniqueError, DoesNotExist, ValidationError, InvalidQueryError
+from util.cache import responseCache, boardScope, BOARDS_SCOPE
+from util.conditional import versionTag, notModified, cacheHeaders
 from util.errors import SchemaValidationError, InternalServerError, DeletingItemError, ItemNotExistsError, \
     ItemAlreadyExistsError, UpdatingItemError
-from util.helpers import validateURL
+from util.helpers import validateURL, fieldsArg, splitTags
+from util.pagination import pageArgs, pageCursor, pageHeaders
+from util.serializers import encode, streamEnvelope, STREAM_BATCH_SIZE
 import json
 from util.slugGenerator import generateSlug
 from flask_jwt_extended import jwt_required, get_jwt_identity
 # from util.summariser import summarize, get_keywords
-from bson.json_util import dumps
 from bson import ObjectId
 import requests
 from bookmarks_converter import BookmarksConverter
@@ -23,28 +33,46 @@ class ItemsApi(Resource):
 
     @jwt_required()
     def get(self):
-        """[Retrieves all Items]
+        """[Retrieves one page of the user's Items, newest first]
+
+        Query:
+            limit {[int]} -- [Page size]
+            after {[string]} -- [Cursor from the `next` of the previous page]
+            tag {[string]} -- [Only items carrying this tag]
+            fields {[string]} -- [Comma separated fields to return, all by default]
 
         Raises:
+            SchemaValidationError: [If the paging or field arguments are invalid]
             InternalServerError: [If Error in retrieval]
 
         Returns:
             [json] -- [Json object with message and status code]
         """
+        limit, after = pageArgs()
+        fields = fieldsArg(reads.ITEM_FIELDS)
         try:
-            items = Item.objects().to_json()
-            print(type(items))
-            data = {'data': json.loads(items), 'message': "Successfully retrieved", "count": len(json.loads(items))}
-            data = json.dumps(data)
-            response = Response(data, mimetype="application/json", status=200)
-            return response
+            user_id = get_jwt_identity()
+            tag = versionTag(user_id)
+            unchanged = notModified(tag)
+            if unchanged is not None:
+                return unchanged
+            query = reads.item_query(user_id, tag=request.args.get('tag'))
+            items, next_cursor = pageCursor(reads.items(), query, limit, after, STREAM_BATCH_SIZE,
+                                            reads.projection(fields))
+            data = streamEnvelope(items, "Successfully retrieved", next=next_cursor)
+            return Response(data, mimetype="application/json", status=200,
+                            headers=dict(pageHeaders(next_cursor), **cacheHeaders(tag)))
         except Exception as e:
+            print(e)
             raise InternalServerError
 
     @jwt_required()
     def post(self):
         """[Batch Item API]
 
+        Saving a URL the user already saved, in any spelling that canonicalizes
+        to the same URL, returns the existing item with `duplicate` set.
+
         Raises:
             SchemaValidationError: [If there are validation error in the item data]
             ItemAlreadyExistsError: [If the item already exist]
@@ -82,11 +110,23 @@ class ItemsApi(Resource):
 
         try:
             user_id = get_jwt_identity()
-            user = User.objects.get(id=user_id)
-            newBoard = Board.objects.get(slug=board)
+            if reads.identity(user_id) is None:
+                raise DoesNotExist
+            newBoard = Board.objects.get(slug=board, added_by=user_id)
             body['board'] = newBoard
-            item = Item(**body, added_by=user, )
-            item.save()
+            item = Item(**body, added_by=ObjectId(user_id), )
+            try:
+                item.save()
+            except NotUniqueError:
+                # The unique (added_by, url_hash) index found the URL, answer with the item saved first
+                existing = reads.find_item_by_url(user_id, item.url_hash)
+                if existing is None:
+                    raise
+                data = encode({'id': str(existing['_id']), 'data': existing, 'duplicate': True,
+                               'message': "Already saved"})
+                return Response(data, mimetype="application/json", status=200)
+            User.bump_version(user_id)
+            responseCache.invalidate(user_id, BOARDS_SCOPE, boardScope(newBoard.slug))
             item_id = item.id
             data = json.dumps({'id': str(item_id), 'message': "Successfully inserted"})
             return Response(data, mimetype="application/json", status=200)
@@ -100,6 +140,165 @@ class ItemsApi(Resource):
             raise InternalServerError
 
 
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/x-jsonlines')
+# Rows read from one batch request, the rest of the body is left unread and the response says so
+MAX_BATCH_ROWS = 10000
+
+
+def _batch_rows():
+    """[Rows of a batch request, parsed one line at a time for NDJSON so the body is never held whole]"""
+    if request.mimetype in NDJSON_MIMETYPES:
+        for line in request.stream:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None
+        return
+    rows = request.get_json(silent=True)
+    if not isinstance(rows, list):
+        raise SchemaValidationError
+    yield from rows
+
+
+class ItemsBatchApi(Resource):
+    """[Bulk Item creation]
+    """
+
+    @jwt_required()
+    def post(self):
+        """[Creates many items in one request, from a JSON array or an NDJSON body]
+
+        Every row takes the fields of POST /api/items. Rows are written in
+        chunks and each gets a status: `created` with the new id, `duplicate`
+        with the id of the item already saved under the URL, or `error`.
+
+        Raises:
+            SchemaValidationError: [If the body is neither a JSON array nor NDJSON]
+            ItemNotExistsError: [If the user does not exist]
+            InternalServerError: [Error in insertion]
+
+        Returns:
+            [json] -- [Json object with the per row statuses and counts]
+        """
+        try:
+            user_id = get_jwt_identity()
+            if reads.identity(user_id) is None:
+                raise DoesNotExist
+            writer = ItemWriter(user_id)
+            truncated = False
+            for row in _batch_rows():
+                if writer.rows == MAX_BATCH_ROWS:
+                    truncated = True
+                    break
+                writer.add(row)
+            statuses = writer.close()
+            data = json.dumps({'data': statuses, 'count': len(statuses), 'inserted': writer.inserted,
+                               'duplicates': writer.duplicates, 'errors': writer.errors, 'truncated': truncated,
+                               'message': "Successfully inserted"})
+            return Response(data, mimetype="application/json", status=200)
+        except SchemaValidationError:
+            raise
+        except DoesNotExist:
+            raise ItemNotExistsError
+        except Exception as e:
+            print(e)
+            raise InternalServerError
+
+
+# Ids accepted by one bulk request
+MAX_BULK_IDS = 10000
+BULK_FILTERS = ('board', 'tag', 'domain')
+
+
+def _bulk_query(user_id, body):
+    """[Item filter of a bulk request, from its `ids` and its `filter` of board slug, tag and domain]"""
+    ids = body.get('ids')
+    criteria = body.get('filter') or {}
+    if not ids and not criteria:
+        raise SchemaValidationError
+    if not isinstance(criteria, dict) or set(criteria) - set(BULK_FILTERS) or \
+            any(not isinstance(value, str) for value in criteria.values()):
+        raise SchemaValidationError
+    query = {}
+    if ids:
+        if not isinstance(ids, list) or len(ids) > MAX_BULK_IDS:
+            raise SchemaValidationError
+        object_ids = [reads.object_id(item_id) for item_id in ids]
+        if None in object_ids:
+            raise SchemaValidationError
+        query['_id'] = {'$in': object_ids}
+    if criteria.get('board'):
+        query['board'] = reads.find_board_id(user_id, criteria['board'])
+        if query['board'] is None:
+            raise DoesNotExist
+    if criteria.get('tag'):
+        query['tags'] = criteria['tag']
+    if criteria.get('domain'):
+        query['url'] = reads.domain_pattern(criteria['domain'])
+    return query
+
+
+class ItemsBulkApi(Resource):
+    """[Bulk Item changes]
+    """
+
+    @jwt_required()
+    def post(self):
+        """[Moves, retags or deletes every item picked by ids or a filter, in one write]
+
+        Body:
+            action {[string]} -- [`move`, `tag` or `delete`]
+            ids {[list]} -- [Item ids]
+            filter {[dict]} -- [Any of `board` (slug), `tag` and `domain`, combined with ids when both are given]
+            board {[string]} -- [Target board slug for `move`]
+            add {[list]} -- [Tags to add for `tag`]
+            remove {[list]} -- [Tags to remove for `tag`]
+
+        Raises:
+            SchemaValidationError: [If the action, ids or filter are invalid]
+            ItemNotExistsError: [If a board does not exist]
+            InternalServerError: [Error in update]
+
+        Returns:
+            [json] -- [Json object with message and the matched and modified (or deleted) counts]
+        """
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            raise SchemaValidationError
+        action = body.get('action')
+        try:
+            user_id = get_jwt_identity()
+            query = _bulk_query(user_id, body)
+            if action == 'move':
+                board = reads.find_board(user_id, body.get('board'), ('slug',) + BoardSummary.FIELDS)
+                if board is None:
+                    raise DoesNotExist
+                result = move_items(user_id, query, board)
+                counts = {'matched': result.matched_count, 'modified': result.modified_count}
+            elif action == 'tag':
+                add, remove = splitTags(body.get('add')), splitTags(body.get('remove'))
+                if not add and not remove:
+                    raise SchemaValidationError
+                result = retag_items(user_id, query, add, remove)
+                counts = {'matched': result.matched_count, 'modified': result.modified_count}
+            elif action == 'delete':
+                matched, deleted = delete_items(user_id, query)
+                counts = {'matched': matched, 'deleted': deleted}
+            else:
+                raise SchemaValidationError
+            data = json.dumps(dict(counts, message="Successfully updated"))
+            return Response(data, mimetype="application/json", status=200)
+        except SchemaValidationError:
+            raise
+        except DoesNotExist:
+            raise ItemNotExistsError
+        except Exception as e:
+            print(e)
+            raise InternalServerError
+
+
 class ItemApi(Resource):
     """[Individual Item actions]
     """
@@ -114,6 +313,7 @@ class ItemApi(Resource):
         Raises:
             SchemaValidationError: [If there are validation error in the item data]
             UpdatingItemError: [Error in update]
+            ItemAlreadyExistsError: [If another item of the user already has the new URL]
             InternalServerError: [Error in insertion]
 
         Returns:
@@ -141,13 +341,22 @@ class ItemApi(Resource):
         try:
             user_id = get_jwt_identity()
             body = request.get_json()
-            Item.objects.get(id=id, added_by=user_id).update(**body)
+            item = Item.objects.get(id=id, added_by=user_id)
+            body['board'] = _user_board(user_id, board)
+            body['board_summary'] = BoardSummary.of(body['board'])
+            body['modified_at'] = datetime.datetime.now()
+            item.update(**body)
+            User.bump_version(user_id)
+            responseCache.invalidate(user_id, BOARDS_SCOPE, boardScope(_board_slug(item)),
+                                     boardScope(body['board'].slug))
             data = json.dumps({'message': "Successfully updated"})
             return Response(data, mimetype="application/json", status=200)
         except InvalidQueryError:
             raise SchemaValidationError
         except DoesNotExist:
             raise UpdatingItemError
+        except NotUniqueError:
+            raise ItemAlreadyExistsError
         except Exception:
             raise InternalServerError
 
@@ -169,6 +378,9 @@ class ItemApi(Resource):
             user_id = get_jwt_identity()
             item = Item.objects.get(id=id, added_by=user_id)
             item.delete()
+            Tombstone.record(user_id, 'item', [item.id])
+            User.bump_version(user_id)
+            responseCache.invalidate(user_id, BOARDS_SCOPE, boardScope(_board_slug(item)))
             data = json.dumps({'message': "Successfully deleted"})
             return Response(data, mimetype="application/json", status=200)
         except DoesNotExist:
@@ -183,28 +395,33 @@ class ItemApi(Resource):
         Arguments:
             id {[Object ID]} -- [Mongo Object ID]
 
+        Query:
+            fields {[string]} -- [Comma separated fields to return, all by default]
+
         Raises:
+            SchemaValidationError: [If an unknown field is requested]
             ItemNotExistsError: [Can't find the item item]
             InternalServerError: [Error in insertion]
 
         Returns:
             [json] -- [Json object with message and status code]
         """
+        fields = fieldsArg(reads.ITEM_FIELDS)
         try:
             user_id = get_jwt_identity()
-            items = Item.objects.aggregate(
-                {"$match": {"_id": ObjectId(id)}},
-                {"$lookup": {
-                    "from": "board",
-                    "foreignField": "_id",
-                    "localField": "board",
-                    "as": "board",
-                }},
-                {"$unwind": "$board"},
-            )
-            item = list(items)
-            data = dumps({'data': item[0], 'message': "Successfully retrieved"})
-            return Response(data, mimetype="application/json", status=200)
+            tag = versionTag(user_id)
+            unchanged = notModified(tag)
+            if unchanged is not None:
+                return unchanged
+            stored = fields + ('board_summary',) if 'board' in fields else fields
+            item = reads.find_item(user_id, id, stored)
+            if item is None:
+                raise DoesNotExist
+            if 'board' in fields:
+                item['board'] = dict(reads.item_board_summary(item), _id=item['board'])
+                del item['board_summary']
+            data = encode({'data': item, 'message': "Successfully retrieved"})
+            return Response(data, mimetype="application/json", status=200, headers=cacheHeaders(tag))
         except DoesNotExist:
             raise ItemNotExistsError
         except Exception as e:
@@ -212,89 +429,57 @@ class ItemApi(Resource):
             raise InternalServerError
 
 
+def _user_board(user_id, board):
+    """[Resolves the board sent by a client, either its slug or its id, to the user's Board]"""
+    if isinstance(board, str) and ObjectId.is_valid(board):
+        found = Board.objects(id=board, added_by=user_id).first()
+        if found is not None:
+            return found
+    return Board.objects.get(slug=board, added_by=user_id)
+
+
+def _board_slug(item):
+    """[Slug of the board an Item is on, from the embedded summary when it has one]"""
+    if item.board_summary is not None:
+        return item.board_summary.slug
+    return getattr(item.board, 'slug', None)
+
+
 class UploadURLs(Resource):
-    """[Individual Item actions]
-        """
+    """[Bookmark file import]
+    """
 
     @jwt_required()
     def post(self):
-        """[Updating single]
+        """[Queues the import of a bookmark file in any format importers/registry.py knows]
 
-        Arguments:
-            id {[Object ID]} -- [Mongo Object ID]
+        The file, the `file` upload of a multipart form or the raw request
+        body, gzipped or not, is stored in GridFS and imported by
+        `flask import-worker`; its progress is at /api/jobs/<id>. Large files
+        are better sent in ranges through /api/uploads.
 
         Raises:
-            SchemaValidationError: [If there are validation error in the item data]
-            UpdatingItemError: [Error in update]
-            InternalServerError: [Error in insertion]
+            ItemAlreadyExistsError: [If the user does not exist]
+            SchemaValidationError: [If a gzipped file is corrupt]
+            InternalServerError: [Error in queueing]
 
         Returns:
-            [json] -- [Json object with message and status code]
+            [json] -- [Json object with message and the job id, status 202]
         """
-        from bs4 import BeautifulSoup, NavigableString, Tag
+        upload = request.files.get('file')
+        stream = upload.stream if upload is not None else request.stream
         try:
-
-            if request.method == 'POST':
-                # upload = request.files['file']
-                # # print(upload)
-                # # path = upload.temporary_file_path
-                f = request.files['file']
-
-                fic = open(f.filename, "r")
-
-                from time import strftime, localtime
-                import sys
-                sys.setrecursionlimit(10000)
-
-                from bs4 import BeautifulSoup
-                soup = BeautifulSoup(fic, 'lxml')
-                item = soup.find_all('dl')[3]
-
-                dt = soup.find_all('dt')
-                boards = []
-                body = {}
-                folder_name = ''
-                for i in dt:
-                    n = i.find_next()
-                    if n.name == 'h3':
-                        folder_name = n.text
-                        boards.append(folder_name)
-                        continue
-                    else:
-                        user_id = get_jwt_identity()
-                        user = User.objects.get(id=user_id)
-                        # new_time = strftime('%Y-%m-%d %H:%M:%S', localtime(n.get("add_date")))
-                        # print(new_time)
-                        body['source'] = n.text
-                        if n.get("tags") or n.get("href") is not None:
-                            body['tags'] = n.get("tags")
-                        if n.get("href") or n.get("href") is not None:
-                            body['source_url'] = n.get("href")
-                        # if n.get("add_date"):
-                        #     body['bookmark_created'] = int({n.get("add_date")})
-                        body['board'] = folder_name
-                        item = Item(**body, added_by=user, )
-                        item.save()
-                        item_id = item.id
-
-                        # if folder_name == "Other Bookmarks":
-                        #     print(f'url = {n.get("href")}')
-                        #     print(f'website name = {n.text}')
-                        #     print(f'add date = {n.get("add_date")}')
-                        #     print(f'folder name = {folder_name}')
-
-                items = Item.objects().to_json()
-                data = json.dumps(
-                    {'id': str(item_id), 'count': len(json.loads(items)), 'message': "Successfully inserted"})
-                return Response(data, mimetype="application/json", status=200)
-
-
-        except InvalidQueryError:
-            raise SchemaValidationError
+            user_id = get_jwt_identity()
+            if reads.identity(user_id) is None:
+                raise DoesNotExist
+            job = importQueue.enqueue(user_id, openUpload(stream), upload.filename if upload is not None else None)
+            data = json.dumps({'id': str(job.id), 'status': job.status, 'message': "Import queued"})
+            return Response(data, mimetype="application/json", status=202,
+                            headers={'Location': '/api/jobs/%s' % job.id})
         except DoesNotExist:
             raise ItemAlreadyExistsError
+        except zlib.error:
+            raise SchemaValidationError
         except Exception as e:
-            print(n.get("tags"))
-            print({n.get("text")})
             print(e)
             raise InternalServerError
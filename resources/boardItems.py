@@ -1,12 +1,16 @@
 from bson import ObjectId
-from bson.json_util import dumps
-from flask import Response
+from flask import Response, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from flask_restful import Resource
 from mongoengine.errors import DoesNotExist
 
-from database.model import Item, Board
+from database import reads
+from util.cache import cachedResponse, cacheBody, boardScope
+from util.conditional import versionTag, notModified, cacheHeaders
 from util.errors import InternalServerError, ItemNotExistsError
+from util.helpers import fieldsArg
+from util.pagination import pageArgs, pageCursor, pageHeaders
+from util.serializers import streamEnvelope, STREAM_BATCH_SIZE
 import json
 
 
@@ -16,18 +20,35 @@ class ByBoardApi(Resource):
 
     @jwt_required()
     def get(self, id):
-        """[Retrieves all Items under a board]
-        
+        """[Retrieves one page of the Items under a board, newest first]
+
+        Query:
+            limit {[int]} -- [Page size]
+            after {[string]} -- [Cursor from the `next` of the previous page]
+            tag {[string]} -- [Only items carrying this tag]
+            fields {[string]} -- [Comma separated fields to return, all by default]
+
         Raises:
+            SchemaValidationError: [If the paging or field arguments are invalid]
             InternalServerError: [If Error in retrieval]
         
         Returns:
             [json] -- [Json object with message and status code]
         """
+        limit, after = pageArgs()
+        fields = fieldsArg(reads.ITEM_FIELDS)
         try:
-            print(id)
             user_id = get_jwt_identity()
-            user_board = Board.objects.get(slug=id, added_by=user_id)
+            tag = versionTag(user_id)
+            unchanged = notModified(tag)
+            if unchanged is not None:
+                return unchanged
+            hit = cachedResponse(user_id, boardScope(id), tag)
+            if hit is not None:
+                return hit
+            board_id = reads.find_board_id(user_id, id)
+            if board_id is None:
+                raise DoesNotExist
             # posts = Item.objects.aggregate(
             #     {"$lookup": {
             #         "from": "board",
@@ -44,10 +65,13 @@ class ByBoardApi(Resource):
             #             }
             #         }
             #     }, {"$sort": {"created_at": 1}})
-            items = Item.objects(board=user_board.id, added_by=user_id).to_json()
-            data = json.dumps(
-                {'data': json.loads(items), 'message': "Successfully retrieved", "count": len(json.loads(items))})
-            return Response(data, mimetype="application/json", status=200)
+            query = reads.item_query(user_id, board_id, request.args.get('tag'))
+            items, next_cursor = pageCursor(reads.items(), query, limit, after, STREAM_BATCH_SIZE,
+                                            reads.projection(fields))
+            data = streamEnvelope(items, "Successfully retrieved", next=next_cursor)
+            headers = dict(pageHeaders(next_cursor), **cacheHeaders(tag))
+            data = cacheBody(user_id, boardScope(id), tag, headers, data)
+            return Response(data, mimetype="application/json", status=200, headers=headers)
         except  DoesNotExist:
             raise ItemNotExistsError
         except Exception as e:
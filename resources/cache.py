@@ -0,0 +1,31 @@
+import json
+
+from flask import Response, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_restful import Resource
+
+from util.autocomplete import autocomplete
+from util.cache import responseCache
+from util.errors import OperatorOnlyError
+from util.sharedCache import sharedCache
+
+
+class CacheStatsApi(Resource):
+    """[Response cache counters of the worker that serves the request, for the users listed in OPERATOR_IDS]
+    """
+
+    @jwt_required()
+    def get(self):
+        """[Retrieves hit, miss, eviction and size counters used to size the caches]
+
+        Raises:
+            OperatorOnlyError: [If the user is not an operator]
+
+        Returns:
+            [json] -- [Json object with message and status code]
+        """
+        if get_jwt_identity() not in current_app.config.get('OPERATOR_IDS', ()):
+            raise OperatorOnlyError
+        stats = dict(responseCache.stats(), shared=sharedCache.stats(), autocomplete=autocomplete.stats())
+        data = json.dumps({'data': stats, 'message': "Successfully retrieved"})
+        return Response(data, mimetype="application/json", status=200)
@@ -2,16 +2,29 @@ import json
 
 import datetime
 import timeago
-from bson.json_util import dumps
 from bson.objectid import ObjectId
 from flask import Response, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from flask_restful import Resource
 from mongoengine.errors import FieldDoesNotExist, NotUniqueError, DoesNotExist, ValidationError, InvalidQueryError
 
-from database.model import Board, User
+from database import reads
+from database.bulk import merge_boards
+from database.model import Board, BoardSummary, Tombstone, User
+from util.cache import responseCache, cachedResponse, cacheBody, boardScope, BOARDS_SCOPE
+from util.conditional import versionTag, notModified, cacheHeaders
 from util.errors import SchemaValidationError, UpdatingItemError, ItemAlreadyExistsError, InternalServerError, \
     DeletingItemError, ItemNotExistsError
+from util.helpers import fieldsArg
+from util.pagination import pageArgs, pageAggregate, pageHeaders
+from util.serializers import encode, streamEnvelope, STREAM_BATCH_SIZE
+from util.sharedCache import sharedCache
+
+
+# Computed per board rather than stored, still selectable through ?fields=
+BOARD_EXTRA_FIELDS = ('time_stamp',) + reads.BOARD_STATS_FIELDS
+# Without ?fields=, clients format created_at themselves rather than get the relative time_stamp
+BOARD_DEFAULT_FIELDS = reads.BOARD_FIELDS + reads.BOARD_STATS_FIELDS
 
 
 class BoardsApi(Resource):
@@ -20,29 +33,49 @@ class BoardsApi(Resource):
 
     @jwt_required()
     def get(self):
-        """[Retrieves all Boards by user]
+        """[Retrieves one page of the Boards by user, newest first, with item counts and owner]
+
+        Query:
+            limit {[int]} -- [Page size]
+            after {[string]} -- [Cursor from the `next` of the previous page]
+            fields {[string]} -- [Comma separated fields to return, all but time_stamp by default]
 
         Raises:
+            SchemaValidationError: [If the paging or field arguments are invalid]
             InternalServerError: [If Error in retrieval]
 
         Returns:
             [json] -- [Json object with message and status code]
         """
+        limit, after = pageArgs()
+        fields = fieldsArg(reads.BOARD_FIELDS + BOARD_EXTRA_FIELDS, BOARD_DEFAULT_FIELDS)
+        # "5 minutes ago" changes without the change version moving, such responses are built every time
+        fresh = 'time_stamp' in fields
         try:
             user_id = get_jwt_identity()
-            user = User.objects(id=ObjectId(user_id)).only('username')
-            now = datetime.datetime.now()
-            boards = Board.objects(added_by=ObjectId(user_id))
-            boards_list = []
-            for board in boards:
-                board_dict = board.to_mongo().to_dict()
-                data = timeago.format(board.created_at, now)
-                board_dict['time_stamp'] = data
-                board_dict['username'] = user[0].username
-                boards_list.append(board_dict)
-            res = {'data': boards_list, 'message': "Successfully retrieved", "count": len(boards_list)}
-            boards_json = dumps(res)
-            return Response(boards_json, mimetype="application/json", status=200)
+            if not fresh:
+                tag = versionTag(user_id)
+                unchanged = notModified(tag)
+                if unchanged is not None:
+                    return unchanged
+                hit = cachedResponse(user_id, BOARDS_SCOPE, tag)
+                if hit is not None:
+                    return hit
+            stored = [field for field in fields if field not in BOARD_EXTRA_FIELDS]
+            if 'time_stamp' in fields and 'created_at' not in stored:
+                stored.append('created_at')
+            stats = reads.board_stats_stages(user_id, [field for field in fields if field in reads.BOARD_STATS_FIELDS])
+            boards, next_cursor = pageAggregate(reads.boards(), reads.board_query(user_id), limit, after,
+                                                reads.projection(stored), stats)
+            if fresh:
+                boards = _with_time_stamp(boards, 'created_at' in fields, datetime.datetime.now())
+                data = streamEnvelope(boards, "Successfully retrieved", next=next_cursor)
+                headers = dict(pageHeaders(next_cursor), **{'Cache-Control': 'no-store'})
+                return Response(data, mimetype="application/json", status=200, headers=headers)
+            data = streamEnvelope(boards, "Successfully retrieved", next=next_cursor)
+            headers = dict(pageHeaders(next_cursor), **cacheHeaders(tag))
+            data = cacheBody(user_id, BOARDS_SCOPE, tag, headers, data)
+            return Response(data, mimetype="application/json", status=200, headers=headers)
 
         except Exception as e:
             print(e)
@@ -68,12 +101,14 @@ class BoardsApi(Resource):
 
         try:
             user_id = get_jwt_identity()
-            user = User.objects.get(id=user_id)
-            board = Board(**body, added_by=user)
+            if reads.identity(user_id) is None:
+                raise DoesNotExist
+            board = Board(**body, added_by=ObjectId(user_id))
             board.save()
+            User.bump_version(user_id)
+            responseCache.invalidate(user_id, BOARDS_SCOPE)
             slug = board.slug
-            data = json.dumps(
-                {'id': str(slug), 'message': "Successfully inserted", 'board': json.loads(board.to_json())})
+            data = encode({'id': str(slug), 'message': "Successfully inserted", 'board': board.to_mongo()})
             return Response(data, mimetype="application/json", status=200)
         except (FieldDoesNotExist, ValidationError) as e:
             print(e)
@@ -86,6 +121,14 @@ class BoardsApi(Resource):
             raise InternalServerError
 
 
+def _with_time_stamp(boards, keep_created_at, now):
+    for board in boards:
+        board['time_stamp'] = timeago.format(board['created_at'], now)
+        if not keep_created_at:
+            del board['created_at']
+        yield board
+
+
 class BoardApi(Resource):
     """[Individual Board actions]
     """
@@ -108,8 +151,17 @@ class BoardApi(Resource):
         try:
             user_id = get_jwt_identity()
             board = Board.objects.get(id=id, added_by=user_id)
+            slug = board.slug
             body = request.get_json()
-            Board.objects.get(id=id).update(**body)
+            body['modified_at'] = datetime.datetime.now()
+            board.update(**body)
+            board.reload()
+            if any(field in body for field in BoardSummary.FIELDS):
+                board.sync_item_summaries()
+            User.bump_version(user_id)
+            responseCache.invalidate(user_id, BOARDS_SCOPE, boardScope(slug), boardScope(board.slug))
+            if board.slug != slug:
+                sharedCache.delete(reads.board_key(user_id, slug))
             data = json.dumps({'message': "Successfully updated"})
             return Response(data, mimetype="application/json", status=200)
         except InvalidQueryError:
@@ -136,7 +188,12 @@ class BoardApi(Resource):
         try:
             user_id = get_jwt_identity()
             board = Board.objects(slug=id, added_by=user_id)
+            board_ids = list(board.scalar('id'))
             board.delete()
+            Tombstone.record(user_id, 'board', board_ids)
+            User.bump_version(user_id)
+            responseCache.invalidate(user_id, BOARDS_SCOPE, boardScope(id))
+            sharedCache.delete(reads.board_key(user_id, id))
             data = json.dumps({'message': "Successfully deleted"})
             return Response(data, mimetype="application/json", status=200)
         except DoesNotExist:
@@ -161,11 +218,63 @@ class BoardApi(Resource):
         """
         try:
             user_id = get_jwt_identity()
-            boards = Board.objects(slug=id, added_by=user_id).to_json()
-            data = json.dumps(
-                {'data': json.loads(boards), 'message': "Successfully retrieved", "count": len(json.loads(boards))})
-            return Response(data, mimetype="application/json", status=200)
+            tag = versionTag(user_id)
+            unchanged = notModified(tag)
+            if unchanged is not None:
+                return unchanged
+            hit = cachedResponse(user_id, boardScope(id), tag)
+            if hit is not None:
+                return hit
+            boards = reads.boards().find({'slug': id, 'added_by': ObjectId(user_id)},
+                                         reads.projection(reads.BOARD_FIELDS))
+            data = streamEnvelope(boards.batch_size(STREAM_BATCH_SIZE), "Successfully retrieved")
+            headers = cacheHeaders(tag)
+            data = cacheBody(user_id, boardScope(id), tag, headers, data)
+            return Response(data, mimetype="application/json", status=200, headers=headers)
         except DoesNotExist:
             raise ItemNotExistsError
         except Exception:
             raise InternalServerError
+
+
+class BoardMergeApi(Resource):
+    """[Board merging]
+    """
+
+    @jwt_required()
+    def post(self, id):
+        """[Moves every item of a board onto another board and deletes the emptied board]
+
+        Arguments:
+            id {[string]} -- [Slug of the board merged away]
+
+        Body:
+            into {[string]} -- [Slug of the board that keeps the items]
+
+        Raises:
+            SchemaValidationError: [If into is missing or names the same board]
+            ItemNotExistsError: [If either board does not exist]
+            InternalServerError: [Error in update]
+
+        Returns:
+            [json] -- [Json object with message and the matched and modified item counts]
+        """
+        body = request.get_json(silent=True) or {}
+        into = body.get('into')
+        if not into or into == id:
+            raise SchemaValidationError
+        try:
+            user_id = get_jwt_identity()
+            source = reads.find_board(user_id, id, ('slug',))
+            target = reads.find_board(user_id, into, ('slug',) + BoardSummary.FIELDS)
+            if source is None or target is None:
+                raise DoesNotExist
+            result = merge_boards(user_id, source, target)
+            data = json.dumps({'matched': result.matched_count, 'modified': result.modified_count,
+                               'message': "Successfully merged"})
+            return Response(data, mimetype="application/json", status=200)
+        except DoesNotExist:
+            raise ItemNotExistsError
+        except Exception as e:
+            print(e)
+            raise InternalServerError
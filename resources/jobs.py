@@ -0,0 +1,39 @@
+from flask import Response
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_restful import Resource
+from mongoengine.errors import DoesNotExist
+
+from database import reads
+from util.errors import InternalServerError, ItemNotExistsError
+from util.serializers import encode
+
+
+class JobApi(Resource):
+    """[Import job progress]
+    """
+
+    @jwt_required()
+    def get(self, id):
+        """[Retrieves the status of an import job and the bookmarks parsed, inserted, duplicate and rejected so far]
+
+        Arguments:
+            id {[Object ID]} -- [Job id returned by the upload]
+
+        Raises:
+            ItemNotExistsError: [If the user has no such job]
+            InternalServerError: [If Error in retrieval]
+
+        Returns:
+            [json] -- [Json object with message and status code]
+        """
+        try:
+            job = reads.find_job(get_jwt_identity(), id)
+            if job is None:
+                raise DoesNotExist
+            data = encode({'data': job, 'message': "Successfully retrieved"})
+            return Response(data, mimetype="application/json", status=200)
+        except DoesNotExist:
+            raise ItemNotExistsError
+        except Exception as e:
+            print(e)
+            raise InternalServerError
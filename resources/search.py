@@ -0,0 +1,124 @@
+from bson import SON
+from flask import Response, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_restful import Resource
+from mongoengine.errors import DoesNotExist
+
+from database import reads
+from util.conditional import versionTag, notModified, cacheHeaders
+from util.errors import InternalServerError, SchemaValidationError, ItemNotExistsError
+from util.helpers import fieldsArg
+from util.pagination import pageArgs, pageHeaders, decodeScoreCursor, encodeScoreCursor
+from util.serializers import streamEnvelope, STREAM_BATCH_SIZE
+from util.trigramIndex import trigramIndex, itemText
+
+SEARCH_SORT = SON([('score', -1), ('_id', -1)])
+# Ranked candidates taken from the trigram index, fuzzy results page through these
+FUZZY_CANDIDATES = 1000
+
+
+def _indexed_items(user_id):
+    """[(id, searchable text) of every item of the user, read once when their trigram index is first built]"""
+    cursor = reads.items().find({'added_by': reads.object_id(user_id)}, {'source': 1, 'source_url': 1, 'tags': 1})
+    for item in cursor.batch_size(STREAM_BATCH_SIZE):
+        yield item['_id'], itemText(item.get('source'), item.get('source_url'), item.get('tags'))
+
+
+def _fuzzy_page(user_id, text, query, limit, after, fields):
+    """[One page of the items closest to text by trigram similarity, query narrowing them down further]"""
+    ranked = trigramIndex.search(user_id, text, FUZZY_CANDIDATES, lambda: _indexed_items(user_id))
+    if after is not None:
+        ranked = [(object_id, score) for object_id, score in ranked if (score, object_id) < after]
+    items = []
+    # The index knows nothing about boards, so candidates are fetched a page at a time until one is filled
+    for start in range(0, len(ranked), limit + 1):
+        chunk = ranked[start:start + limit + 1]
+        scores = dict(chunk)
+        found = {item['_id']: item for item in
+                 reads.items().find(dict(query, _id={'$in': list(scores)}), reads.projection(fields))}
+        for object_id, score in chunk:
+            if object_id in found:
+                items.append(dict(found[object_id], score=score))
+        if len(items) > limit:
+            break
+    return items
+
+
+class SearchApi(Resource):
+    """[Full text search over the user's items]
+    """
+
+    @jwt_required()
+    def get(self):
+        """[Retrieves one page of the user's items matching a text query, most relevant first]
+
+        Query:
+            q {[string]} -- [Words to look for in the title, URL and tags]
+            match {[string]} -- [`fuzzy` to also match partial and misspelt words, whole words by default]
+            board {[string]} -- [Board slug to search in, all boards by default]
+            limit {[int]} -- [Page size]
+            after {[string]} -- [Cursor from the `next` of the previous page]
+            fields {[string]} -- [Comma separated fields to return, all by default]
+
+        Raises:
+            SchemaValidationError: [If the query, paging or field arguments are invalid]
+            ItemNotExistsError: [If the board does not exist]
+            InternalServerError: [If Error in retrieval]
+
+        Returns:
+            [json] -- [Json object with message and status code, every item carries its `score`]
+        """
+        text = request.args.get('q', '').strip()
+        if not text:
+            raise SchemaValidationError
+        limit, after = pageArgs(decodeScoreCursor)
+        fields = fieldsArg(reads.ITEM_FIELDS)
+        try:
+            user_id = get_jwt_identity()
+            tag = versionTag(user_id)
+            unchanged = notModified(tag)
+            if unchanged is not None:
+                return unchanged
+            query = {'added_by': reads.object_id(user_id)}
+            slug = request.args.get('board')
+            if slug:
+                board_id = reads.find_board_id(user_id, slug)
+                if board_id is None:
+                    raise DoesNotExist
+                query['board'] = board_id
+            if request.args.get('match') == 'fuzzy':
+                items = _fuzzy_page(user_id, text, query, limit, after, fields)
+                return _page(items, limit, tag)
+            # The equality on added_by is the prefix of the item_search text index
+            query['$text'] = {'$search': text}
+            pipeline = [
+                {'$match': query},
+                {'$addFields': {'score': {'$meta': 'textScore'}}},
+            ]
+            if after is not None:
+                score, object_id = after
+                pipeline.append({'$match': {'$or': [
+                    {'score': {'$lt': score}},
+                    {'score': score, '_id': {'$lt': object_id}},
+                ]}})
+            pipeline += [
+                {'$sort': SEARCH_SORT},
+                {'$limit': limit + 1},
+                {'$project': dict(reads.projection(fields), score=1)},
+            ]
+            return _page(list(reads.items().aggregate(pipeline)), limit, tag)
+        except DoesNotExist:
+            raise ItemNotExistsError
+        except Exception as e:
+            print(e)
+            raise InternalServerError
+
+
+def _page(items, limit, tag):
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encodeScoreCursor(items[-1]['score'], items[-1]['_id'])
+    data = streamEnvelope(items, "Successfully retrieved", next=next_cursor)
+    return Response(data, mimetype="application/json", status=200,
+                    headers=dict(pageHeaders(next_cursor), **cacheHeaders(tag)))
@@ -0,0 +1,100 @@
+import base64
+import datetime
+import itertools
+
+from flask import Response, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_restful import Resource
+
+from database import reads
+from database.model import Tombstone, TOMBSTONE_TTL
+from util.conditional import versionTag, notModified, cacheHeaders
+from util.errors import InternalServerError, SchemaValidationError, SyncTokenExpiredError
+from util.serializers import streamEnvelope, STREAM_BATCH_SIZE
+
+# The next token starts this far before the sync began, so writes that were still in flight
+# when it ran are sent again next time instead of being missed. Clients apply changes idempotently.
+SYNC_OVERLAP = datetime.timedelta(seconds=5)
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def encodeSyncToken(since):
+    millis = (since - _EPOCH) // datetime.timedelta(milliseconds=1)
+    return base64.urlsafe_b64encode(str(millis).encode('ascii')).decode('ascii').rstrip('=')
+
+
+def decodeSyncToken(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        return _EPOCH + datetime.timedelta(milliseconds=int(base64.urlsafe_b64decode(padded.encode('ascii'))))
+    except (ValueError, TypeError, UnicodeError):
+        raise SchemaValidationError
+
+
+def _tagged(documents, kind):
+    for document in documents:
+        document['kind'] = kind
+        yield document
+
+
+def _deleted(tombstones):
+    for tombstone in tombstones:
+        yield {'_id': tombstone['object_id'], 'kind': tombstone['kind'], 'deleted': True,
+               'deleted_at': tombstone['deleted_at']}
+
+
+class SyncApi(Resource):
+    """[Delta sync of boards and items]
+    """
+
+    @jwt_required()
+    def get(self):
+        """[Retrieves every board and item created, modified or deleted since a sync token]
+
+        Boards come first so clients can attach the items that follow,
+        deletes are sent as `{"_id", "kind", "deleted": true}` records.
+        Without `since` the whole library is sent.
+
+        Query:
+            since {[string]} -- [`token` of the previous sync]
+
+        Raises:
+            SchemaValidationError: [If the token is malformed]
+            SyncTokenExpiredError: [If the token predates the tombstone TTL]
+            InternalServerError: [If Error in retrieval]
+
+        Returns:
+            [json] -- [Json object with data, the next token, message and status code]
+        """
+        started = datetime.datetime.now()
+        since = request.args.get('since')
+        since = decodeSyncToken(since) if since else None
+        if since is not None and since < started - TOMBSTONE_TTL:
+            raise SyncTokenExpiredError
+        try:
+            user_id = get_jwt_identity()
+            tag = versionTag(user_id)
+            unchanged = notModified(tag)
+            if unchanged is not None:
+                return unchanged
+            changed = {'added_by': reads.object_id(user_id)}
+            if since is not None:
+                changed['modified_at'] = {'$gt': since}
+            boards = reads.boards().find(changed, reads.projection(reads.BOARD_FIELDS))
+            items = reads.items().find(changed, reads.projection(reads.ITEM_FIELDS))
+            records = [
+                _tagged(boards.batch_size(STREAM_BATCH_SIZE), 'board'),
+                _tagged(items.batch_size(STREAM_BATCH_SIZE), 'item'),
+            ]
+            if since is not None:
+                tombstones = Tombstone._get_collection().find(
+                    {'added_by': changed['added_by'], 'deleted_at': {'$gt': since}},
+                    {'object_id': 1, 'kind': 1, 'deleted_at': 1})
+                records.append(_deleted(tombstones.batch_size(STREAM_BATCH_SIZE)))
+            token = encodeSyncToken(started - SYNC_OVERLAP)
+            data = streamEnvelope(itertools.chain(*records), "Successfully synced", token=token)
+            return Response(data, mimetype="application/json", status=200, headers=cacheHeaders(tag))
+        except Exception as e:
+            print(e)
+            raise InternalServerError
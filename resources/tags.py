@@ -0,0 +1,58 @@
+import json
+
+from flask import Response, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_restful import Resource
+from mongoengine.errors import DoesNotExist
+
+from database import reads
+from util.cache import cachedResponse, cacheBody, boardScope, BOARDS_SCOPE
+from util.conditional import versionTag, notModified, cacheHeaders
+from util.errors import InternalServerError, ItemNotExistsError
+
+
+class TagsApi(Resource):
+    """[Tag facets of the user's items]
+    """
+
+    @jwt_required()
+    def get(self):
+        """[Retrieves every tag of the user's items with the number of items carrying it, most used first]
+
+        Query:
+            board {[string]} -- [Board slug to count in, all boards by default]
+
+        Raises:
+            ItemNotExistsError: [If the board does not exist]
+            InternalServerError: [If Error in retrieval]
+
+        Returns:
+            [json] -- [Json object with message and status code, every tag carries its `count`]
+        """
+        try:
+            user_id = get_jwt_identity()
+            tag = versionTag(user_id)
+            unchanged = notModified(tag)
+            if unchanged is not None:
+                return unchanged
+            slug = request.args.get('board')
+            scope = boardScope(slug) if slug else BOARDS_SCOPE
+            hit = cachedResponse(user_id, scope, tag)
+            if hit is not None:
+                return hit
+            board_id = None
+            if slug:
+                board_id = reads.find_board_id(user_id, slug)
+                if board_id is None:
+                    raise DoesNotExist
+            pipeline = reads.tag_facet_pipeline(reads.item_query(user_id, board_id))
+            tags = [{'tag': row['_id'], 'count': row['count']} for row in reads.items().aggregate(pipeline)]
+            data = json.dumps({'data': tags, 'message': "Successfully retrieved", 'count': len(tags)})
+            headers = cacheHeaders(tag)
+            data = cacheBody(user_id, scope, tag, headers, [data])
+            return Response(data, mimetype="application/json", status=200, headers=headers)
+        except DoesNotExist:
+            raise ItemNotExistsError
+        except Exception as e:
+            print(e)
+            raise InternalServerError
@@ -0,0 +1,168 @@
+import json
+import re
+import zlib
+
+from flask import Response, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_restful import Resource
+from mongoengine.errors import DoesNotExist, ValidationError
+
+from database.model import UploadSession, ImportJob
+from importers.jobs import importQueue
+from importers.uploads import createUpload, writeChunk
+from util.errors import SchemaValidationError, InternalServerError, ItemNotExistsError, UploadOffsetError, \
+    UploadIncompleteError
+
+# bytes <first>-<last>/<total>, total is * while the client does not know it yet
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+
+def _upload(user_id, id):
+    try:
+        return UploadSession.objects.get(id=id, added_by=user_id)
+    except ValidationError:
+        raise DoesNotExist
+
+
+def _encode(session):
+    return {'id': str(session.id), 'filename': session.filename, 'size': session.size,
+            'received': session.received, 'status': session.status,
+            'job': str(session.job) if session.job else None}
+
+
+def _queued(job):
+    data = json.dumps({'id': str(job.id), 'status': job.status, 'message': "Import queued"})
+    return Response(data, mimetype="application/json", status=202, headers={'Location': '/api/jobs/%s' % job.id})
+
+
+class UploadsApi(Resource):
+    """[Chunked bookmark file uploads]
+    """
+
+    @jwt_required()
+    def post(self):
+        """[Opens an upload that the file is then PUT into one byte range at a time]
+
+        Body:
+            filename {[string]} -- [Name of the file, optional]
+            size {[int]} -- [Total bytes as sent, gzipped or not, optional until the last range]
+
+        Raises:
+            SchemaValidationError: [If size is not a positive number]
+            InternalServerError: [Error in creation]
+
+        Returns:
+            [json] -- [Json object with message and the upload, status 201]
+        """
+        body = request.get_json(silent=True) or {}
+        size = body.get('size')
+        if size is not None and (not isinstance(size, int) or isinstance(size, bool) or size <= 0):
+            raise SchemaValidationError
+        try:
+            session = createUpload(get_jwt_identity(), body.get('filename'), size)
+            data = json.dumps({'data': _encode(session), 'message': "Upload created"})
+            return Response(data, mimetype="application/json", status=201,
+                            headers={'Location': '/api/uploads/%s' % session.id})
+        except Exception as e:
+            print(e)
+            raise InternalServerError
+
+
+class UploadApi(Resource):
+    """[One chunked upload]
+    """
+
+    @jwt_required()
+    def get(self, id):
+        """[Retrieves how many bytes of the upload arrived, where an interrupted client resumes]
+
+        Arguments:
+            id {[Object ID]} -- [Upload id]
+
+        Raises:
+            ItemNotExistsError: [If the user has no such upload]
+            InternalServerError: [If Error in retrieval]
+
+        Returns:
+            [json] -- [Json object with message and the upload]
+        """
+        try:
+            session = _upload(get_jwt_identity(), id)
+            data = json.dumps({'data': _encode(session), 'message': "Successfully retrieved"})
+            return Response(data, mimetype="application/json", status=200)
+        except DoesNotExist:
+            raise ItemNotExistsError
+        except Exception as e:
+            print(e)
+            raise InternalServerError
+
+    @jwt_required()
+    def put(self, id):
+        """[Appends the byte range named by the Content-Range header, the body is streamed to storage]
+
+        Arguments:
+            id {[Object ID]} -- [Upload id]
+
+        Raises:
+            SchemaValidationError: [If Content-Range is missing or does not match the body]
+            UploadOffsetError: [If the range does not start at the bytes received so far]
+            ItemNotExistsError: [If the user has no such upload]
+            InternalServerError: [If Error in storing]
+
+        Returns:
+            [json] -- [Json object with message and the bytes received]
+        """
+        found = CONTENT_RANGE.match(request.headers.get('Content-Range', ''))
+        if found is None:
+            raise SchemaValidationError
+        start, end = int(found.group(1)), int(found.group(2))
+        total = None if found.group(3) == '*' else int(found.group(3))
+        try:
+            session = _upload(get_jwt_identity(), id)
+            received = writeChunk(session, start, end, total, request.stream)
+            data = json.dumps({'received': received, 'message': "Chunk stored"})
+            return Response(data, mimetype="application/json", status=200)
+        except (SchemaValidationError, UploadOffsetError):
+            raise
+        except DoesNotExist:
+            raise ItemNotExistsError
+        except Exception as e:
+            print(e)
+            raise InternalServerError
+
+
+class UploadCompleteApi(Resource):
+    """[Completion of a chunked upload]
+    """
+
+    @jwt_required()
+    def post(self, id):
+        """[Queues the import of the uploaded file once every byte arrived, repeating it returns the same job]
+
+        Arguments:
+            id {[Object ID]} -- [Upload id]
+
+        Raises:
+            UploadIncompleteError: [If bytes are missing]
+            SchemaValidationError: [If a gzipped file is corrupt]
+            ItemNotExistsError: [If the user has no such upload]
+            InternalServerError: [Error in queueing]
+
+        Returns:
+            [json] -- [Json object with message and the job id, status 202]
+        """
+        try:
+            user_id = get_jwt_identity()
+            session = _upload(user_id, id)
+            if session.job is not None:
+                return _queued(ImportJob.objects.get(id=session.job))
+            return _queued(importQueue.enqueueUpload(user_id, session))
+        except UploadIncompleteError:
+            raise
+        except zlib.error:
+            raise SchemaValidationError
+        except DoesNotExist:
+            raise ItemNotExistsError
+        except Exception as e:
+            print(e)
+            raise InternalServerError
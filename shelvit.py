@@ -1,6 +1,7 @@
 import datetime
 from flask import Flask
 from database.db import initialize_db
+from database.indexes import initialize_commands
 import flask.scaffold
 
 flask.helpers._endpoint_from_view_func = flask.scaffold._endpoint_from_view_func
@@ -9,10 +10,14 @@ from util.errors import errors
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager, get_jwt, create_access_token, get_jwt_identity, set_access_cookies
 from util.routes import initialize_routes
+from util.cache import initialize_cache
+from util.trigramIndex import initialize_search
+from importers.jobs import initialize_imports
 from flask_cors import CORS
 
 app = Flask(__name__)
-cors = CORS(app)
+# Preflights are cached by the browser for a day, ETag and Link have to be exposed for clients to page and revalidate
+cors = CORS(app, max_age=86400, expose_headers=['ETag', 'Link'])
 
 # //TODO Fix security issues
 api = Api(app, errors=errors)
@@ -54,7 +59,11 @@ app.config['JWT_SECRET_KEY'] = "Shelvit"
 app.config['CORS_HEADERS'] = 'Content-Type'
 
 initialize_db(app)
+initialize_cache(app)
+initialize_search(app)
 initialize_routes(api)
+initialize_commands(app)
+initialize_imports(app)
 if __name__ == "__main__":
     app.run(debug=True)
     app.run(host='0.0.0.0')
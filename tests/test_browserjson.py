@@ -0,0 +1,94 @@
+import io
+import json
+import unittest
+
+from importers.browserjson import JSONTokenizer, parse
+from importers.netscape import MAX_TEXT_BYTES
+
+DOCUMENT = json.dumps([
+    {'url': 'https://a.com', 'score': 12.5, 'rank': -3, 'weight': 1e-7, 'big': 6.02E+23, 'zero': 0},
+    {'title': 'Café “quoted” \\ "escaped"', 'tags': ['a', 'b'], 'seen': True, 'hidden': False,
+     'parent': None},
+    [], {}, [[-0.5, 10, 1.25e3]], 'tail', 42,
+], ensure_ascii=False).encode('utf-8')
+
+
+def expected(value):
+    # Tokens of a decoded document, in the order JSONTokenizer gives them out
+    if isinstance(value, dict):
+        yield '{', None
+        for position, (key, item) in enumerate(value.items()):
+            if position:
+                yield ',', None
+            yield 'value', key
+            yield ':', None
+            yield from expected(item)
+        yield '}', None
+    elif isinstance(value, list):
+        yield '[', None
+        for position, item in enumerate(value):
+            if position:
+                yield ',', None
+            yield from expected(item)
+        yield ']', None
+    else:
+        yield 'value', value
+
+
+def tokenize(data, chunk_size):
+    tokenizer = JSONTokenizer()
+    found = []
+    for start in range(0, len(data), chunk_size):
+        found.extend(tokenizer.feed(data[start:start + chunk_size]))
+    found.extend(tokenizer.feed(b'', final=True))
+    return found
+
+
+class JSONTokenizerTest(unittest.TestCase):
+
+    def test_every_chunk_size(self):
+        tokens = list(expected(json.loads(DOCUMENT)))
+        whole = tokenize(DOCUMENT, len(DOCUMENT))
+        self.assertEqual([(kind, value) for kind, value, _ in whole], tokens)
+        for chunk_size in range(1, len(DOCUMENT)):
+            self.assertEqual(tokenize(DOCUMENT, chunk_size), whole, "chunk size %d" % chunk_size)
+
+    def test_number_at_the_end(self):
+        for text in (b'12', b'-3', b'12.5', b'1e5', b'-1.5E-3'):
+            for chunk_size in range(1, len(text) + 1):
+                self.assertEqual(tokenize(text, chunk_size), [('value', json.loads(text), 0)])
+
+    def test_invalid(self):
+        for text in (b'[1.]', b'[-]', b'[1e]', b'[tru]', b'"open', b'[@]'):
+            for chunk_size in (1, 2, len(text)):
+                with self.assertRaises(ValueError, msg=text):
+                    tokenize(text, chunk_size)
+
+    def test_long_strings_are_skipped(self):
+        data = json.dumps(['x' * (MAX_TEXT_BYTES * 2), 'kept']).encode('utf-8')
+        for chunk_size in (1024, MAX_TEXT_BYTES, len(data)):
+            self.assertEqual([value for kind, value, _ in tokenize(data, chunk_size) if kind == 'value'],
+                             [None, 'kept'])
+
+
+class ParseTest(unittest.TestCase):
+
+    def test_chrome_folders(self):
+        data = json.dumps({'roots': {'bookmark_bar': {'children': [
+            {'type': 'url', 'name': 'A', 'url': 'https://a.com', 'date_added': '13253932800000000'},
+            {'type': 'folder', 'children': [{'type': 'url', 'name': 'B', 'url': 'https://b.com'}], 'name': 'Inner'},
+        ], 'name': 'Bar'}}}).encode('utf-8')
+        for chunk_size in (1, 7, len(data)):
+            bookmarks = list(parse(io.BytesIO(data), chunk_size))
+            self.assertEqual([(bookmark.folder_path, bookmark.title, bookmark.href) for bookmark in bookmarks],
+                             [(('Bar',), 'A', 'https://a.com'), (('Bar', 'Inner'), 'B', 'https://b.com')])
+            self.assertEqual(bookmarks[0].add_date, 1609459200)
+
+    def test_truncated(self):
+        for data in (b'[{"url": "https://a.com"},', b'[{"url": "https://a.com"}]]'):
+            with self.assertRaises(ValueError):
+                list(parse(io.BytesIO(data), 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import io
+import unittest
+
+from importers.netscape import NetscapeParser, parse, MAX_TAG_BYTES, MAX_TEXT_BYTES
+
+
+def bookmarkFile(folders=12, links=40):
+    """[Netscape file with nested folders, links missing their </A>, comments, entities and Pocket dates]"""
+    parts = [b'<!DOCTYPE NETSCAPE-Bookmark-file-1>\n<!-- This is an automatically generated file. -->\n',
+             b'<TITLE>Bookmarks</TITLE>\n<H1>Bookmarks</H1>\n<DL><p>\n',
+             b'<DT><A HREF="https://top.example" ADD_DATE="1500000000">Top &amp; level</A>\n']
+    for folder in range(folders):
+        parts.append(b'<DT><H3 ADD_DATE="1500000000">Folder %d</H3>\n<DL><p>\n' % folder)
+        if folder % 3 == 0:
+            parts.append(b'<DT><H3>Inner %d</H3>\n<DL><p>\n' % folder)
+        for link in range(links):
+            href = b'https://example.com/%d/%d?a=1&amp;b=2' % (folder, link)
+            if link % 7 == 0:
+                # No </A>, the next <DT> ends it
+                parts.append(b'<DT><A HREF="%s" TAGS="x,y">Open %d\n' % (href, link))
+            elif link % 11 == 0:
+                parts.append(b'<!-- a comment with <A HREF="https://not.a.link"> inside -->\n')
+                parts.append(b'<DT><a href=\'%s\' time_added="1600000000">Pocket %d</a>\n' % (href, link))
+            else:
+                parts.append(b'<DT><A HREF="%s" ADD_DATE="%d">Link %d</A>\n<DD>Description\n'
+                             % (href, 1600000000 + link, link))
+        if folder % 3 == 0:
+            parts.append(b'</DL><p>\n')
+        parts.append(b'</DL><p>\n')
+    parts.append(b'<DT><A HREF="https://last.example">Last, missing its end')
+    return b''.join(parts)
+
+
+def chunked(data, chunk_size):
+    return list(parse(io.BytesIO(data), chunk_size))
+
+
+class NetscapeParserTest(unittest.TestCase):
+
+    def test_records(self):
+        data = bookmarkFile(folders=3, links=12)
+        bookmarks = chunked(data, len(data))
+        self.assertEqual(bookmarks[0], ((), 'Top & level', 'https://top.example', 1500000000, []))
+        self.assertEqual(bookmarks[1].folder_path, ('Folder 0', 'Inner 0'))
+        self.assertEqual((bookmarks[1].title, bookmarks[1].tags), ('Open 0', ['x', 'y']))
+        self.assertEqual(bookmarks[1].href, 'https://example.com/0/0?a=1&b=2')
+        pocket = next(bookmark for bookmark in bookmarks if bookmark.title == 'Pocket 11')
+        self.assertEqual(pocket.add_date, 1600000000)
+        self.assertNotIn('https://not.a.link', [bookmark.href for bookmark in bookmarks])
+        self.assertEqual(bookmarks[-1].href, 'https://last.example')
+        self.assertEqual(bookmarks[-1].folder_path, ())
+        self.assertEqual(len(bookmarks), 2 + 3 * 12)
+
+    def test_chunk_sizes(self):
+        data = bookmarkFile()
+        whole = chunked(data, len(data))
+        for chunk_size in (1, 7, 64 * 1024):
+            self.assertEqual(chunked(data, chunk_size), whole, "chunk size %d" % chunk_size)
+
+    def test_oversized_tag_and_title(self):
+        data = (b'<DL><p><DT><H3>Folder</H3><DL><p>'
+                b'<DT><A HREF="https://a.com" ICON="' + b'x' * (MAX_TAG_BYTES + 10) + b'">A</A>'
+                b'<DT><A HREF="https://b.com">' + b'y' * (MAX_TEXT_BYTES * 2) + b'</A>'
+                b'<DT><A HREF="https://c.com">C</A></DL><p></DL>')
+        whole = chunked(data, len(data))
+        self.assertEqual([bookmark.href for bookmark in whole], ['https://b.com', 'https://c.com'])
+        self.assertEqual(len(whole[0].title), MAX_TEXT_BYTES)
+        self.assertEqual(whole[1].folder_path, ('Folder',))
+        for chunk_size in (4096, 64 * 1024):
+            self.assertEqual(chunked(data, chunk_size), whole, "chunk size %d" % chunk_size)
+
+    def test_resume_from_state(self):
+        data = bookmarkFile(folders=4, links=10)
+        whole = chunked(data, len(data))
+        parser = NetscapeParser()
+        states = []
+        for bookmark in parse(io.BytesIO(data), 64, parser):
+            states.append(parser.state())
+        for position, state in enumerate(states):
+            stream = io.BytesIO(data)
+            stream.seek(state['offset'])
+            self.assertEqual(list(parse(stream, 64, NetscapeParser(**state))), whole[position + 1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import io
+import unittest
+
+from importers import csvfile
+from importers.netscape import MAX_TEXT_BYTES
+from importers.registry import detect
+
+
+class DetectTest(unittest.TestCase):
+
+    def test_formats(self):
+        heads = {
+            b'\xef\xbb\xbf<!DOCTYPE NETSCAPE-Bookmark-file-1>\n<DL><p>': 'netscape',
+            b'<html><DL><p>\n<DT><A HREF="https://a.com">A</A>': 'netscape',
+            b'<!DOCTYPE html><html><head><title>Pocket Export</title></head><body><ul>'
+            b'<li><a href="https://a.com" time_added="1600000000">A</a></li>': 'netscape',
+            b'{"checksum": "", "roots": {"bookmark_bar": {}}}': 'chrome',
+            b'{"guid": "root________", "type": "text/x-moz-place-container"}': 'firefox',
+            b'[{"url": "https://a.com"}]': 'json',
+            b'url,title,tags\nhttps://a.com,A,x': 'csv',
+            b'https://a.com A\nhttps://b.com': 'urls',
+        }
+        for head, name in heads.items():
+            self.assertEqual(getattr(detect(head), 'name', None), name, head)
+
+    def test_other_markup_is_not_a_bookmark_file(self):
+        for head in (b'<?xml version="1.0"?><opml version="2.0"><body><outline xmlUrl="https://a.com/rss"/>',
+                     b'<rss version="2.0"><channel><link>https://a.com</link>',
+                     b'<!DOCTYPE html><html><body><a href="https://a.com">A</a>'):
+            self.assertIsNone(detect(head), head)
+
+
+class CSVTest(unittest.TestCase):
+
+    def test_oversized_row_is_left_out(self):
+        data = ('url,title\nhttps://a.com,A\nhttps://b.com,"%s"\nhttps://c.com,C\n'
+                % ('x' * (3 * MAX_TEXT_BYTES))).encode('utf-8')
+        for chunk_size in (100, 4096, len(data)):
+            self.assertEqual([bookmark.href for bookmark in csvfile.parse(io.BytesIO(data), chunk_size)],
+                             ['https://a.com', 'https://c.com'])
+
+
+if __name__ == '__main__':
+    unittest.main()
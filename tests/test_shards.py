@@ -0,0 +1,64 @@
+import io
+import unittest
+
+from importers.netscape import NetscapeParser, parse
+from importers.pipeline import prepareBookmarks
+from importers.shards import split, parseShards
+from tests.test_netscape import bookmarkFile
+
+USER_ID = '5f0000000000000000000000'
+
+
+def parseShard(shard, state):
+    parser = NetscapeParser(**state)
+    bookmarks = list(parser.feed(shard))
+    bookmarks.extend(parser.close())
+    return bookmarks, parser
+
+
+class SplitTest(unittest.TestCase):
+
+    def test_shards_parse_like_the_whole_file(self):
+        data = bookmarkFile()
+        whole = list(parse(io.BytesIO(data), len(data)))
+        for shard_bytes in (1, 2048, 16 * 1024, len(data)):
+            for chunk_size in (7, 4096):
+                shards = list(split(io.BytesIO(data), shard_bytes, chunk_size=chunk_size))
+                self.assertEqual(b''.join(shard for shard, _, _ in shards), data)
+                bookmarks = []
+                for shard, start, end in shards:
+                    found, parser = parseShard(shard, start)
+                    bookmarks.extend(found)
+                    self.assertEqual(parser.offset, end['offset'])
+                self.assertEqual(bookmarks, whole, "shard bytes %d, chunk size %d" % (shard_bytes, chunk_size))
+
+    def test_resume_from_every_shard_end(self):
+        data = bookmarkFile()
+        whole = list(parse(io.BytesIO(data), len(data)))
+        shards = list(split(io.BytesIO(data), 2048))
+        self.assertGreater(len(shards), 5)
+        written = 0
+        for shard, start, end in shards:
+            written += len(parseShard(shard, start)[0])
+            stream = io.BytesIO(data)
+            stream.seek(end['offset'])
+            resumed = [bookmark for shard, start, _ in split(stream, 2048, end)
+                       for bookmark in parseShard(shard, start)[0]]
+            self.assertEqual(resumed, whole[written:], "resumed at %d" % end['offset'])
+
+
+class ParseShardsTest(unittest.TestCase):
+
+    def test_process_pool(self):
+        data = bookmarkFile()
+        expected = list(prepareBookmarks(parse(io.BytesIO(data)), USER_ID))
+        records = [record for shard, _ in parseShards(io.BytesIO(data), USER_ID, 2, shard_bytes=2048)
+                   for record in shard]
+        self.assertEqual(len(records), len(expected))
+        for record, prepared in zip(records, expected):
+            self.assertEqual((record.board_title, record.error), (prepared.board_title, prepared.error))
+            self.assertEqual(record.document['source_url'], prepared.document['source_url'])
+
+
+if __name__ == '__main__':
+    unittest.main()
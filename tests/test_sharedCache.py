@@ -0,0 +1,154 @@
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+
+from util.respServer import RespServer
+from util.sharedCache import CacheBackend, MmapBackend, RespBackend, SharedCache
+
+
+class CacheBackendTest(unittest.TestCase):
+
+    def test_is_abstract(self):
+        with self.assertRaises(TypeError):
+            CacheBackend()
+
+
+class MmapBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'shelvit.cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def backend(self, size=4 * 1024 * 1024):
+        return MmapBackend(self.path, size)
+
+    def test_get_set_delete(self):
+        backend = self.backend()
+        self.assertIsNone(backend.get('slug:a'))
+        backend.set('slug:a', b'small', 60)
+        backend.set('page:a', b'x' * 10000, 60)
+        self.assertEqual(backend.get('slug:a'), b'small')
+        self.assertEqual(backend.get('page:a'), b'x' * 10000)
+        backend.set('slug:a', b'replaced', 60)
+        self.assertEqual(backend.get('slug:a'), b'replaced')
+        backend.delete('slug:a', 'page:a', 'missing')
+        self.assertIsNone(backend.get('slug:a'))
+        self.assertIsNone(backend.get('page:a'))
+
+    def test_value_moving_between_regions(self):
+        backend = self.backend()
+        backend.set('key', b'x' * 10000, 60)
+        backend.set('key', b'small', 60)
+        self.assertEqual(backend.get('key'), b'small')
+        backend.set('key', b'y' * 10000, 60)
+        self.assertEqual(backend.get('key'), b'y' * 10000)
+
+    def test_expiry(self):
+        backend = self.backend()
+        backend.set('short', b'value', 0.05)
+        backend.set('long', b'value', 60)
+        time.sleep(0.1)
+        self.assertIsNone(backend.get('short'))
+        self.assertEqual(backend.get('long'), b'value')
+
+    def test_set_evicts_soonest_expiring(self):
+        # One set of small slots, every small value competes for the same WAYS slots
+        backend = self.backend(MmapBackend.SMALL_SLOT * MmapBackend.WAYS * 8)
+        for way in range(MmapBackend.WAYS):
+            backend.set('key%d' % way, b'value%d' % way, 10 * (way + 1))
+        backend.set('newest', b'newest', 100)
+        self.assertIsNone(backend.get('key0'))
+        for way in range(1, MmapBackend.WAYS):
+            self.assertEqual(backend.get('key%d' % way), b'value%d' % way)
+        self.assertEqual(backend.get('newest'), b'newest')
+
+    def test_set_reuses_expired_slot(self):
+        backend = self.backend(MmapBackend.SMALL_SLOT * MmapBackend.WAYS * 8)
+        for way in range(MmapBackend.WAYS):
+            backend.set('key%d' % way, b'value', 0.05 if way == 2 else 60)
+        time.sleep(0.1)
+        backend.set('newest', b'newest', 1)
+        for way in (0, 1, 3):
+            self.assertEqual(backend.get('key%d' % way), b'value')
+        self.assertEqual(backend.get('newest'), b'newest')
+
+    def test_oversized_value_is_not_cached(self):
+        backend = self.backend()
+        backend.set('page', b'old', 60)
+        backend.set('page', b'x' * MmapBackend.LARGE_SLOT, 60)
+        self.assertIsNone(backend.get('page'))
+
+    def test_shared_between_processes(self):
+        backend = self.backend()
+        backend.get('warm')
+        pid = os.fork()
+        if pid == 0:
+            try:
+                backend.set('from-child', b'child', 60)
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(backend.get('from-child'), b'child')
+
+
+class RespBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = RespServer().start()
+        self.backend = RespBackend(*self.server.server_address, timeout=1)
+
+    def tearDown(self):
+        self.backend._close()
+        self.server.stop()
+
+    def test_get_set_delete(self):
+        self.assertIsNone(self.backend.get('key'))
+        self.backend.set('key', b'\x00binary\r\nvalue', 60)
+        self.assertEqual(self.backend.get('key'), b'\x00binary\r\nvalue')
+        self.backend.delete('key', 'missing')
+        self.assertIsNone(self.backend.get('key'))
+        self.backend.delete()
+
+    def test_expiry(self):
+        self.assertEqual(self.backend.execute('SET', 'key', 'value', 'PX', 50), b'OK')
+        time.sleep(0.1)
+        self.assertIsNone(self.backend.get('key'))
+
+    def test_replies(self):
+        self.assertEqual(self.backend.execute('PING'), b'PONG')
+        self.assertEqual(self.backend.execute('INCR', 'counter'), 1)
+        self.assertEqual(self.backend.execute('INCR', 'counter'), 2)
+        self.assertEqual(self.backend.execute('EXISTS', 'counter', 'missing'), 1)
+
+    def test_auth_and_select(self):
+        backend = RespBackend(*self.server.server_address, db=2, password='secret', timeout=1)
+        backend.set('key', b'value', 60)
+        self.assertEqual(backend.get('key'), b'value')
+        backend._close()
+
+    def test_reconnects_after_broken_connection(self):
+        self.backend.set('key', b'value', 60)
+        self.backend._sock.shutdown(socket.SHUT_RDWR)
+        with self.assertRaises((OSError, ConnectionError)):
+            self.backend.get('key')
+        self.assertEqual(self.backend.get('key'), b'value')
+
+    def test_shared_cache_reads_outage_as_miss(self):
+        self.server.stop()
+        self.backend._close()
+        cache = SharedCache(self.backend)
+        self.assertIsNone(cache.get('key'))
+        cache.set('key', b'value')
+        cache.delete('key')
+        self.assertEqual(cache.stats()['errors'], 3)
+        self.server = RespServer().start()
+
+
+if __name__ == '__main__':
+    unittest.main()
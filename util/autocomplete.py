@@ -0,0 +1,118 @@
+import heapq
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import OrderedDict
+
+DEFAULT_SUGGESTIONS = 10
+MAX_SUGGESTIONS = 50
+# Users whose indexes one process keeps, per suggestion type
+MAX_INDEXES = 1024
+# Answers memoized per index, most keystrokes repeat a prefix typed a moment ago
+MAX_MEMO = 512
+
+_END = chr(0x10FFFF)
+
+
+def normalize(text):
+    """[Case and accent insensitive form used for keys and prefixes]"""
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ' '.join(''.join(char for char in decomposed if not unicodedata.combining(char)).split())
+
+
+class PrefixIndex:
+    """[Sorted array of normalized keys answering frequency-weighted top-k prefix queries]
+
+    Every word of an entry starts a key of its own, so "lea" finds
+    "Deep learning" as well as "Learning Go". A prefix selects a contiguous
+    range of keys with two binary searches; only that range is ranked.
+    """
+
+    def __init__(self, entries):
+        """[Builds the index]
+
+        Arguments:
+            entries {[list]} -- [(text, weight, payload) triples, payload being a dict returned with the suggestion]
+        """
+        self._entries = entries
+        keys = []
+        for number, (text, _, _) in enumerate(entries):
+            words = normalize(text).split()
+            keys.extend((' '.join(words[start:]), number) for start in range(len(words)))
+        keys.sort()
+        self._keys = [key for key, _ in keys]
+        self._numbers = [number for _, number in keys]
+        self._order = [(-weight, normalize(text)) for text, weight, _ in entries]
+        self._memo = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def top(self, prefix, k):
+        """[Heaviest k entries with a word starting with prefix, ties broken alphabetically]
+
+        Returns:
+            [list] -- [(text, weight, payload) triples]
+        """
+        prefix = normalize(prefix)
+        memo_key = (prefix, k)
+        found = self._memo.get(memo_key)
+        if found is None:
+            low = bisect_left(self._keys, prefix)
+            high = bisect_left(self._keys, prefix + _END, low)
+            numbers = set(self._numbers[low:high])
+            found = [self._entries[number] for number in
+                     heapq.nsmallest(k, numbers, key=self._order.__getitem__)]
+            if len(self._memo) >= MAX_MEMO:
+                self._memo.clear()
+            self._memo[memo_key] = found
+        return found
+
+
+class Autocomplete:
+    """[Lazily built PrefixIndex per user and suggestion type, tied to the user's change version]
+
+    Every write to a user's boards or items bumps their change version, so an
+    index built for an older version is rebuilt on the next keystroke, in this
+    worker and in every other one.
+    """
+
+    def __init__(self, max_indexes=MAX_INDEXES):
+        self.max_indexes = max_indexes
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def index(self, user_id, kind, version, build):
+        """[Index of the user's suggestions of one kind as of version]
+
+        Arguments:
+            user_id {[string]} -- [JWT identity]
+            kind {[string]} -- [Suggestion type]
+            version {[int]} -- [User's current change version]
+            build {[callable]} -- [Returns the (text, weight, payload) entries when the index has to be built]
+
+        Returns:
+            [PrefixIndex]
+        """
+        key = (str(user_id), kind)
+        with self._lock:
+            entry = self._indexes.get(key)
+            if entry is not None and entry[0] == version:
+                self._indexes.move_to_end(key)
+                return entry[1]
+        index = PrefixIndex(build())
+        with self._lock:
+            self._indexes[key] = (version, index)
+            self._indexes.move_to_end(key)
+            while len(self._indexes) > self.max_indexes:
+                self._indexes.popitem(last=False)
+            self.builds += 1
+        return index
+
+    def stats(self):
+        with self._lock:
+            return {'indexes': len(self._indexes), 'max_indexes': self.max_indexes, 'builds': self.builds}
+
+
+autocomplete = Autocomplete()
@@ -0,0 +1,168 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, request
+
+from util.sharedCache import sharedCache, initialize_shared_cache
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 60
+# Rough per entry cost of the key, tuple and header dict on top of the body
+ENTRY_OVERHEAD = 512
+
+# Invalidation scopes, every cached response belongs to exactly one of them
+BOARDS_SCOPE = 'boards'
+
+
+def boardScope(slug):
+    return 'board:%s' % slug
+
+
+class ResponseCache:
+    """[Bounded LRU of serialized response bodies with a TTL, keyed by user, scope and URL]
+
+    Eviction is by total body size rather than entry count. Every entry also
+    remembers the ETag it was rendered for, so an entry made stale by a write
+    handled in another worker process is never served.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._scopes = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, tag):
+        """[Body and headers cached for key, None on a miss]"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic() or entry[1] != tag:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2], entry[3]
+
+    def put(self, key, tag, body, headers):
+        size = len(body) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, tag, body, headers, size)
+            self._scopes.setdefault(key[:2], set()).add(key)
+            self._size += size
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, user_id, *scopes):
+        """[Drops the user's responses in the given scopes, or all of them when no scope is given]"""
+        user_id = str(user_id)
+        with self._lock:
+            if scopes:
+                groups = [(user_id, scope) for scope in scopes]
+            else:
+                groups = [group for group in self._scopes if group[0] == user_id]
+            for group in groups:
+                for key in tuple(self._scopes.get(group, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._scopes.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size, 'max_bytes': self.max_bytes,
+                    'ttl': self.ttl, 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'invalidations': self.invalidations}
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._size -= entry[4]
+        group = self._scopes.get(key[:2])
+        if group is not None:
+            group.discard(key)
+            if not group:
+                del self._scopes[key[:2]]
+
+
+responseCache = ResponseCache()
+
+
+def initialize_cache(app):
+    responseCache.max_bytes = app.config.get('RESPONSE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+    responseCache.ttl = app.config.get('RESPONSE_CACHE_TTL', DEFAULT_TTL)
+    initialize_shared_cache(app)
+
+
+def _sharedKey(tag):
+    # The tag already hashes user, change version, path and query, a write elsewhere simply moves readers to a new key
+    return 'resp:%s' % tag
+
+
+def _cacheKey(user_id, scope):
+    return str(user_id), scope, request.full_path
+
+
+def cachedResponse(user_id, scope, tag):
+    """[Response served from the cache for the current request, None on a miss]
+
+    The process local cache is tried first, then the tier shared by all workers.
+    """
+    key = _cacheKey(user_id, scope)
+    entry = responseCache.get(key, tag)
+    if entry is None:
+        shared = sharedCache.get(_sharedKey(tag))
+        if shared is None:
+            return None
+        headers, body = shared.split(b'\n', 1)
+        entry = body, json.loads(headers)
+        responseCache.put(key, tag, *entry)
+    body, headers = entry
+    return Response(body, mimetype="application/json", status=200, headers=headers)
+
+
+def cacheBody(user_id, scope, tag, headers, chunks):
+    """[Passes a streamed body through while keeping a copy for the cache]
+
+    The copy is only stored once the body has been produced completely.
+
+    Arguments:
+        user_id {[string]} -- [JWT identity]
+        scope {[string]} -- [Invalidation scope]
+        tag {[string]} -- [ETag the body was rendered for]
+        headers {[dict]} -- [Headers to replay on a hit]
+        chunks {[iterable]} -- [Body chunks]
+
+    Returns:
+        [generator]
+    """
+    # The key is taken now, the body is produced after the request context is gone
+    return _captured(_cacheKey(user_id, scope), tag, headers, chunks)
+
+
+def _captured(key, tag, headers, chunks):
+    body = []
+    for chunk in chunks:
+        chunk = chunk.encode('utf-8')
+        body.append(chunk)
+        yield chunk
+    body = b''.join(body)
+    responseCache.put(key, tag, body, headers)
+    sharedCache.set(_sharedKey(tag), json.dumps(headers).encode('utf-8') + b'\n' + body)
@@ -0,0 +1,44 @@
+import hashlib
+
+from flask import Response, request
+
+from database import reads
+
+# Clients may reuse a response only after revalidating it, and only for the same credentials
+CACHE_CONTROL = 'private, no-cache'
+VARY = 'Authorization, Cookie'
+
+
+def versionTag(user_id, version=None):
+    """[Weak ETag of the current request for the user's current change version]
+
+    The tag covers the path and query string, so every page, fieldset and
+    board gets its own tag while one version read answers for all of them.
+
+    Arguments:
+        user_id {[string]} -- [JWT identity]
+        version {[int]} -- [Change version when the caller already read it]
+
+    Returns:
+        [string] -- [Opaque tag, without quotes or W/ prefix]
+    """
+    if version is None:
+        version = reads.change_version(user_id)
+    raw = '%s|%d|%s|%s' % (user_id, version, request.path,
+                           request.query_string.decode('latin-1'))
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=12).hexdigest()
+
+
+def cacheHeaders(tag):
+    return {'ETag': 'W/"%s"' % tag, 'Cache-Control': CACHE_CONTROL, 'Vary': VARY}
+
+
+def notModified(tag):
+    """[304 response when the client already holds the representation tagged `tag`]
+
+    Returns:
+        [Response] -- [Or None when the client has to get a full response]
+    """
+    if request.if_none_match.contains_weak(tag):
+        return Response(status=304, headers=cacheHeaders(tag))
+    return None
@@ -65,6 +65,22 @@ class ActionAlreadyDone(HTTPException):
     pass
 
 
+class SyncTokenExpiredError(HTTPException):
+    pass
+
+
+class UploadOffsetError(HTTPException):
+    pass
+
+
+class UploadIncompleteError(HTTPException):
+    pass
+
+
+class OperatorOnlyError(HTTPException):
+    pass
+
+
 errors = {
     "InternalServerError": {
         "message": "Something went wrong",
@@ -121,5 +137,21 @@ errors = {
     "ActionAlreadyDone": {
         "message": "Already observed the action",
         "status": 403
+    },
+    "SyncTokenExpiredError": {
+        "message": "Sync token is too old, a full sync is required",
+        "status": 410
+    },
+    "UploadOffsetError": {
+        "message": "Chunk does not start where the upload stands, GET the upload for its offset",
+        "status": 409
+    },
+    "UploadIncompleteError": {
+        "message": "Upload is missing bytes or is already being completed",
+        "status": 409
+    },
+    "OperatorOnlyError": {
+        "message": "Only operators can see this",
+        "status": 403
     }
 }
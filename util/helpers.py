@@ -1,7 +1,12 @@
+import hashlib
 import urllib.parse as urlparse
 from datetime import datetime
 import random
 
+from flask import request
+
+from util.errors import SchemaValidationError
+
 
 def validateURL(url):
     """[Checking if string is ur]
@@ -27,3 +32,88 @@ def generateBoardColor():
     secure_random = random.SystemRandom()
     colors = ['#E0BBE4', '#957DAD', '#D291BC', '#FEC8D8', '#FFDFD3', '#EF4056', '#00CB77', '#1CB0A8']
     return secure_random.choice(colors)
+
+
+def fieldsArg(allowed, default=None):
+    """[Reads the sparse fieldset from `?fields=a,b`]
+
+    Arguments:
+        allowed {[tuple]} -- [Fields the endpoint may return]
+        default {[tuple]} -- [Fields returned without `?fields=`, all allowed fields by default]
+
+    Raises:
+        SchemaValidationError: [If an unknown field is requested]
+
+    Returns:
+        [tuple] -- [Requested fields in request order, or the default fields]
+    """
+    requested = request.args.get('fields')
+    if not requested:
+        return default or allowed
+    fields = tuple(dict.fromkeys(field.strip() for field in requested.split(',') if field.strip()))
+    if not fields or any(field not in allowed for field in fields):
+        raise SchemaValidationError
+    return fields
+
+
+# Stored by Item.save for items without tags until tags became a list
+LEGACY_DEFAULT_TAG = "Ba"
+
+
+def splitTags(tags):
+    """[Normalises tags given as a list or as one comma separated string, the way bookmark exports carry them]
+
+    Arguments:
+        tags {[list|string]} -- [Raw tags, None for no tags]
+
+    Returns:
+        [list] -- [Distinct non empty tags in their original order]
+    """
+    if tags is None:
+        return []
+    if isinstance(tags, str):
+        tags = tags.split(',')
+    tags = (str(tag).strip() for tag in tags)
+    return list(dict.fromkeys(tag for tag in tags if tag and tag != LEGACY_DEFAULT_TAG))
+
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+# Query parameters only ever added for click tracking, dropped from canonical URLs
+TRACKING_PARAMS = {'fbclid', 'gclid', 'dclid', 'gbraid', 'wbraid', 'msclkid', 'yclid', 'igshid', 'mc_cid', 'mc_eid',
+                   '_ga', '_gl', '_hsenc', '_hsmi', 'mkt_tok', 'ref_src'}
+
+
+def canonicalURL(url):
+    """[Canonical form of a URL, equal for every spelling of the same bookmark]
+
+    Lowercases the scheme and host, drops default ports, trailing slashes,
+    tracking parameters and plain fragments, and sorts the query. Fragments
+    holding a client side route (#!/..., #/...) are kept.
+
+    Arguments:
+        url {[string]} -- [URL as sent by a client or found in an import]
+
+    Returns:
+        [string]
+    """
+    parts = urlparse.urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').rstrip('.')
+    if ':' in host:
+        host = '[%s]' % host
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host if port is None or DEFAULT_PORTS.get(scheme) == port else '%s:%d' % (host, port)
+    if parts.username is not None:
+        netloc = '%s@%s' % (parts.netloc.rsplit('@', 1)[0], netloc)
+    query = sorted((key, value) for key, value in urlparse.parse_qsl(parts.query, keep_blank_values=True)
+                   if not key.lower().startswith('utm_') and key.lower() not in TRACKING_PARAMS)
+    fragment = parts.fragment if parts.fragment.startswith(('!', '/')) else ''
+    return urlparse.urlunsplit((scheme, netloc, parts.path.rstrip('/'), urlparse.urlencode(query), fragment))
+
+
+def urlHash(canonical):
+    """[Signed 64 bit hash of a canonical URL, stored as a BSON long and unique per user]"""
+    return int.from_bytes(hashlib.blake2b(canonical.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
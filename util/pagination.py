@@ -0,0 +1,213 @@
+import base64
+import calendar
+import datetime
+from urllib.parse import urlencode
+
+from bson import ObjectId, SON
+from bson.errors import InvalidId
+from flask import request
+
+from util.errors import SchemaValidationError
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Newest first, `_id` breaks ties between documents created in the same millisecond
+PAGE_SORT = [('created_at', -1), ('_id', -1)]
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def encodeCursor(created_at, object_id):
+    """[Builds an opaque cursor pointing just after the given document]
+
+    Arguments:
+        created_at {[datetime]} -- [created_at of the last document on the page]
+        object_id {[ObjectId]} -- [_id of the last document on the page]
+
+    Returns:
+        [string] -- [URL safe cursor]
+    """
+    millis = calendar.timegm(created_at.utctimetuple()) * 1000 + created_at.microsecond // 1000
+    raw = '%d:%s' % (millis, object_id)
+    return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii').rstrip('=')
+
+
+def decodeCursor(cursor):
+    """[Reverses encodeCursor]
+
+    Arguments:
+        cursor {[string]} -- [Cursor as handed out in `next`]
+
+    Raises:
+        SchemaValidationError: [If the cursor was tampered with]
+
+    Returns:
+        [tuple] -- [(created_at, ObjectId)]
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        millis, object_id = base64.urlsafe_b64decode(padded.encode('ascii')).decode('ascii').split(':')
+        return _EPOCH + datetime.timedelta(milliseconds=int(millis)), ObjectId(object_id)
+    except (ValueError, TypeError, InvalidId, UnicodeError):
+        raise SchemaValidationError
+
+
+def encodeScoreCursor(score, object_id):
+    """[Cursor for results ordered by relevance, pointing just after the given document]"""
+    raw = '%r:%s' % (score, object_id)
+    return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii').rstrip('=')
+
+
+def decodeScoreCursor(cursor):
+    """[Reverses encodeScoreCursor]
+
+    Raises:
+        SchemaValidationError: [If the cursor was tampered with]
+
+    Returns:
+        [tuple] -- [(score, ObjectId)]
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        score, object_id = base64.urlsafe_b64decode(padded.encode('ascii')).decode('ascii').split(':')
+        return float(score), ObjectId(object_id)
+    except (ValueError, TypeError, InvalidId, UnicodeError):
+        raise SchemaValidationError
+
+
+def pageArgs(decode=decodeCursor):
+    """[Reads `limit` and `after` from the query string]
+
+    Arguments:
+        decode {[function]} -- [Cursor decoder matching the order of the endpoint]
+
+    Raises:
+        SchemaValidationError: [If limit is not a positive integer]
+
+    Returns:
+        [tuple] -- [(limit, after) where after is None or a decoded cursor]
+    """
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise SchemaValidationError
+    if limit < 1:
+        raise SchemaValidationError
+    limit = min(limit, MAX_PAGE_SIZE)
+    after = request.args.get('after')
+    return limit, decode(after) if after else None
+
+
+def keysetFilter(after):
+    """[Raw filter selecting the documents that sort after the cursor in PAGE_SORT]
+
+    Arguments:
+        after {[tuple]} -- [Decoded cursor or None]
+
+    Returns:
+        [dict] -- [Mongo filter, empty for the first page]
+    """
+    if after is None:
+        return {}
+    created_at, object_id = after
+    return {'$or': [
+        {'created_at': {'$lt': created_at}},
+        {'created_at': created_at, '_id': {'$lt': object_id}},
+    ]}
+
+
+def pageCursor(collection, query, limit, after, batch_size, projection=None):
+    """[Opens a raw cursor over one page without reading the page up front]
+
+    The boundary of the page is located first with a projection of the sort
+    keys only, so the next cursor is known before the body starts streaming.
+    The page itself is then bounded by that key rather than by a count, so
+    documents inserted in between can not shift a row past the boundary.
+
+    Arguments:
+        collection {[Collection]} -- [pymongo collection]
+        query {[dict]} -- [Raw filter]
+        limit {[int]} -- [Page size]
+        after {[tuple]} -- [Decoded cursor or None]
+        batch_size {[int]} -- [Documents per getMore]
+        projection {[dict]} -- [Fields to return, all when None]
+
+    Returns:
+        [tuple] -- [(pymongo cursor, next cursor or None)]
+    """
+    if after is not None:
+        query = {'$and': [query, keysetFilter(after)]}
+    boundary = list(collection.find(query, {'created_at': 1}).sort(PAGE_SORT).skip(limit - 1).limit(2))
+    if len(boundary) < 2:
+        return collection.find(query, projection).sort(PAGE_SORT).batch_size(batch_size), None
+    created_at, object_id = boundary[0]['created_at'], boundary[0]['_id']
+    until = {'$or': [
+        {'created_at': {'$gt': created_at}},
+        {'created_at': created_at, '_id': {'$gte': object_id}},
+    ]}
+    cursor = collection.find({'$and': [query, until]}, projection).sort(PAGE_SORT).batch_size(batch_size)
+    return cursor, encodeCursor(created_at, object_id)
+
+
+def pageAggregate(collection, query, limit, after, projection, stages=()):
+    """[Fetches one page through an aggregation in a single round trip]
+
+    The page is cut on the indexed sort keys before `stages` run, so any
+    $lookup in them only touches the documents on the page.
+
+    Arguments:
+        collection {[Collection]} -- [pymongo collection]
+        query {[dict]} -- [Raw filter]
+        limit {[int]} -- [Page size]
+        after {[tuple]} -- [Decoded cursor or None]
+        projection {[dict]} -- [Stored fields to keep]
+        stages {[list]} -- [Stages applied to the page]
+
+    Returns:
+        [tuple] -- [(documents, next cursor or None)]
+    """
+    if after is not None:
+        query = {'$and': [query, keysetFilter(after)]}
+    pipeline = [
+        {'$match': query},
+        {'$sort': SON(PAGE_SORT)},
+        {'$limit': limit + 1},
+        {'$project': dict(projection, _cursor='$created_at')},
+    ]
+    documents = list(collection.aggregate(pipeline + list(stages)))
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = encodeCursor(documents[-1]['_cursor'], documents[-1]['_id'])
+    for document in documents:
+        del document['_cursor']
+    return documents, next_cursor
+
+
+def linkHeader(next_cursor):
+    """[RFC 8288 Link header pointing at the next page of the current request]
+
+    Arguments:
+        next_cursor {[string]} -- [Cursor of the next page]
+
+    Returns:
+        [string] -- [Header value]
+    """
+    args = request.args.to_dict()
+    args['after'] = next_cursor
+    return '<%s?%s>; rel="next"' % (request.base_url, urlencode(args))
+
+
+def pageHeaders(next_cursor):
+    """[Extra response headers for a page]
+
+    Arguments:
+        next_cursor {[string]} -- [Cursor of the next page or None]
+
+    Returns:
+        [dict]
+    """
+    if next_cursor is None:
+        return {}
+    return {'Link': linkHeader(next_cursor)}
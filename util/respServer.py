@@ -0,0 +1,172 @@
+import logging
+import socketserver
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class _Store:
+    def __init__(self):
+        self.values = {}
+        self.expires = {}
+        self.lock = threading.Lock()
+
+    def live(self, key):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.values.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.values
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        while True:
+            try:
+                command = self._command()
+            except (ConnectionError, ValueError):
+                return
+            if command is None:
+                return
+            name = command[0].upper()
+            handler = getattr(self, '_cmd_' + name.decode('ascii', 'replace'), None)
+            if handler is None:
+                self._error("ERR unknown command '%s'" % name.decode('ascii', 'replace'))
+            else:
+                try:
+                    with self.server.store.lock:
+                        handler(*command[1:])
+                except TypeError:
+                    self._error("ERR wrong number of arguments for '%s'" % name.decode('ascii', 'replace'))
+            if name == b'QUIT':
+                return
+
+    def _command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.split()
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def _simple(self, text):
+        self.wfile.write(b'+%s\r\n' % text)
+
+    def _error(self, text):
+        self.wfile.write(b'-%s\r\n' % text.encode('utf-8'))
+
+    def _integer(self, value):
+        self.wfile.write(b':%d\r\n' % value)
+
+    def _bulk(self, value):
+        if value is None:
+            self.wfile.write(b'$-1\r\n')
+        else:
+            self.wfile.write(b'$%d\r\n%s\r\n' % (len(value), value))
+
+    def _cmd_PING(self, *args):
+        if args:
+            self._bulk(args[0])
+        else:
+            self._simple(b'PONG')
+
+    def _cmd_QUIT(self):
+        self._simple(b'OK')
+
+    def _cmd_AUTH(self, *args):
+        self._simple(b'OK')
+
+    def _cmd_SELECT(self, db):
+        self._simple(b'OK')
+
+    def _cmd_FLUSHDB(self, *args):
+        self.server.store.values.clear()
+        self.server.store.expires.clear()
+        self._simple(b'OK')
+
+    def _cmd_GET(self, key):
+        store = self.server.store
+        self._bulk(store.values[key] if store.live(key) else None)
+
+    def _cmd_SET(self, key, value, *options):
+        store = self.server.store
+        store.values[key] = value
+        store.expires.pop(key, None)
+        options = [option.upper() for option in options]
+        for unit, scale in ((b'EX', 1.0), (b'PX', 0.001)):
+            if unit in options:
+                store.expires[key] = time.monotonic() + int(options[options.index(unit) + 1]) * scale
+        self._simple(b'OK')
+
+    def _cmd_DEL(self, *keys):
+        store = self.server.store
+        deleted = 0
+        for key in keys:
+            if store.live(key):
+                deleted += 1
+                del store.values[key]
+                store.expires.pop(key, None)
+        self._integer(deleted)
+
+    def _cmd_EXISTS(self, *keys):
+        self._integer(sum(1 for key in keys if self.server.store.live(key)))
+
+    def _cmd_INCR(self, key):
+        store = self.server.store
+        try:
+            value = int(store.values[key]) + 1 if store.live(key) else 1
+        except ValueError:
+            self._error("ERR value is not an integer or out of range")
+            return
+        store.values[key] = b'%d' % value
+        self._integer(value)
+
+    def _cmd_EXPIRE(self, key, seconds):
+        store = self.server.store
+        if not store.live(key):
+            self._integer(0)
+            return
+        store.expires[key] = time.monotonic() + int(seconds)
+        self._integer(1)
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    """[In-process stand-in for a Redis server, enough of RESP2 for the shared cache tier]
+
+    Meant for local development and tests of RespBackend, not for production:
+    everything lives in one dict and nothing is persisted.
+
+        server = RespServer().start()
+        backend = RespBackend(*server.server_address)
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__((host, port), _Handler)
+        self.store = _Store()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='resp-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    server = RespServer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 6379)
+    logger.info("Serving RESP on %s:%d", *server.server_address)
+    server.serve_forever()
@@ -1,7 +1,14 @@
 from resources.user import SignupApi, LoginApi, TokenApi, LogoutApi, LogoutRefreshAPI
-from resources.home import BoardsApi, BoardApi
+from resources.home import BoardsApi, BoardApi, BoardMergeApi
 from resources.boardItems import ByBoardApi
-from resources.board import ItemsApi, ItemApi, UploadURLs
+from resources.board import ItemsApi, ItemsBatchApi, ItemsBulkApi, ItemApi, UploadURLs
+from resources.sync import SyncApi
+from resources.cache import CacheStatsApi
+from resources.search import SearchApi
+from resources.autocomplete import AutocompleteApi
+from resources.tags import TagsApi
+from resources.jobs import JobApi
+from resources.uploads import UploadsApi, UploadApi, UploadCompleteApi
 
 
 def initialize_routes(api):
@@ -12,12 +19,29 @@ def initialize_routes(api):
     api.add_resource(LogoutRefreshAPI, '/api/auth/revoke')
 
     api.add_resource(ItemsApi, '/api/items')
+    api.add_resource(ItemsBatchApi, '/api/items/batch')
+    api.add_resource(ItemsBulkApi, '/api/items/bulk')
     api.add_resource(ItemApi, '/api/item/<id>')
 
     api.add_resource(BoardsApi, '/api/boards')
     api.add_resource(BoardApi, '/api/board/<id>')
+    api.add_resource(BoardMergeApi, '/api/board/<id>/merge')
 
     # Get items by board slug
     api.add_resource(ByBoardApi, '/api/by-board/<id>')
 
     api.add_resource(UploadURLs, '/api/UploadURLs')
+    api.add_resource(JobApi, '/api/jobs/<id>')
+    # Resumable uploads, PUT byte ranges then POST complete
+    api.add_resource(UploadsApi, '/api/uploads')
+    api.add_resource(UploadApi, '/api/uploads/<id>')
+    api.add_resource(UploadCompleteApi, '/api/uploads/<id>/complete')
+
+    api.add_resource(SearchApi, '/api/search')
+    api.add_resource(AutocompleteApi, '/api/autocomplete')
+    api.add_resource(TagsApi, '/api/tags')
+
+    # Changes since a sync token
+    api.add_resource(SyncApi, '/api/sync')
+
+    api.add_resource(CacheStatsApi, '/api/cache/stats')
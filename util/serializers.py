@@ -0,0 +1,70 @@
+import datetime
+import json
+
+from bson import ObjectId
+from bson.json_util import default as bson_default
+
+# Documents pulled from Mongo per getMore, and documents joined into one chunk written to the socket
+STREAM_BATCH_SIZE = 200
+STREAM_CHUNK_SIZE = 50
+
+
+def _default(value):
+    # Same relaxed extended JSON shapes bson.json_util produces, without its recursive pre-walk of every document
+    if isinstance(value, ObjectId):
+        return {'$oid': str(value)}
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        if value.year < 1970:
+            return bson_default(value)
+        millis = value.microsecond // 1000
+        return {'$date': '%04d-%02d-%02dT%02d:%02d:%02d%sZ' % (
+            value.year, value.month, value.day, value.hour, value.minute, value.second,
+            '.%03d' % millis if millis else '')}
+    return bson_default(value)
+
+
+_encoder = json.JSONEncoder(default=_default)
+
+
+def encode(document):
+    """[Serializes a raw Mongo document or envelope to JSON]
+
+    Arguments:
+        document {[dict]} -- [Anything json.dumps accepts plus ObjectId, datetime and other BSON types]
+
+    Returns:
+        [string]
+    """
+    return _encoder.encode(document)
+
+
+def streamEnvelope(documents, message, **fields):
+    """[Serializes the standard list envelope incrementally]
+
+    The `data` array is written first, so the count and any other trailing
+    fields are only emitted once the cursor is exhausted.
+
+    Arguments:
+        documents {[iterable]} -- [Raw documents, usually a pymongo cursor]
+        message {[string]} -- [Envelope message]
+        fields {[dict]} -- [Extra envelope keys such as `next`]
+
+    Returns:
+        [generator] -- [Chunks of the JSON body]
+    """
+    yield '{"data": ['
+    count = 0
+    chunk = []
+    for document in documents:
+        chunk.append(encode(document))
+        count += 1
+        if len(chunk) == STREAM_CHUNK_SIZE:
+            yield (', ' if count > len(chunk) else '') + ', '.join(chunk)
+            chunk = []
+    if chunk:
+        yield (', ' if count > len(chunk) else '') + ', '.join(chunk)
+    trailer = {'message': message, 'count': count}
+    trailer.update(fields)
+    yield '], ' + json.dumps(trailer)[1:]
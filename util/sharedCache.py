@@ -0,0 +1,327 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from urllib.parse import urlparse, parse_qs
+
+DEFAULT_TTL = 300
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+
+
+class CacheBackend(ABC):
+    """[Byte store shared by every worker process, misses and outages both read as None]"""
+
+    @abstractmethod
+    def get(self, key):
+        """[Value of key, None when missing or expired]"""
+
+    @abstractmethod
+    def set(self, key, value, ttl):
+        """[Stores value under key for ttl seconds]"""
+
+    @abstractmethod
+    def delete(self, *keys):
+        """[Drops keys, missing ones are ignored]"""
+
+
+class NullBackend(CacheBackend):
+    """[Disabled tier, every read is a miss]"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+
+class MmapBackend(CacheBackend):
+    """[Set associative hash table in a memory mapped file, for workers on a single host]
+
+    The segment is split into a region of small slots (slug and identity
+    lookups) and a region of large slots (serialized responses). Each key
+    hashes to one set of WAYS slots per region; a write replaces the expired
+    or soonest expiring slot of its set. Sets are guarded with fcntl record
+    locks, so readers and writers in different processes never see a torn
+    slot. Values larger than a large slot are simply not cached.
+    """
+
+    WAYS = 4
+    SMALL_SLOT = 512
+    LARGE_SLOT = 64 * 1024
+    # Share of the segment given to small slots
+    SMALL_SHARE = 0.125
+    # key hash, expiry as unix time, value length
+    _SLOT_HEADER = struct.Struct('<QdI')
+
+    def __init__(self, path, size=DEFAULT_SEGMENT_SIZE):
+        self.path = path
+        small_bytes = max(int(size * self.SMALL_SHARE), self.SMALL_SLOT * self.WAYS)
+        # Smaller segments are grown to hold at least one set per region
+        self.size = max(size, small_bytes + self.LARGE_SLOT * self.WAYS)
+        self._regions = (
+            (0, self.SMALL_SLOT, small_bytes // (self.SMALL_SLOT * self.WAYS)),
+            (small_bytes, self.LARGE_SLOT, (self.size - small_bytes) // (self.LARGE_SLOT * self.WAYS)),
+        )
+        self._pid = None
+        self._fd = None
+        self._map = None
+        # fcntl record locks only exclude other processes, threads of this one queue here
+        self._lock = threading.Lock()
+
+    def _segment(self):
+        # Opened lazily and per process, the app is imported before the WSGI server forks its workers
+        if self._pid != os.getpid():
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            if os.fstat(fd).st_size < self.size:
+                os.ftruncate(fd, self.size)
+            self._fd, self._map, self._pid = fd, mmap.mmap(fd, self.size), os.getpid()
+        return self._fd, self._map
+
+    def _set_of(self, region, key_hash):
+        base, slot_size, sets = region
+        start = base + (key_hash % sets) * slot_size * self.WAYS
+        return start, slot_size
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._set(key, value, ttl)
+
+    def delete(self, *keys):
+        with self._lock:
+            self._delete(keys)
+
+    def _get(self, key):
+        key_hash = _hash(key)
+        fd, segment = self._segment()
+        now = time.time()
+        for region in self._regions:
+            start, slot_size = self._set_of(region, key_hash)
+            fcntl.lockf(fd, fcntl.LOCK_SH, slot_size * self.WAYS, start)
+            try:
+                for offset in range(start, start + slot_size * self.WAYS, slot_size):
+                    slot_hash, expires, length = self._SLOT_HEADER.unpack_from(segment, offset)
+                    if slot_hash == key_hash and expires > now:
+                        value_start = offset + self._SLOT_HEADER.size
+                        return segment[value_start:value_start + length]
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, slot_size * self.WAYS, start)
+        return None
+
+    def _set(self, key, value, ttl):
+        # An older value goes even when the new one is too large to cache, it would be stale
+        self._delete((key,))
+        region = self._regions[0] if len(value) <= self.SMALL_SLOT - self._SLOT_HEADER.size else self._regions[1]
+        if len(value) > region[1] - self._SLOT_HEADER.size:
+            return
+        key_hash = _hash(key)
+        fd, segment = self._segment()
+        start, slot_size = self._set_of(region, key_hash)
+        fcntl.lockf(fd, fcntl.LOCK_EX, slot_size * self.WAYS, start)
+        try:
+            victim, soonest = start, None
+            for offset in range(start, start + slot_size * self.WAYS, slot_size):
+                slot_hash, expires, _ = self._SLOT_HEADER.unpack_from(segment, offset)
+                if slot_hash == key_hash:
+                    victim = offset
+                    break
+                if soonest is None or expires < soonest:
+                    victim, soonest = offset, expires
+            self._SLOT_HEADER.pack_into(segment, victim, key_hash, time.time() + ttl, len(value))
+            value_start = victim + self._SLOT_HEADER.size
+            segment[value_start:value_start + len(value)] = value
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN, slot_size * self.WAYS, start)
+
+    def _delete(self, keys):
+        fd, segment = self._segment()
+        for key in keys:
+            key_hash = _hash(key)
+            for region in self._regions:
+                start, slot_size = self._set_of(region, key_hash)
+                fcntl.lockf(fd, fcntl.LOCK_EX, slot_size * self.WAYS, start)
+                try:
+                    for offset in range(start, start + slot_size * self.WAYS, slot_size):
+                        if self._SLOT_HEADER.unpack_from(segment, offset)[0] == key_hash:
+                            self._SLOT_HEADER.pack_into(segment, offset, 0, 0.0, 0)
+                finally:
+                    fcntl.lockf(fd, fcntl.LOCK_UN, slot_size * self.WAYS, start)
+
+
+class RespError(Exception):
+    pass
+
+
+class RespBackend(CacheBackend):
+    """[Client for servers speaking the Redis protocol (RESP2)]
+
+    One connection per process, commands from threads of the same process
+    are serialized on it. A broken connection is dropped and reopened on the
+    next command.
+    """
+
+    def __init__(self, host='localhost', port=6379, db=0, password=None, timeout=0.25):
+        self.address = (host, port)
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pid = None
+        self._sock = None
+        self._reader = None
+
+    def _connect(self):
+        sock = socket.create_connection(self.address, self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock, self._reader, self._pid = sock, sock.makefile('rb'), os.getpid()
+        if self.password:
+            self._call('AUTH', self.password)
+        if self.db:
+            self._call('SELECT', self.db)
+
+    def _close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = self._reader = None
+
+    def _call(self, *args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        self._sock.sendall(b''.join(parts))
+        return self._reply()
+
+    def _reply(self):
+        line = self._reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError("Connection closed by cache server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest
+        if kind == b'-':
+            raise RespError(rest.decode('utf-8', 'replace'))
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            count = int(rest)
+            return None if count < 0 else [self._reply() for _ in range(count)]
+        raise ConnectionError("Unexpected reply from cache server")
+
+    def execute(self, *args):
+        with self._lock:
+            if self._sock is None or self._pid != os.getpid():
+                self._connect()
+            try:
+                return self._call(*args)
+            except (OSError, ConnectionError):
+                self._close()
+                raise
+
+    def get(self, key):
+        return self.execute('GET', key)
+
+    def set(self, key, value, ttl):
+        self.execute('SET', key, value, 'EX', max(1, int(ttl)))
+
+    def delete(self, *keys):
+        if keys:
+            self.execute('DEL', *keys)
+
+
+def _hash(key):
+    # 0 marks an empty slot in MmapBackend
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+
+
+def backendFromURL(url):
+    """[Builds a backend from SHARED_CACHE_URL]
+
+    mmap:///dev/shm/shelvit.cache?size=67108864 -- [Segment file shared by the workers of one host]
+    redis://:password@host:6379/0 -- [Any Redis protocol server]
+    none -- [No shared tier]
+    """
+    if not url or url == 'none':
+        return NullBackend()
+    parsed = urlparse(url)
+    if parsed.scheme == 'mmap':
+        size = int(parse_qs(parsed.query).get('size', [DEFAULT_SEGMENT_SIZE])[0])
+        return MmapBackend(parsed.path, size)
+    if parsed.scheme == 'redis':
+        db = int(parsed.path.lstrip('/') or 0)
+        return RespBackend(parsed.hostname or 'localhost', parsed.port or 6379, db, parsed.password)
+    raise ValueError("Unsupported SHARED_CACHE_URL %r" % url)
+
+
+def defaultURL():
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return 'mmap://%s' % os.path.join(directory, 'shelvit.cache')
+
+
+class SharedCache:
+    """[Shared cache tier used by resources/*, swallowing backend failures as misses]"""
+
+    def __init__(self, backend=None, ttl=DEFAULT_TTL):
+        self.backend = backend or NullBackend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def get(self, key):
+        try:
+            value = self.backend.get(key)
+        except (OSError, ConnectionError, RespError):
+            self.errors += 1
+            return None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        try:
+            self.backend.set(key, value, ttl or self.ttl)
+        except (OSError, ConnectionError, RespError):
+            self.errors += 1
+
+    def delete(self, *keys):
+        try:
+            self.backend.delete(*keys)
+        except (OSError, ConnectionError, RespError):
+            self.errors += 1
+
+    def stats(self):
+        return {'backend': type(self.backend).__name__, 'ttl': self.ttl, 'hits': self.hits, 'misses': self.misses,
+                'errors': self.errors}
+
+
+sharedCache = SharedCache()
+
+
+def initialize_shared_cache(app):
+    sharedCache.backend = backendFromURL(app.config.get('SHARED_CACHE_URL', defaultURL()))
+    sharedCache.ttl = app.config.get('SHARED_CACHE_TTL', DEFAULT_TTL)
@@ -0,0 +1,411 @@
+import fcntl
+import heapq
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+from collections import Counter, OrderedDict
+from urllib.parse import urlparse
+
+from bson import ObjectId
+
+# Share of the query trigrams a title has to contain to be a candidate at all
+MIN_SIMILARITY = 0.3
+# Journal size after which the next query folds it into a fresh segment in the background
+MERGE_THRESHOLD = 1024 * 1024
+# Users whose segments stay mapped in one process
+MAX_LOADED_USERS = 256
+
+_TOKEN = re.compile(r'[^\W_]+')
+_URL_NOISE = {'http', 'https', 'www', 'com', 'org', 'net', 'html', 'htm', 'php', 'index'}
+
+_MAGIC = b'SHVTRI01'
+_HEADER = struct.Struct('<8sIII')
+_DOC = struct.Struct('<12sH')
+_TERM = struct.Struct('<III')
+_RECORD = struct.Struct('<c12sI')
+
+
+def itemText(source, source_url, tags):
+    """[Searchable text of an item: its title, the words of its URL without scheme noise, and its tags]"""
+    parts = [source or '']
+    if source_url:
+        parsed = urlparse(source_url)
+        parts.append(' '.join(token for token in _TOKEN.findall(('%s %s' % (parsed.netloc, parsed.path)).lower())
+                              if token not in _URL_NOISE))
+    if isinstance(tags, (list, tuple)):
+        parts.extend(tags)
+    elif tags:
+        parts.append(tags)
+    return ' '.join(parts)
+
+
+def trigrams(text):
+    """[Set of hashed trigrams of every word, padded so prefixes and suffixes weigh in]"""
+    codes = set()
+    for token in _TOKEN.findall(text.lower()):
+        padded = ' %s ' % token
+        for start in range(len(padded) - 2):
+            codes.add(zlib.crc32(padded[start:start + 3].encode('utf-8')))
+    return codes
+
+
+class _Segment:
+    """[Immutable, memory mapped index file written by _writeSegment]"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.docs, terms, _ = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC:
+            raise ValueError("Not a trigram segment: %s" % path)
+        self._docs_at = _HEADER.size
+        terms_at = _align(self._docs_at + self.docs * _DOC.size)
+        postings_at = terms_at + terms * _TERM.size
+        view = memoryview(self._map)
+        self._terms = view[terms_at:postings_at].cast('I')
+        self._postings = view[postings_at:].cast('I')
+        self._term_count = terms
+
+    def postings(self, code):
+        low, high = 0, self._term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._terms[middle * 3] < code:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self._term_count or self._terms[low * 3] != code:
+            return ()
+        start = self._terms[low * 3 + 1]
+        return self._postings[start:start + self._terms[low * 3 + 2]]
+
+    def doc(self, number):
+        return _DOC.unpack_from(self._map, self._docs_at + number * _DOC.size)
+
+
+def _records(data):
+    """[Yields (op, oid bytes, text, end offset) of every complete journal record in data]"""
+    position = 0
+    while position + _RECORD.size <= len(data):
+        op, oid, length = _RECORD.unpack_from(data, position)
+        end = position + _RECORD.size + length
+        if end > len(data):
+            # Another process is half way through its append
+            return
+        yield op, oid, data[position + _RECORD.size:end].decode('utf-8'), end
+        position = end
+
+
+def _align(offset):
+    return (offset + 3) & ~3
+
+
+def _writeSegment(path, documents):
+    """[Writes {oid bytes: trigram codes} as a segment file, atomically replacing path]"""
+    docs = list(documents.items())
+    postings = {}
+    for number, (_, codes) in enumerate(docs):
+        for code in codes:
+            postings.setdefault(code, []).append(number)
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as handle:
+        handle.write(_HEADER.pack(_MAGIC, len(docs), len(postings), 0))
+        handle.write(b''.join(_DOC.pack(oid, min(len(codes), 0xFFFF)) for oid, codes in docs))
+        handle.write(b'\0' * (_align(handle.tell()) - handle.tell()))
+        offset = 0
+        terms = []
+        for code in sorted(postings):
+            terms.append(_TERM.pack(code, offset, len(postings[code])))
+            offset += len(postings[code])
+        handle.write(b''.join(terms))
+        for code in sorted(postings):
+            handle.write(struct.pack('<%dI' % len(postings[code]), *postings[code]))
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temporary, path)
+
+
+class _Lock:
+    """[flock on one of the user's lock files, `lock` is shared for journal appends and exclusive for
+    segment switches, `merge` is held by the one process folding the journal]
+
+    With LOCK_NB in mode the lock is only tried, `held` tells whether it was taken.
+    """
+
+    def __init__(self, directory, mode, name='lock'):
+        self.path = os.path.join(directory, name)
+        self.mode = mode
+        self.held = False
+
+    def __enter__(self):
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(self.fd, self.mode)
+            self.held = True
+        except BlockingIOError:
+            pass
+        return self
+
+    def __exit__(self, *exc):
+        if self.held:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+
+
+class UserIndex:
+    """[Trigram index of one user's items: one segment file plus an append-only journal]
+
+    Every process appends item changes to the journal and replays what other
+    processes appended before answering a query. Compaction folds the journal
+    into a new segment and switches the manifest under an exclusive lock, so
+    readers keep using the segment they mapped until they notice the switch.
+    """
+
+    def __init__(self, directory, user_id):
+        self.directory = directory
+        self.user_id = user_id
+        self._lock = threading.Lock()
+        self._manifest_stamp = None
+        self._merging = False
+        self._reset(None, None)
+
+    def _reset(self, segment, journal):
+        self.segment = segment
+        self.journal = journal
+        self.offset = 0
+        self.masked = set()
+        self.delta_docs = {}
+        self.delta_terms = {}
+
+    def _manifest(self):
+        try:
+            with open(os.path.join(self.directory, 'MANIFEST')) as handle:
+                return json.load(handle)
+        except FileNotFoundError:
+            return None
+
+    def _writeManifest(self, manifest):
+        path = os.path.join(self.directory, 'MANIFEST')
+        with open(path + '.tmp', 'w') as handle:
+            json.dump(manifest, handle)
+        os.replace(path + '.tmp', path)
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.directory, 'MANIFEST'))
+
+    def build(self, documents):
+        """[Creates the index from (item id, text) pairs, blocking writers until the manifest exists]"""
+        os.makedirs(self.directory, exist_ok=True)
+        with _Lock(self.directory, fcntl.LOCK_EX):
+            if self.exists():
+                return
+            generation = 1
+            segment = 'segment-%d' % generation
+            _writeSegment(os.path.join(self.directory, segment),
+                          {ObjectId(item_id).binary: trigrams(text) for item_id, text in documents()})
+            open(os.path.join(self.directory, 'journal-%d' % generation), 'ab').close()
+            self._writeManifest({'generation': generation, 'segment': segment, 'journal': 'journal-%d' % generation})
+
+    def append(self, records):
+        """[Journals (op, item id, text) records, a no-op until the index has been built]"""
+        if not os.path.isdir(self.directory):
+            return
+        payload = b''.join(_RECORD.pack(op, ObjectId(item_id).binary, len(text.encode('utf-8'))) +
+                           text.encode('utf-8') for op, item_id, text in records)
+        with _Lock(self.directory, fcntl.LOCK_SH):
+            manifest = self._manifest()
+            if manifest is None:
+                return
+            fd = os.open(os.path.join(self.directory, manifest['journal']), os.O_WRONLY | os.O_APPEND)
+            try:
+                os.write(fd, payload)
+            finally:
+                os.close(fd)
+
+    def refresh(self):
+        """[Maps a new segment if one was switched in, then replays the journal tail]"""
+        try:
+            data = self._tail()
+        except FileNotFoundError:
+            # A merge in another process removed the files between reading the manifest and opening them
+            self._manifest_stamp = None
+            data = self._tail()
+        consumed = 0
+        for op, oid, text, consumed in _records(data):
+            self._apply(op, oid, text)
+        self.offset += consumed
+
+    def _tail(self):
+        stamp = os.stat(os.path.join(self.directory, 'MANIFEST')).st_mtime_ns
+        if stamp != self._manifest_stamp:
+            manifest = self._manifest()
+            self._reset(_Segment(os.path.join(self.directory, manifest['segment'])),
+                        os.path.join(self.directory, manifest['journal']))
+            self._manifest_stamp = stamp
+        with open(self.journal, 'rb') as handle:
+            handle.seek(self.offset)
+            return handle.read()
+
+    def _apply(self, op, oid, text):
+        self.masked.add(oid)
+        for code in self.delta_docs.pop(oid, ()):
+            self.delta_terms[code].discard(oid)
+        if op == b'A':
+            codes = trigrams(text)
+            self.delta_docs[oid] = codes
+            for code in codes:
+                self.delta_terms.setdefault(code, set()).add(oid)
+
+    def search(self, text, limit):
+        """[Most similar items to text]
+
+        Returns:
+            [list] -- [(ObjectId, score) pairs, best first, score being the Dice coefficient of the trigram sets]
+        """
+        codes = trigrams(text)
+        if not codes:
+            return []
+        with self._lock:
+            self.refresh()
+            base = Counter()
+            delta = Counter()
+            for code in codes:
+                if self.segment is not None:
+                    base.update(self.segment.postings(code))
+                delta.update(self.delta_terms.get(code, ()))
+            minimum = max(1, int(len(codes) * MIN_SIMILARITY))
+            scored = []
+            for number, shared in heapq.nlargest(limit * 4 + len(self.masked), base.items(), key=lambda pair: pair[1]):
+                if shared < minimum:
+                    break
+                oid, size = self.segment.doc(number)
+                if oid not in self.masked:
+                    scored.append((round(2.0 * shared / (len(codes) + size), 4), oid))
+            for oid, shared in delta.items():
+                if shared >= minimum:
+                    scored.append((round(2.0 * shared / (len(codes) + len(self.delta_docs[oid])), 4), oid))
+            journal_size = self.offset
+        if journal_size > MERGE_THRESHOLD:
+            self.mergeInBackground()
+        return [(ObjectId(oid), score) for score, oid in heapq.nlargest(limit, scored)]
+
+    def mergeInBackground(self):
+        with self._lock:
+            if self._merging:
+                return
+            self._merging = True
+        threading.Thread(target=self.merge, name='trigram-merge', daemon=True).start()
+
+    def merge(self):
+        """[Folds the journal into a new segment; writers are only blocked while the tail is carried over]
+
+        Only one process merges a user's index at a time, the others skip the merge while it runs.
+        """
+        try:
+            with _Lock(self.directory, fcntl.LOCK_EX | fcntl.LOCK_NB, 'merge') as lock:
+                if lock.held:
+                    self._merge()
+        finally:
+            self._merging = False
+
+    def _merge(self):
+        manifest = self._manifest()
+        journal = os.path.join(self.directory, manifest['journal'])
+        with open(journal, 'rb') as handle:
+            data = handle.read()
+        texts = {}
+        position = 0
+        for op, oid, text, end in _records(data):
+            texts[oid] = text if op == b'A' else None
+            position = end
+        documents = _segmentTrigrams(_Segment(os.path.join(self.directory, manifest['segment'])), set(texts))
+        for oid, text in texts.items():
+            if text is not None:
+                documents[oid] = trigrams(text)
+        generation = manifest['generation'] + 1
+        # Named after the process as well, a segment never overwrites one another process may have mapped
+        name = 'segment-%d.%d' % (generation, os.getpid())
+        _writeSegment(os.path.join(self.directory, name), documents)
+        with _Lock(self.directory, fcntl.LOCK_EX):
+            current = self._manifest()
+            if current is None or current['generation'] != manifest['generation']:
+                os.unlink(os.path.join(self.directory, name))
+                return
+            with open(journal, 'rb') as handle:
+                handle.seek(position)
+                tail = handle.read()
+            with open(os.path.join(self.directory, 'journal-%d' % generation), 'wb') as handle:
+                handle.write(tail)
+            self._writeManifest({'generation': generation, 'segment': name,
+                                 'journal': 'journal-%d' % generation})
+        # Processes that still map the old files keep reading them, unlinking only frees the name
+        os.unlink(os.path.join(self.directory, manifest['segment']))
+        os.unlink(journal)
+
+
+def _segmentTrigrams(segment, skipped):
+    """[Recovers {oid: trigram codes} of a segment by inverting its postings, skipping replaced items]"""
+    documents = {}
+    oids = [segment.doc(number)[0] for number in range(segment.docs)]
+    for index in range(segment._term_count):
+        code = segment._terms[index * 3]
+        for number in segment.postings(code):
+            oid = oids[number]
+            if oid not in skipped:
+                documents.setdefault(oid, set()).add(code)
+    return documents
+
+
+class TrigramIndex:
+    """[Per-user trigram indexes living under one directory]"""
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def user(self, user_id):
+        user_id = str(user_id)
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is None:
+                index = self._users[user_id] = UserIndex(os.path.join(self.directory, user_id), user_id)
+                if len(self._users) > MAX_LOADED_USERS:
+                    self._users.popitem(last=False)
+            self._users.move_to_end(user_id)
+            return index
+
+    def record(self, user_id, item_id, text):
+        """[Called from the Item save paths]"""
+        self.recordMany(user_id, [(b'A', item_id, text)])
+
+    def forget(self, user_id, item_id):
+        """[Called from the Item delete paths]"""
+        self.recordMany(user_id, [(b'D', item_id, '')])
+
+    def recordMany(self, user_id, records):
+        if self.directory is None or user_id is None:
+            return
+        try:
+            self.user(user_id).append(records)
+        except OSError as e:
+            # The index is an accelerator, a failed append must never fail the write it follows
+            print(e)
+
+    def search(self, user_id, text, limit, documents):
+        """[Ranked (ObjectId, score) pairs, building the user's index from documents() on first use]"""
+        index = self.user(user_id)
+        if not index.exists():
+            index.build(documents)
+        return index.search(text, limit)
+
+
+trigramIndex = TrigramIndex()
+
+
+def initialize_search(app):
+    trigramIndex.directory = app.config.get('TRIGRAM_INDEX_DIR', os.path.join(app.instance_path, 'trigram'))